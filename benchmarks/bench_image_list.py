@@ -0,0 +1,103 @@
+"""
+图片列表性能基准测试。
+
+用硬链接生成大量图片文件（只占一份磁盘空间），测量导入 10 万张到列表的耗时、
+随机滚动时每帧重绘的耗时（目标：p95 低于 16.7ms，即 60fps），以及批量删除的耗时。
+
+用法（在项目根目录）：
+    python benchmarks/bench_image_list.py
+    python benchmarks/bench_image_list.py --count 20000
+"""
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+import statistics
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.append(str(ROOT))
+
+FRAME_BUDGET_MS = 1000.0 / 60
+
+
+def make_files(folder: Path, count: int):
+    from PIL import Image
+    paths = []
+    for i in range(count):
+        sub = folder / f"d{i // 1000:03d}"
+        if i % 1000 == 0:
+            # 每个子文件夹一份源文件，避免单个文件的硬链接数超过文件系统上限
+            sub.mkdir()
+            src = sub / "source.jpg.bin"
+            Image.new("RGB", (320, 240), color=(90, 120, 200)).save(src, "JPEG")
+        p = sub / f"img_{i:06d}.jpg"
+        os.link(src, p)
+        paths.append(str(p))
+    return paths
+
+
+def main():
+    parser = argparse.ArgumentParser(description="图片列表性能基准测试")
+    parser.add_argument("--count", type=int, default=100_000, help="图片数量")
+    parser.add_argument("--frames", type=int, default=300, help="随机滚动的帧数")
+    args = parser.parse_args()
+
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ["PHOTO_WATERMARK_CACHE_DIR"] = str(Path(tmp) / "cache")
+        files_dir = Path(tmp) / "files"
+        files_dir.mkdir()
+        paths = make_files(files_dir, args.count)
+
+        from PyQt6.QtWidgets import QApplication
+        from ui.image_list import ImageList
+        from watermark.file_manager import FileManager
+
+        app = QApplication(sys.argv)
+        view = ImageList()
+        view.setCatalog(FileManager().catalog)
+        view.resize(300, 800)
+        view.show()
+        app.processEvents()
+
+        start = time.perf_counter()
+        for i in range(0, len(paths), 500):
+            view.add_images(paths[i:i + 500])
+        app.processEvents()
+        insert_s = time.perf_counter() - start
+
+        bar = view.verticalScrollBar()
+        rng = random.Random(0)
+        frames = []
+        for _ in range(args.frames):
+            bar.setValue(rng.randint(0, bar.maximum()))
+            t = time.perf_counter()
+            view.viewport().repaint()
+            frames.append((time.perf_counter() - t) * 1000)
+            app.processEvents()
+        frames.sort()
+        p50 = statistics.median(frames)
+        p95 = frames[int(0.95 * (len(frames) - 1))]
+
+        start = time.perf_counter()
+        view.remove_rows(range(0, view.count(), 2))
+        remove_s = time.perf_counter() - start
+        remaining = view.count()
+        view.thumbnail_loader.cancel_pending()
+        view.thumbnail_loader._pool.waitForDone()
+
+    print(f"insert {args.count} rows: {insert_s:.2f} s")
+    print(f"scroll repaint: p50 {p50:.2f} ms, p95 {p95:.2f} ms")
+    print(f"remove every other row: {remove_s:.3f} s ({remaining} rows left)")
+    if p95 > FRAME_BUDGET_MS:
+        print(f"[FAIL] 滚动重绘 p95 {p95:.2f}ms 超过 60fps 帧预算 {FRAME_BUDGET_MS:.1f}ms")
+        return 1
+    print("[OK] 滚动重绘在 60fps 帧预算以内")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,123 @@
+"""
+界面启动耗时基准测试。
+
+在独立子进程中启动主窗口，测量从进程开始到窗口显示（事件循环开始处理事件）
+以及到上一次会话恢复完成的耗时，并检查窗口显示时间是否超出预算。
+--slow-io 会给模板读取与图片水印解码人为加上延迟，模拟网络上的慢速用户目录：
+窗口显示时间不应随之变长。
+
+用法（在项目根目录）：
+    python benchmarks/bench_startup.py
+    python benchmarks/bench_startup.py --slow-io 1.0
+"""
+import time
+
+_PROCESS_START = time.perf_counter()
+
+import os
+import sys
+import json
+import shutil
+import argparse
+import tempfile
+import statistics
+import subprocess
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+LOGO_PATH = ROOT / "assets" / "logo.png"
+
+# 窗口显示的耗时预算（毫秒，含 Python 与 Qt 的导入）
+DEFAULT_BUDGET_MS = 1500.0
+
+
+def prepare_workdir(work_dir: Path):
+    """准备模板目录：复制仓库中的模板，并写入带图片水印的上一次会话"""
+    templates = work_dir / "templates"
+    templates.mkdir(parents=True, exist_ok=True)
+    for f in (ROOT / "templates").glob("*.json"):
+        if f.stem != "_last_session":
+            shutil.copy(f, templates / f.name)
+    session = {"text_content": "Startup", "image_path": str(LOGO_PATH), "image_scale": 20}
+    (templates / "_last_session.json").write_text(json.dumps(session), encoding="utf-8")
+
+
+def run_child(slow_io: float) -> dict:
+    """子进程：启动主窗口并记录各时间点"""
+    sys.path.append(str(ROOT))
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+    if slow_io > 0:
+        from watermark.config_manager import ConfigManager
+        from watermark.watermark_image import ImageWatermark
+
+        def delayed(fn):
+            def wrapper(*args, **kwargs):
+                time.sleep(slow_io)
+                return fn(*args, **kwargs)
+            return wrapper
+
+        ConfigManager.list_templates = delayed(ConfigManager.list_templates)
+        ConfigManager.load_template = delayed(ConfigManager.load_template)
+        ImageWatermark.__init__ = delayed(ImageWatermark.__init__)
+
+    from PyQt6.QtCore import QTimer
+    from PyQt6.QtWidgets import QApplication
+    from ui.main_window import MainWindow
+
+    app = QApplication(sys.argv)
+    window = MainWindow()
+    window.show()
+    times = {}
+
+    def on_shown():
+        times["window_shown_ms"] = (time.perf_counter() - _PROCESS_START) * 1000
+
+    def poll_restored():
+        if window._startup_done:
+            times["session_restored_ms"] = (time.perf_counter() - _PROCESS_START) * 1000
+            window.close()
+            app.quit()
+
+    QTimer.singleShot(0, on_shown)
+    poller = QTimer()
+    poller.timeout.connect(poll_restored)
+    poller.start(5)
+    app.exec()
+    return {k: round(v, 1) for k, v in times.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="界面启动耗时基准测试")
+    parser.add_argument("--runs", type=int, default=5, help="启动次数（取中位数）")
+    parser.add_argument("--budget-ms", type=float, default=DEFAULT_BUDGET_MS, help="窗口显示耗时预算（毫秒）")
+    parser.add_argument("--slow-io", type=float, default=0.0, help="给模板读取与水印解码附加的延迟（秒）")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(run_child(args.slow_io)))
+        return 0
+
+    samples = []
+    with tempfile.TemporaryDirectory() as tmp:
+        prepare_workdir(Path(tmp))
+        for _ in range(args.runs):
+            cmd = [sys.executable, str(Path(__file__).resolve()), "--child", "--slow-io", str(args.slow_io)]
+            out = subprocess.run(cmd, check=True, capture_output=True, text=True, cwd=tmp)
+            samples.append(json.loads(out.stdout.strip().splitlines()[-1]))
+
+    shown = statistics.median(s["window_shown_ms"] for s in samples)
+    restored = statistics.median(s["session_restored_ms"] for s in samples)
+    print(f"window shown     p50 {shown:8.1f} ms")
+    print(f"session restored p50 {restored:8.1f} ms")
+
+    if shown > args.budget_ms:
+        print(f"[FAIL] 窗口显示耗时 {shown:.1f}ms 超出预算 {args.budget_ms:.0f}ms")
+        return 1
+    print(f"[OK] 窗口显示耗时在预算 {args.budget_ms:.0f}ms 以内")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
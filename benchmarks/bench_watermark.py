@@ -0,0 +1,396 @@
+"""
+水印处理性能基准测试。
+
+生成确定性的合成图片集，测量各环节耗时（p50/p95）、吞吐量和峰值内存，
+结果写为 JSON，并与仓库中的基线 benchmarks/baseline.json 比较。
+
+用法（在项目根目录）：
+    python benchmarks/bench_watermark.py                 # 运行并与基线比较
+    python benchmarks/bench_watermark.py --quick         # 缩小规模，快速检查
+    python benchmarks/bench_watermark.py --update-baseline
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import tempfile
+import statistics
+import subprocess
+from pathlib import Path
+from typing import Callable, Dict, List
+
+# 添加项目根目录到 sys.path
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.append(str(ROOT))
+
+import PIL
+from PIL import Image, ImageDraw
+
+from watermark.watermark_text import TextWatermark
+from watermark.watermark_image import ImageWatermark
+from watermark.preview import PreviewManager
+from watermark.file_manager import FileManager
+from watermark.batch import BatchExporter
+
+BASELINE_PATH = Path(__file__).resolve().parent / "baseline.json"
+LOGO_PATH = ROOT / "assets" / "logo.png"
+
+# PRD 非功能需求：100 张 1920x1080 图片批量导出 ≤ 60 秒，内存 ≤ 500MB
+PRD_BATCH_COUNT = 100
+PRD_BATCH_SIZE = (1920, 1080)
+PRD_BATCH_SECONDS = 60.0
+PRD_PEAK_RSS_MB = 500.0
+
+SIZES = {"640x480": (640, 480), "1920x1080": (1920, 1080), "4000x3000": (4000, 3000)}
+MODES = ["RGB", "RGBA", "L"]
+
+BENCH_SETTINGS = {
+    "text_content": "Benchmark 水印",
+    "opacity": 180,
+    "color": [255, 255, 255],
+    "relative_font_size": 5,
+    "is_bold": True,
+    "is_italic": False,
+    "image_path": str(LOGO_PATH),
+    "image_scale": 30,
+    "position_name": "右下",
+    "wm_offset_relative": [0.0, 0.0],
+    "name_rule": "suffix",
+    "custom_str": "_wm",
+    "output_format": "JPEG",
+    "jpeg_quality": 90,
+    "scale_percent": 100,
+}
+
+
+# ------------------------------
+# 合成数据
+# ------------------------------
+def synthetic_image(size, mode: str = "RGB", seed: int = 0) -> Image.Image:
+    """生成确定性的测试图片：渐变 + 几何图形，同样的参数总是得到同样的像素"""
+    w, h = size
+    r = Image.linear_gradient("L").resize((w, h))
+    g = Image.radial_gradient("L").resize((w, h))
+    b = r.transpose(Image.Transpose.ROTATE_180).point(lambda p: (p + seed * 37) % 256)
+    img = Image.merge("RGB", (r, g, b))
+    draw = ImageDraw.Draw(img)
+    for i in range(8):
+        x0 = (seed * 53 + i * w // 8) % w
+        y0 = (seed * 29 + i * h // 8) % h
+        draw.rectangle((x0, y0, x0 + w // 10, y0 + h // 10), fill=((i * 31) % 256, (i * 67) % 256, (i * 97) % 256))
+    if mode == "RGBA":
+        img.putalpha(g)
+    elif mode != "RGB":
+        img = img.convert(mode)
+    return img
+
+
+# ------------------------------
+# 测量工具
+# ------------------------------
+def peak_rss_mb() -> float:
+    """
+    当前进程的峰值常驻内存，单位 MB（不含子进程：RUSAGE_CHILDREN 只是单个子进程的峰值，
+    不是各进程之和，不能代表多进程批量导出的总内存）
+    """
+    if sys.platform == "win32":
+        import ctypes
+        from ctypes import wintypes
+
+        class PROCESS_MEMORY_COUNTERS(ctypes.Structure):
+            _fields_ = [("cb", wintypes.DWORD), ("PageFaultCount", wintypes.DWORD),
+                        ("PeakWorkingSetSize", ctypes.c_size_t), ("WorkingSetSize", ctypes.c_size_t),
+                        ("QuotaPeakPagedPoolUsage", ctypes.c_size_t), ("QuotaPagedPoolUsage", ctypes.c_size_t),
+                        ("QuotaPeakNonPagedPoolUsage", ctypes.c_size_t), ("QuotaNonPagedPoolUsage", ctypes.c_size_t),
+                        ("PagefileUsage", ctypes.c_size_t), ("PeakPagefileUsage", ctypes.c_size_t)]
+
+        counters = PROCESS_MEMORY_COUNTERS()
+        counters.cb = ctypes.sizeof(counters)
+        handle = ctypes.windll.kernel32.GetCurrentProcess()
+        ctypes.windll.psapi.GetProcessMemoryInfo(handle, ctypes.byref(counters), counters.cb)
+        return counters.PeakWorkingSetSize / (1024 * 1024)
+
+    import resource
+    self_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 单位为 KB，macOS 为字节
+    unit = 1 if sys.platform == "darwin" else 1024
+    return self_rss * unit / (1024 * 1024)
+
+
+def percentile(values: List[float], pct: float) -> float:
+    ordered = sorted(values)
+    k = (len(ordered) - 1) * pct / 100.0
+    lo, hi = int(k), min(int(k) + 1, len(ordered) - 1)
+    return ordered[lo] + (ordered[hi] - ordered[lo]) * (k - lo)
+
+
+def time_call(fn: Callable[[], object], runs: int, warmup: int = 1) -> Dict[str, float]:
+    """重复调用 fn，返回延迟分位数（毫秒）和吞吐量（次/秒）"""
+    for _ in range(warmup):
+        fn()
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000.0)
+    return {
+        "runs": runs,
+        "mean_ms": round(statistics.fmean(samples), 3),
+        "p50_ms": round(percentile(samples, 50), 3),
+        "p95_ms": round(percentile(samples, 95), 3),
+        "throughput_per_s": round(1000.0 / statistics.fmean(samples), 2),
+    }
+
+
+# ------------------------------
+# 基准项
+# ------------------------------
+def bench_text_apply(sizes, runs) -> Dict[str, dict]:
+    results = {}
+    for size_name in sizes:
+        for mode in MODES:
+            img = synthetic_image(SIZES[size_name], mode)
+            tw = TextWatermark("Benchmark 水印", relative_font_size=5, color=(255, 255, 255), opacity=180, bold=True)
+            results[f"text_apply.{size_name}.{mode}"] = time_call(lambda: tw.apply(img, (50, 50)), runs)
+    return results
+
+
+def bench_image_apply(sizes, runs) -> Dict[str, dict]:
+    results = {}
+    for size_name in sizes:
+        for mode in MODES:
+            img = synthetic_image(SIZES[size_name], mode)
+            iw = ImageWatermark(str(LOGO_PATH), opacity=180, scale=0.3)
+            center = (img.width // 2, img.height // 2)
+            results[f"image_apply.{size_name}.{mode}"] = time_call(lambda: iw.apply(img, center), runs)
+    return results
+
+
+def bench_compositing(runs) -> Dict[str, dict]:
+    """各合成后端把同一个水印图层原地合成到 1920x1080 底图上（未安装 NumPy 时只测 pillow）"""
+    from watermark import compositing_numpy
+
+    results = {}
+    backends = ["pillow"] + (["numpy"] if compositing_numpy.AVAILABLE else [])
+    for backend in backends:
+        tw = TextWatermark("Benchmark 水印", relative_font_size=5, color=(255, 255, 255), opacity=180, backend=backend)
+        iw = ImageWatermark(str(LOGO_PATH), opacity=180, scale=0.3, backend=backend)
+        for mode in MODES:
+            img = synthetic_image(SIZES["1920x1080"], mode)
+            for kind, layer in (("text", tw.layer(img.size, (50, 50))), ("image", iw.layer((960, 540)))):
+                results[f"composite.{backend}.{kind}.{mode}"] = time_call(lambda: layer.apply(img), runs)
+    return results
+
+
+def bench_preview(runs) -> Dict[str, dict]:
+    base = synthetic_image((1280, 720), "RGBA")
+    manager = PreviewManager()
+    manager.set_base_image(base)
+    manager.set_text_watermark((TextWatermark("Preview 水印", relative_font_size=5, opacity=180), (40, 40)))
+    manager.set_image_watermark((ImageWatermark(str(LOGO_PATH), opacity=180, scale=0.3), (640, 360)))
+    return {"generate_preview.1280x720": time_call(manager.generate_preview, runs)}
+
+
+def bench_export_image(sizes, runs, work_dir: Path) -> Dict[str, dict]:
+    results = {}
+    fm = FileManager()
+    for size_name in sizes:
+        img = synthetic_image(SIZES[size_name], "RGB")
+        src = work_dir / f"src_{size_name}.png"
+        for fmt in FileManager.SUPPORTED_OUTPUT_FORMATS:
+            out_dir = work_dir / f"export_{fmt}"
+            results[f"export_image.{size_name}.{fmt}"] = time_call(
+                lambda: fm.export_image(img, src, str(out_dir), output_format=fmt), runs
+            )
+    return results
+
+
+def bench_encode_profiles(sizes, runs) -> Dict[str, dict]:
+    """各编码方案的编码耗时与输出大小（bytes），用于比较速度与体积的取舍"""
+    results = {}
+    fm = FileManager()
+    for size_name in sizes:
+        img = synthetic_image(SIZES[size_name], "RGB")
+        for fmt in FileManager.SUPPORTED_OUTPUT_FORMATS:
+            for profile, formats in FileManager.ENCODE_PROFILES.items():
+                if fmt not in formats:
+                    continue  # 该格式沿用 balanced 的参数，不重复测量
+                encode = lambda: fm.encode_image(img, fmt, 90, profile)
+                stats = time_call(encode, runs)
+                stats["bytes"] = len(encode())
+                results[f"encode.{size_name}.{fmt}.{profile}"] = stats
+    return results
+
+
+def bench_batch(count: int, size, workers: int, work_dir: Path) -> Dict[str, float]:
+    """
+    完整批量导出路径：解码 -> 加水印 -> 编码 -> 写盘。
+    只有单进程（workers == 1，所有阶段都在本进程内）时才记录峰值内存，多进程时各工作进程的内存无法从这里汇总。
+    """
+    in_dir = work_dir / "batch_in"
+    in_dir.mkdir(parents=True, exist_ok=True)
+    paths = []
+    for i in range(count):
+        p = in_dir / f"img_{i:04d}.jpg"
+        synthetic_image(size, "RGB", seed=i % 7).save(p, quality=90)
+        paths.append(p)
+
+    exporter = BatchExporter(BENCH_SETTINGS, str(work_dir / "batch_out"), workers=workers)
+    start = time.perf_counter()
+    results = exporter.run(paths)
+    elapsed = time.perf_counter() - start
+    report = {
+        "images": count,
+        "workers": workers,
+        "failed": sum(1 for r in results if not r.ok),
+        "seconds": round(elapsed, 3),
+        "throughput_per_s": round(count / elapsed, 2),
+    }
+    if workers == 1:
+        report["peak_rss_mb"] = round(peak_rss_mb(), 1)
+    if exporter.last_pipeline_stats:
+        # 单进程流水线：各阶段的利用率与队列深度，用于找出瓶颈阶段
+        report["pipeline"] = exporter.last_pipeline_stats
+    return report
+
+
+def run_isolated_batch(count: int, workers: int) -> Dict[str, float]:
+    """在独立子进程中运行批量导出，使峰值内存只反映批量导出本身"""
+    cmd = [sys.executable, str(Path(__file__).resolve()), "--isolated-batch",
+           "--batch-count", str(count), "--workers", str(workers)]
+    out = subprocess.run(cmd, check=True, capture_output=True, text=True, cwd=str(ROOT))
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+# ------------------------------
+# 基线比较
+# ------------------------------
+def flatten_metrics(report: dict) -> Dict[str, float]:
+    """取出可比较的指标（越小越好）：各项延迟、编码输出大小与峰值内存"""
+    metrics = {}
+    for name, stats in report.get("results", {}).items():
+        for key in ("p50_ms", "p95_ms", "bytes"):
+            if key in stats:
+                metrics[f"{name}.{key}"] = stats[key]
+    for key in ("seconds", "peak_rss_mb"):
+        if key in report.get("batch", {}):
+            metrics[f"batch.{key}"] = report["batch"][key]
+    return metrics
+
+
+def compare_with_baseline(report: dict, baseline: dict, threshold: float, min_delta_ms: float = 1.0) -> List[str]:
+    """
+    返回超过阈值的回归项描述；只比较两边都存在的指标。
+    亚毫秒级的延迟抖动很大，绝对差值小于 min_delta_ms 的延迟变化不计为回归。
+    """
+    current, base = flatten_metrics(report), flatten_metrics(baseline)
+    if report.get("batch", {}).get("images") != baseline.get("batch", {}).get("images"):
+        current = {k: v for k, v in current.items() if not k.startswith("batch.")}
+    regressions = []
+    for key in sorted(current.keys() & base.keys()):
+        if key.endswith("_ms") and current[key] - base[key] < min_delta_ms:
+            continue
+        if base[key] > 0 and current[key] > base[key] * (1 + threshold):
+            regressions.append(f"{key}: {base[key]} -> {current[key]} (+{(current[key] / base[key] - 1) * 100:.0f}%)")
+    return regressions
+
+
+def check_prd_targets(report: dict) -> List[str]:
+    """检查 PRD 中的绝对目标"""
+    batch = report.get("batch", {})
+    failures = []
+    if batch.get("images") == PRD_BATCH_COUNT and batch.get("seconds", 0) > PRD_BATCH_SECONDS:
+        failures.append(f"批量导出 {PRD_BATCH_COUNT} 张耗时 {batch['seconds']}s，超过 {PRD_BATCH_SECONDS}s")
+    if batch.get("peak_rss_mb", 0) > PRD_PEAK_RSS_MB:
+        failures.append(f"峰值内存 {batch['peak_rss_mb']}MB，超过 {PRD_PEAK_RSS_MB}MB")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="水印处理性能基准测试")
+    parser.add_argument("--quick", action="store_true", help="只测较小尺寸、较少次数")
+    parser.add_argument("--runs", type=int, default=None, help="每项重复次数")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="批量导出的进程数")
+    parser.add_argument("--batch-count", type=int, default=PRD_BATCH_COUNT, help="批量导出的图片数量")
+    parser.add_argument("--output", default=str(Path(__file__).resolve().parent / "latest.json"), help="结果 JSON 路径")
+    parser.add_argument("--baseline", default=str(BASELINE_PATH), help="基线 JSON 路径")
+    parser.add_argument("--threshold", type=float, default=0.5, help="允许的回归比例（0.5 表示 50%%）")
+    parser.add_argument("--min-delta-ms", type=float, default=1.0, help="低于该绝对差值（毫秒）的延迟变化不计为回归")
+    parser.add_argument("--update-baseline", action="store_true", help="用本次结果覆盖基线")
+    parser.add_argument("--isolated-batch", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.isolated_batch:
+        with tempfile.TemporaryDirectory() as tmp:
+            print(json.dumps(bench_batch(args.batch_count, PRD_BATCH_SIZE, args.workers, Path(tmp))))
+        return 0
+
+    sizes = ["640x480", "1920x1080"] if args.quick else list(SIZES)
+    runs = args.runs or (10 if args.quick else 20)
+    batch_count = min(args.batch_count, 20) if args.quick else args.batch_count
+
+    report = {
+        "meta": {
+            "python": platform.python_version(),
+            "pillow": PIL.__version__,
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "quick": args.quick,
+            "runs": runs,
+        },
+        "results": {},
+    }
+    with tempfile.TemporaryDirectory() as tmp:
+        work_dir = Path(tmp)
+        report["results"].update(bench_text_apply(sizes, runs))
+        report["results"].update(bench_image_apply(sizes, runs))
+        report["results"].update(bench_compositing(runs))
+        report["results"].update(bench_preview(runs))
+        report["results"].update(bench_export_image(sizes, runs, work_dir))
+        report["results"].update(bench_encode_profiles(sizes, runs))
+    report["batch"] = run_isolated_batch(batch_count, args.workers)
+    if args.workers > 1:
+        # 内存目标固定按单进程批量导出检查（峰值内存只统计本进程，见 peak_rss_mb）
+        report["batch"]["peak_rss_mb"] = run_isolated_batch(batch_count, 1)["peak_rss_mb"]
+    report["peak_rss_mb"] = round(peak_rss_mb(), 1)
+
+    Path(args.output).write_text(json.dumps(report, indent=2, ensure_ascii=False), encoding="utf-8")
+    for name, stats in report["results"].items():
+        size_note = f"  {stats['bytes'] / 1024:9.0f} KB" if "bytes" in stats else ""
+        print(f"{name:40s} p50 {stats['p50_ms']:9.2f} ms  p95 {stats['p95_ms']:9.2f} ms  {stats['throughput_per_s']:8.2f}/s{size_note}")
+    b = report["batch"]
+    print(f"batch {b['images']} x {PRD_BATCH_SIZE[0]}x{PRD_BATCH_SIZE[1]} ({b['workers']} workers): "
+          f"{b['seconds']} s, {b['throughput_per_s']} img/s, peak RSS {b['peak_rss_mb']} MB (1 worker)")
+    print(f"[OK] 结果已保存: {args.output}")
+
+    if args.update_baseline:
+        Path(args.baseline).write_text(json.dumps(report, indent=2, ensure_ascii=False), encoding="utf-8")
+        print(f"[OK] 基线已更新: {args.baseline}")
+        return 0
+
+    failures = check_prd_targets(report)
+    if Path(args.baseline).exists():
+        baseline = json.loads(Path(args.baseline).read_text(encoding="utf-8"))
+        regressions = compare_with_baseline(report, baseline, args.threshold, args.min_delta_ms)
+        if baseline.get("meta", {}).get("quick") != args.quick:
+            # 快速模式与完整基线的重复次数不同，分位数不可直接比较，只给出提示
+            for r in regressions:
+                print(f"[WARN] 与基线运行模式不同，仅供参考: {r}")
+        else:
+            failures += regressions
+    else:
+        print(f"[WARN] 未找到基线文件: {args.baseline}")
+
+    if failures:
+        print("[FAIL] 性能回归:")
+        for f in failures:
+            print(f"  - {f}")
+        return 1
+    print("[OK] 未发现性能回归")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
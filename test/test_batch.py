@@ -0,0 +1,141 @@
+import sys
+import threading
+from pathlib import Path
+from PIL import Image, ImageDraw, ImageChops
+
+# 添加项目根目录到 sys.path
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from watermark.batch import BatchExporter, format_report
+from watermark.file_manager import FileManager
+
+LOGO_PATH = Path(__file__).resolve().parents[1] / "assets" / "logo.png"
+
+
+def create_sample_images(folder: Path, count: int = 4):
+    """生成若干张尺寸不同的测试图片"""
+    folder.mkdir(parents=True, exist_ok=True)
+    paths = []
+    for i in range(count):
+        img = Image.new("RGB", (320 + i * 40, 200 + i * 10), color=(40 * i, 120, 200))
+        ImageDraw.Draw(img).text((20, 20), f"Image {i}", fill=(0, 0, 0))
+        p = folder / f"img_{i}.png"
+        img.save(p, "PNG")
+        paths.append(p)
+    return paths
+
+
+def make_settings(**overrides):
+    settings = {
+        "text_content": "Batch WM",
+        "opacity": 180,
+        "color": [255, 0, 0],
+        "relative_font_size": 8,
+        "is_bold": True,
+        "is_italic": False,
+        "image_path": str(LOGO_PATH),
+        "image_scale": 30,
+        "position_name": "右下",
+        "wm_offset_relative": [0.0, 0.0],
+        "name_rule": "suffix",
+        "custom_str": "_wm",
+        "output_format": "PNG",
+        "jpeg_quality": 90,
+        "scale_percent": 100,
+    }
+    settings.update(overrides)
+    return settings
+
+
+def test_results_keep_input_order(tmp_path):
+    paths = create_sample_images(tmp_path / "in")
+    missing = tmp_path / "in" / "missing.png"
+    results = BatchExporter(make_settings(), tmp_path / "out", workers=1).run(paths + [missing])
+
+    assert [r.source for r in results] == paths + [missing]
+    assert all(r.ok for r in results[:-1])
+    assert not results[-1].ok
+    assert results[0].output == tmp_path / "out" / "img_0_wm.png"
+
+
+def test_process_pool_matches_serial_export(tmp_path):
+    paths = create_sample_images(tmp_path / "in")
+    serial = BatchExporter(make_settings(), tmp_path / "serial", workers=1).run(paths)
+    parallel = BatchExporter(make_settings(), tmp_path / "parallel", workers=2).run(paths)
+
+    assert [r.source for r in parallel] == paths
+    for a, b in zip(serial, parallel):
+        assert a.ok and b.ok
+        with Image.open(a.output) as img_a, Image.open(b.output) as img_b:
+            assert ImageChops.difference(img_a, img_b).getbbox() is None
+
+
+def test_incremental_export_resumes_after_interruption(tmp_path):
+    paths = create_sample_images(tmp_path / "in", count=4)
+    out_dir = tmp_path / "out"
+
+    # 只导出前两张就中断
+    exporter = BatchExporter(make_settings(), out_dir, workers=1, incremental=True)
+    results = exporter.iter_run(paths)
+    first = [next(results), next(results)]
+    results.close()
+    assert all(r.ok and not r.skipped for r in first)
+
+    resumed = BatchExporter(make_settings(), out_dir, workers=2, incremental=True).run(paths)
+    assert [r.source for r in resumed] == paths
+    assert [r.skipped for r in resumed] == [True, True, False, False]
+    assert all(r.ok for r in resumed)
+
+    changed = BatchExporter(make_settings(opacity=100), out_dir, workers=1, incremental=True).run(paths)
+    assert not any(r.skipped for r in changed)
+
+
+def test_incremental_manifest_is_shared_with_file_manager(tmp_path):
+    paths = create_sample_images(tmp_path / "in", count=3)
+    out_dir = tmp_path / "out"
+    settings = make_settings()
+    BatchExporter(settings, out_dir, workers=1, incremental=True).run(paths)
+
+    # 同一份设置经 FileManager 导出时沿用同一份清单，不会重新导出
+    loaded = []
+
+    def work_items():
+        for p in paths:
+            def loader(p=p):
+                loaded.append(p)
+                return Image.open(p).convert("RGB")
+            yield loader, p
+
+    results = FileManager().batch_export(
+        work_items(), str(out_dir), output_format="PNG", name_rule="suffix", custom_str="_wm",
+        incremental=True, settings=settings,
+    )
+    assert len(results) == 3 and loaded == []
+
+
+def test_progress_and_cancel_keep_finished_files(tmp_path):
+    paths = create_sample_images(tmp_path / "in", count=6)
+    cancel = threading.Event()
+    seen = []
+
+    def on_progress(progress):
+        seen.append((progress.done, progress.total, progress.failed))
+        if progress.done == 2:
+            cancel.set()
+
+    for workers in (1, 2):
+        out_dir = tmp_path / f"out_{workers}"
+        cancel.clear()
+        seen.clear()
+        exporter = BatchExporter(
+            make_settings(), out_dir, workers=workers, max_in_flight=2, progress_callback=on_progress, cancel_event=cancel
+        )
+        results = exporter.run(paths)
+
+        # 取消后已提交的图片照常完成，结果与磁盘上的文件一一对应
+        assert 2 <= len(results) < len(paths)
+        assert sorted(p.name for p in out_dir.iterdir()) == sorted(r.output.name for r in results)
+        assert seen[0] == (1, len(paths), 0) and seen[-1][0] == len(results)
+        progress = exporter.last_progress
+        assert progress.cancelled and progress.rate > 0 and progress.eta is not None
+        assert "[成功]" in format_report(results)
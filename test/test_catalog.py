@@ -0,0 +1,53 @@
+import sys
+from pathlib import Path
+from PIL import Image
+
+# 添加项目根目录到 sys.path
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from watermark.catalog import ImageCatalog
+from watermark.file_manager import FileManager
+
+
+def create_images(folder: Path, count: int):
+    folder.mkdir(parents=True, exist_ok=True)
+    paths = []
+    for i in range(count):
+        p = folder / f"img_{i}.png"
+        Image.new("RGB", (30 + i, 20), color=(i, 0, 0)).save(p)
+        paths.append(p)
+    return paths
+
+
+def test_catalog_keeps_order_and_dedupes(tmp_path):
+    paths = create_images(tmp_path, 3)
+    catalog = ImageCatalog(FileManager.SUPPORTED_INPUT_FORMATS)
+
+    added = catalog.extend([paths[1], paths[0], str(tmp_path / "." / "img_1.png"), tmp_path / "missing.png", tmp_path / "x.txt"])
+    assert [r.name for r in added] == ["img_1.png", "img_0.png"]
+    assert catalog.paths() == [paths[1], paths[0]]
+    assert paths[0] in catalog and paths[2] not in catalog
+
+    record = catalog.get(paths[1])
+    assert record.size == paths[1].stat().st_size and record.format == "PNG"
+    assert not hasattr(record, "__dict__")
+
+
+def test_catalog_bulk_removal_and_row_lookup(tmp_path):
+    paths = create_images(tmp_path, 6)
+    catalog = ImageCatalog()
+    catalog.extend(paths)
+
+    removed = catalog.remove_rows([0, 2, 2, 5])
+    assert [r.name for r in removed] == ["img_0.png", "img_2.png", "img_5.png"]
+    assert [catalog.row_of(p) for p in paths] == [-1, 0, -1, 1, 2, -1]
+    assert len(catalog.remove([paths[3], paths[3]])) == 1
+    assert [r.name for r in catalog] == ["img_1.png", "img_4.png"]
+
+
+def test_catalog_fills_dimensions_lazily(tmp_path):
+    path = create_images(tmp_path, 2)[1]
+    record = ImageCatalog().add(path)
+    assert (record.width, record.height) == (0, 0)
+    record.load_info()
+    assert (record.width, record.height) == (31, 20)
@@ -0,0 +1,71 @@
+import sys
+import json
+import subprocess
+from pathlib import Path
+from PIL import Image
+
+# 添加项目根目录到 sys.path
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from watermark.cli import collect_inputs
+
+ROOT = Path(__file__).resolve().parents[1]
+
+
+def create_images(folder: Path, names):
+    folder.mkdir(parents=True, exist_ok=True)
+    for name in names:
+        Image.new("RGB", (120, 80), color=(10, 120, 200)).save(folder / name)
+    return [folder / n for n in names]
+
+
+def test_collect_inputs_expands_folders_and_globs(tmp_path):
+    create_images(tmp_path / "a", ["1.jpg", "2.png"])
+    create_images(tmp_path / "a" / "sub", ["3.jpg"])
+    (tmp_path / "a" / "notes.txt").write_text("x")
+
+    found = collect_inputs([str(tmp_path / "a"), str(tmp_path / "a" / "*.jpg")])
+    assert [p.name for p in found] == ["1.jpg", "2.png"]
+
+    found = collect_inputs([str(tmp_path / "a")], recursive=True)
+    assert sorted(p.name for p in found) == ["1.jpg", "2.png", "3.jpg"]
+
+
+def test_cli_exports_without_importing_qt(tmp_path):
+    create_images(tmp_path / "in", ["a.jpg", "b.jpg"])
+    settings_path = tmp_path / "settings.json"
+    settings_path.write_text(json.dumps({"text_content": "CLI", "name_rule": "suffix", "custom_str": "_wm"}))
+
+    code = (
+        "import sys; from watermark.cli import main; "
+        f"rc = main([{str(tmp_path / 'in')!r}, '-o', {str(tmp_path / 'out')!r}, '-s', {str(settings_path)!r}, "
+        "'-f', 'JPEG', '-j', '1', '-q']); "
+        "sys.exit(rc or (3 if any(m.startswith('PyQt') for m in sys.modules) else 0))"
+    )
+    proc = subprocess.run([sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True)
+    assert proc.returncode == 0, proc.stdout + proc.stderr
+    assert sorted(p.name for p in (tmp_path / "out").iterdir()) == ["a_wm.jpg", "b_wm.jpg"]
+
+
+def test_cli_reports_invalid_watermark_settings(tmp_path, capsys):
+    from watermark.cli import main
+
+    create_images(tmp_path / "in", ["a.jpg"])
+    settings_path = tmp_path / "settings.json"
+    settings_path.write_text(json.dumps({"text_content": "CLI", "image_path": str(tmp_path / "missing_logo.png")}))
+
+    rc = main([str(tmp_path / "in"), "-o", str(tmp_path / "out"), "-s", str(settings_path), "-q"])
+    assert rc == 2
+    assert "[ERROR]" in capsys.readouterr().err
+    assert not (tmp_path / "out").exists()
+
+
+def test_default_workers_keeps_small_batches_in_process(monkeypatch):
+    from watermark import cli
+
+    monkeypatch.setattr(cli.os, "cpu_count", lambda: 8)
+    assert cli.default_workers(1) == 1
+    assert cli.default_workers(cli.AUTO_PARALLEL_MIN_IMAGES - 1) == 1
+    assert cli.default_workers(cli.AUTO_PARALLEL_MIN_IMAGES) == 8
+    monkeypatch.setattr(cli.os, "cpu_count", lambda: None)
+    assert cli.default_workers(100) == 1
@@ -0,0 +1,61 @@
+import sys
+from pathlib import Path
+
+import pytest
+from PIL import Image
+
+# 添加项目根目录到 sys.path
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+np = pytest.importorskip("numpy")
+
+from watermark import compositing, compositing_numpy
+from watermark.watermark_image import ImageWatermark
+from watermark.watermark_text import TextWatermark
+
+LOGO_PATH = Path(__file__).resolve().parents[1] / "assets" / "logo.png"
+
+
+def max_diff(a: Image.Image, b: Image.Image) -> int:
+    return int(np.abs(np.asarray(a, dtype=int) - np.asarray(b, dtype=int)).max())
+
+
+def test_numpy_blend_matches_pillow_within_one():
+    rng = np.random.default_rng(7)
+    sprite = Image.fromarray(rng.integers(0, 256, (37, 53, 4), dtype=np.uint8))
+    for mode, shape in (("RGB", (60, 80, 3)), ("RGBA", (60, 80, 4)), ("L", (60, 80))):
+        base = Image.fromarray(rng.integers(0, 256, shape, dtype=np.uint8))
+        assert base.mode == mode
+        for pillow_fn, numpy_fn in (
+            (compositing.composite_sprite, compositing_numpy.composite_sprite),
+            (compositing.paste_sprite, compositing_numpy.paste_sprite),
+        ):
+            for dest in ((10, 5), (-7, -9), (50, 40)):
+                want, got = base.copy(), base.copy()
+                pillow_fn(want, sprite, dest)
+                numpy_fn(got, sprite, dest)
+                assert max_diff(want, got) <= 1
+
+
+def test_stack_blend_and_watermark_backend_selection():
+    rng = np.random.default_rng(3)
+    stack = rng.integers(0, 256, (4, 50, 70, 3), dtype=np.uint8)
+    sprite = Image.fromarray(rng.integers(0, 256, (20, 30, 4), dtype=np.uint8))
+    single = [Image.fromarray(frame) for frame in stack]
+
+    # 一次调用合成整叠图片，视图原地修改
+    compositing_numpy.blend(stack[:, 5:], compositing_numpy.premultiply(sprite), (10, 0))
+    for img, frame in zip(single, stack):
+        compositing_numpy.composite_sprite(img, sprite, (10, 5))
+        assert np.array_equal(np.asarray(img), frame)
+
+    base = Image.new("RGB", (400, 300), (30, 60, 90))
+    for make in (
+        lambda backend: TextWatermark("Backend", relative_font_size=10, color=(255, 0, 0), opacity=180, backend=backend),
+        lambda backend: ImageWatermark(str(LOGO_PATH), opacity=150, scale=0.3, backend=backend),
+    ):
+        numpy_wm = make("numpy")
+        assert numpy_wm.backend == "numpy"
+        want = make("pillow").apply(base, position=(40, 40))
+        got = numpy_wm.apply(base, position=(40, 40))
+        assert max_diff(want, got) <= 1
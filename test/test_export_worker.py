@@ -0,0 +1,56 @@
+import os
+import sys
+from pathlib import Path
+
+import pytest
+from PIL import Image
+
+# 添加项目根目录到 sys.path
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+QtWidgets = pytest.importorskip("PyQt6.QtWidgets")
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+from watermark.batch import BatchProgress
+
+
+def test_export_worker_reports_progress_and_per_file_results(tmp_path):
+    app = QtWidgets.QApplication.instance() or QtWidgets.QApplication([])
+    from ui.export_panel import ExportProgressPanel
+    from ui.export_worker import ExportWorker
+
+    src = tmp_path / "in"
+    src.mkdir()
+    paths = []
+    for i in range(3):
+        p = src / f"img_{i}.png"
+        Image.new("RGB", (160, 120), (80 * i, 40, 200)).save(p)
+        paths.append(p)
+    paths.append(src / "missing.png")
+
+    panel = ExportProgressPanel()
+    panel.start(len(paths))
+    finished = []
+    worker = ExportWorker({"text_content": "Worker", "custom_str": "_wm"}, iter(paths), str(tmp_path / "out"), total=len(paths))
+    worker.progress.connect(panel.update_progress)
+    worker.exportFinished.connect(lambda results, progress: finished.append((results, progress)))
+    worker.start()
+    assert worker.wait(30000)
+    app.processEvents()
+
+    results, progress = finished[0]
+    assert [r.source for r in results] == paths
+    assert progress.done == 4 and progress.failed == 1 and not progress.cancelled
+    assert panel.progress_bar.value() == 4
+    assert panel.status_label.text().startswith("4/4")
+    panel.finish(progress)
+    assert "已完成" in panel.status_label.text() and not panel.cancel_btn.isEnabled()
+
+
+def test_progress_description_formats_rate_and_eta():
+    from ui.export_panel import ExportProgressPanel, format_duration
+
+    progress = BatchProgress(total=100, done=20, failed=1, elapsed=10.0)
+    assert format_duration(progress.eta) == "0:40"
+    assert format_duration(3725) == "1:02:05"
+    assert ExportProgressPanel.describe(progress) == "20/100 · 2.0 张/秒 · 剩余 0:40 · 失败 1"
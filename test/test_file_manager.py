@@ -1,9 +1,12 @@
+import io
 import os
 import sys
+import threading
 from pathlib import Path
 # 添加项目根目录到 sys.path
 sys.path.append(str(Path(__file__).resolve().parents[1]))
 
+import pytest
 from PIL import Image, ImageDraw, ImageFont
 
 from watermark.file_manager import FileManager
@@ -31,6 +34,112 @@ def add_dummy_watermark(img: Image.Image) -> Image.Image:
     return watermarked
 
 
+def test_batch_export_streams_lazily(tmp_path):
+    """batch_export 按需消费生成器，同时处理中的图片数不超过 max_in_flight"""
+    fm = FileManager()
+    src = create_sample_image(tmp_path / "sample.png")
+    state = {"in_flight": 0, "peak": 0, "loaded": 0}
+    lock = threading.Lock()
+
+    def loader():
+        with lock:
+            state["in_flight"] += 1
+            state["loaded"] += 1
+            state["peak"] = max(state["peak"], state["in_flight"])
+        return Image.open(src).convert("RGB")
+
+    def work_items():
+        for i in range(8):
+            yield loader, tmp_path / f"img_{i}.png"
+
+    original_export = fm.export_image
+    def counting_export(*args, **kwargs):
+        try:
+            return original_export(*args, **kwargs)
+        finally:
+            with lock:
+                state["in_flight"] -= 1
+    fm.export_image = counting_export
+
+    exported = fm.batch_export(work_items(), str(tmp_path / "out"), custom_str="_wm", max_in_flight=2)
+
+    assert [p.name for p in exported] == [f"img_{i}_wm.png" for i in range(8)]
+    assert state["loaded"] == 8
+    assert state["peak"] <= 2
+
+
+
+def test_incremental_batch_export_skips_unchanged(tmp_path):
+    """增量模式只重新导出源文件或参数变化的图片"""
+    fm = FileManager()
+    sources = [create_sample_image(tmp_path / f"src_{i}.png") for i in range(3)]
+    out_dir = tmp_path / "out"
+    loaded = []
+
+    def work_items():
+        for p in sources:
+            def loader(p=p):
+                loaded.append(p)
+                return Image.open(p).convert("RGB")
+            yield loader, p
+
+    first = fm.batch_export(work_items(), str(out_dir), incremental=True, settings={"text": "a"})
+    assert len(first) == 3 and len(loaded) == 3
+    assert (out_dir / ".watermark_manifest.json").exists()
+
+    loaded.clear()
+    again = fm.batch_export(work_items(), str(out_dir), incremental=True, settings={"text": "a"})
+    assert again == first and loaded == []
+
+    # 修改一张源图、删除一张输出：只处理这两张
+    img = Image.new("RGB", (50, 50), color=(0, 0, 0))
+    img.save(sources[0], "PNG")
+    os.utime(sources[0], ns=(1, 1))
+    first[2].unlink()
+    fm.batch_export(work_items(), str(out_dir), incremental=True, settings={"text": "a"})
+    assert loaded == [sources[0], sources[2]]
+
+    # 水印参数变化时全部重新导出
+    loaded.clear()
+    fm.batch_export(work_items(), str(out_dir), incremental=True, settings={"text": "b"})
+    assert loaded == sources
+    assert not list(out_dir.glob("*.tmp"))
+
+
+def test_encode_profiles_trade_speed_for_size(tmp_path):
+    """各编码方案像素一致，smallest 的 PNG 不大于 fast；未知方案报错"""
+    fm = FileManager()
+    img = add_dummy_watermark(Image.open(create_sample_image(tmp_path / "src.png")))
+    sizes = {}
+    for profile in FileManager.ENCODE_PROFILES:
+        data = fm.encode_image(img, "PNG", encode_profile=profile)
+        sizes[profile] = len(data)
+        with Image.open(io.BytesIO(data)) as decoded:
+            assert decoded.tobytes() == img.tobytes()
+    assert sizes["smallest"] <= sizes["balanced"] <= sizes["fast"]
+
+    # TIFF 同样无损；smallest 使用水平差分预测，在渐变（接近照片）的图片上比 balanced 小
+    gradient = Image.radial_gradient("L").resize((400, 200))
+    photo = Image.merge("RGB", (gradient, gradient.transpose(Image.Transpose.FLIP_LEFT_RIGHT), gradient))
+    tiff_sizes = {}
+    for profile in FileManager.ENCODE_PROFILES:
+        data = fm.encode_image(photo, "TIFF", encode_profile=profile)
+        tiff_sizes[profile] = len(data)
+        with Image.open(io.BytesIO(data)) as decoded:
+            assert decoded.tobytes() == photo.tobytes()
+    assert tiff_sizes["smallest"] < tiff_sizes["balanced"] < tiff_sizes["fast"]
+
+    # 灰度 JPEG 同样可用所有方案；balanced 与原有默认输出一致
+    for profile in FileManager.ENCODE_PROFILES:
+        assert fm.encode_image(img.convert("L"), "JPEG", 80, profile)
+    assert fm.encode_image(img, "JPEG", 80, "balanced") == fm.encode_image(img, "JPEG", 80)
+    # fast 不改变 JPEG 参数（没有比默认更快的设置），与 balanced 相同
+    assert FileManager.encode_params("JPEG", 80, "fast") == FileManager.encode_params("JPEG", 80, "balanced")
+
+    with pytest.raises(ValueError):
+        fm.encode_image(img, "PNG", encode_profile="tiny")
+
+
 def main():
     fm = FileManager()
 
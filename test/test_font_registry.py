@@ -0,0 +1,81 @@
+import os
+import sys
+from pathlib import Path
+
+# 添加项目根目录到 sys.path
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from watermark.font_registry import FontRegistry
+
+
+def create_font_dir(folder: Path):
+    """生成一个包含子目录的假字体目录（只用于测试索引，不会真正加载）"""
+    (folder / "truetype" / "demo").mkdir(parents=True)
+    (folder / "truetype" / "demo" / "DemoSans.ttf").write_bytes(b"")
+    (folder / "truetype" / "demo" / "DemoSans-Bold.ttf").write_bytes(b"")
+    (folder / "readme.txt").write_text("not a font")
+    return folder
+
+
+def test_resolve_scans_recursively_and_memoises(tmp_path):
+    fonts = create_font_dir(tmp_path / "fonts")
+    registry = FontRegistry(search_dirs=[fonts], index_path=tmp_path / "index.json")
+
+    assert registry.resolve("DemoSans") == fonts / "truetype" / "demo" / "DemoSans.ttf"
+    assert registry.resolve("DemoSans") == fonts / "truetype" / "demo" / "DemoSans.ttf"
+    assert registry.resolve("readme") is None
+    # 大小写不敏感；没有完全相同的文件名时取包含该名称且最短的
+    assert registry.resolve("demosans-bold") == fonts / "truetype" / "demo" / "DemoSans-Bold.ttf"
+    assert registry.resolve("Sans") == fonts / "truetype" / "demo" / "DemoSans.ttf"
+    stats = registry.stats()
+    assert stats["lookup_hits"] == 1
+    assert stats["lookup_misses"] == 4
+
+
+def test_index_is_persisted_and_invalidated_by_mtime(tmp_path):
+    fonts = create_font_dir(tmp_path / "fonts")
+    index_path = tmp_path / "index.json"
+    FontRegistry(search_dirs=[fonts], index_path=index_path).resolve("DemoSans")
+    assert index_path.exists()
+
+    # 目录未变化：直接使用磁盘索引，不重新扫描
+    registry = FontRegistry(search_dirs=[fonts], index_path=index_path)
+    def fail_scan():
+        raise AssertionError("不应重新扫描")
+    registry._scan = fail_scan
+    assert registry.resolve("Demo") is not None
+
+    # 目录发生变化：索引失效，重新扫描后能找到新字体
+    demo_dir = fonts / "truetype" / "demo"
+    (demo_dir / "Another.otf").write_bytes(b"")
+    os.utime(demo_dir, ns=(1_000_000_000, 1_000_000_000))
+    registry = FontRegistry(search_dirs=[fonts], index_path=index_path)
+    assert registry.resolve("Another") == demo_dir / "Another.otf"
+
+
+def test_sized_fonts_are_cached(tmp_path):
+    fonts = create_font_dir(tmp_path / "fonts")
+    registry = FontRegistry(search_dirs=[fonts], index_path=tmp_path / "index.json")
+
+    # 假字体无法加载，回退为默认字体，但同样按 (路径, 字号) 缓存
+    first = registry.get_font("DemoSans", 24)
+    assert registry.get_font("DemoSans", 24) is first
+    registry.get_font("DemoSans", 32)
+    stats = registry.stats()
+    assert stats["font_hits"] == 1
+    assert stats["font_misses"] == 2
+    assert stats["fonts_cached"] == 2
+
+
+def test_unwritable_cache_dir_keeps_index_in_memory(tmp_path, monkeypatch):
+    fonts = create_font_dir(tmp_path / "fonts")
+    blocker = tmp_path / "not_a_dir"
+    blocker.write_text("")
+    # 缓存目录的父路径是文件，无法创建目录（与 HOME 不可写的效果相同）
+    monkeypatch.setenv("PHOTO_WATERMARK_CACHE_DIR", str(blocker / "cache"))
+
+    registry = FontRegistry(search_dirs=[fonts])
+    assert registry.resolve("DemoSans") == fonts / "truetype" / "demo" / "DemoSans.ttf"
+    assert registry.index_path is None
+    registry.refresh()
+    assert registry.resolve("DemoSans") is not None
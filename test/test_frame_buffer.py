@@ -0,0 +1,56 @@
+import gc
+import os
+import sys
+from pathlib import Path
+
+import pytest
+from PIL import Image
+
+# 添加项目根目录到 sys.path
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+QtWidgets = pytest.importorskip("PyQt6.QtWidgets")
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+from ui.frame_buffer import FramePool
+from watermark.preview import PreviewManager
+from watermark.watermark_text import TextWatermark
+
+
+def test_preview_renders_into_shared_frame_and_recycles():
+    base = Image.new("RGB", (120, 80), (10, 20, 30))
+    manager = PreviewManager()
+    manager.set_base_image(base)
+    manager.set_text_watermark((TextWatermark("WM", relative_font_size=20, color=(255, 0, 0)), (5, 5)))
+    expected = manager.generate_preview()
+
+    pool = FramePool()
+    frame = pool.render(base.size, manager.generate_preview)
+    # QImage 直接读取 PIL 合成时写入的内存
+    qimage = frame.qimage()
+    assert frame.image.tobytes() == expected.tobytes()
+    assert qimage.pixelColor(100, 70).getRgb() == (10, 20, 30, 255)
+    data = frame.data
+
+    del qimage, frame
+    gc.collect()
+    assert pool.acquire(base.size).data is data
+
+
+def test_preview_widget_scales_once_to_device_pixels():
+    app = QtWidgets.QApplication.instance() or QtWidgets.QApplication([])
+    from ui.preview_widget import PreviewWidget
+
+    widget = PreviewWidget()
+    widget.resize(400, 300)
+    widget.show()
+    app.processEvents()
+
+    widget.show_image(Image.new("RGBA", (800, 400), (0, 128, 255, 255)))
+    shown = widget.label._image
+    dpr = widget.label.devicePixelRatioF()
+    rect = widget.label.contentsRect()
+    assert shown.width() == round(rect.width() * dpr)
+    assert shown.devicePixelRatio() == dpr
+    assert abs(widget._display_scale - rect.width() / 800) < 0.01
+    widget.close()
@@ -0,0 +1,85 @@
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+# 添加项目根目录到 sys.path
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+QtWidgets = pytest.importorskip("PyQt6.QtWidgets")
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+
+@pytest.fixture
+def image_list(tmp_path, monkeypatch):
+    monkeypatch.setenv("PHOTO_WATERMARK_CACHE_DIR", str(tmp_path / "cache"))
+    app = QtWidgets.QApplication.instance() or QtWidgets.QApplication([])
+    from ui.image_list import ImageList
+    from watermark.file_manager import FileManager
+
+    view = ImageList()
+    view.setCatalog(FileManager().catalog)
+    view.resize(200, 300)
+    view.show()
+    app.processEvents()
+    yield view
+    view.thumbnail_loader.cancel_pending()
+    view.thumbnail_loader._pool.waitForDone()
+    view.close()
+
+
+def test_thumbnails_are_requested_only_for_visible_rows(tmp_path, image_list):
+    from PIL import Image
+    paths = []
+    for i in range(500):
+        p = tmp_path / f"img_{i:03d}.png"
+        Image.new("RGB", (8, 8)).save(p)
+        paths.append(str(p))
+
+    requested = []
+    image_list.thumbnail_loader.request = requested.append
+    image_list.add_images(paths + paths[:10])
+    image_list.viewport().repaint()
+
+    assert image_list.count() == 500
+    assert image_list.get_selected_image() == paths[0]
+    assert 0 < len(set(requested)) < 100
+
+
+def test_bulk_removal_keeps_catalog_and_selection_in_sync(tmp_path, image_list):
+    from PIL import Image
+    paths = []
+    for i in range(100):
+        p = tmp_path / f"img_{i:03d}.png"
+        Image.new("RGB", (8, 8)).save(p)
+        paths.append(str(p))
+    image_list.add_images(paths)
+
+    image_list.remove_rows(range(0, 100, 2))
+    assert image_list.count() == 50
+    assert [r.name for r in image_list.catalog][:2] == ["img_001.png", "img_003.png"]
+    assert image_list.get_selected_image() == paths[1]
+
+
+def test_context_menu_deletes_only_clicked_row(tmp_path, image_list, monkeypatch):
+    from PIL import Image
+    from PyQt6.QtGui import QContextMenuEvent
+    import ui.image_list as image_list_module
+
+    paths = []
+    for i in range(5):
+        p = tmp_path / f"img_{i}.png"
+        Image.new("RGB", (8, 8)).save(p)
+        paths.append(str(p))
+    image_list.thumbnail_loader.request = lambda path: None
+    image_list.add_images(paths)
+    image_list.selectAll()
+    assert len(image_list.selectionModel().selectedIndexes()) == 5
+
+    # 右键菜单直接选择“删除”
+    monkeypatch.setattr(image_list_module.QMenu, "exec", lambda menu, *args: menu.actions()[0])
+    rect = image_list.visualRect(image_list.model_.index(2))
+    image_list.contextMenuEvent(QContextMenuEvent(QContextMenuEvent.Reason.Mouse, rect.center(), rect.center()))
+    assert image_list.count() == 4
+    assert paths[2] not in [image_list.model_.index(i).data(image_list_module.Qt.ItemDataRole.UserRole) for i in range(4)]
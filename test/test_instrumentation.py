@@ -0,0 +1,50 @@
+import sys
+import json
+from pathlib import Path
+from PIL import Image
+
+# 添加项目根目录到 sys.path
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from watermark import instrumentation
+from watermark.batch import BatchExporter
+
+
+def create_images(folder: Path, count: int = 3):
+    folder.mkdir(parents=True, exist_ok=True)
+    paths = []
+    for i in range(count):
+        p = folder / f"img_{i}.png"
+        Image.new("RGB", (200, 150), color=(50 * i, 100, 150)).save(p, "PNG")
+        paths.append(p)
+    return paths
+
+
+def test_stage_is_noop_when_disabled():
+    instrumentation.enable(False)
+    instrumentation.reset()
+    with instrumentation.stage("decode"):
+        pass
+    instrumentation.count("bytes_read", 10)
+    assert instrumentation.summary() == {"stages": {}, "counters": {}}
+
+
+def test_batch_profile_merges_worker_stages(tmp_path):
+    paths = create_images(tmp_path / "in")
+    settings = {"text_content": "Profile", "output_format": "PNG", "custom_str": "_wm"}
+    trace_path = tmp_path / "trace.json"
+
+    exporter = BatchExporter(settings, str(tmp_path / "out"), workers=2, profile=True, trace_path=trace_path)
+    results = exporter.run(paths)
+    assert all(r.ok for r in results)
+    assert not instrumentation.is_enabled()
+
+    summary = exporter.last_summary
+    for name in ("decode", "text_composite", "encode", "write"):
+        assert summary["stages"][name]["count"] == len(paths)
+    assert summary["counters"]["images"] == len(paths)
+    assert summary["counters"]["bytes_read"] == sum(p.stat().st_size for p in paths)
+    assert summary["counters"]["bytes_written"] == sum(r.output.stat().st_size for r in results)
+
+    trace = json.loads(trace_path.read_text(encoding="utf-8"))
+    assert {e["name"] for e in trace["traceEvents"]} >= {"batch", "decode", "encode", "write"}
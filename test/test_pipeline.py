@@ -0,0 +1,80 @@
+import sys
+import threading
+import time
+from pathlib import Path
+from PIL import Image, ImageChops
+
+# 添加项目根目录到 sys.path
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from watermark.batch import BatchExporter
+from watermark.pipeline import Finished, Pipeline, Stage
+
+
+def test_pipeline_overlaps_stages_and_keeps_order():
+    in_flight, peak = [0], [0]
+    lock = threading.Lock()
+
+    def enter(x):
+        with lock:
+            in_flight[0] += 1
+            peak[0] = max(peak[0], in_flight[0])
+        time.sleep(0.02)
+        return x
+
+    def middle(x):
+        time.sleep(0.02)
+        if x == 3:
+            raise ValueError("bad item")
+        return Finished(-x) if x == 5 else x
+
+    def leave(x):
+        time.sleep(0.02)
+        return x * 10
+
+    pipeline = Pipeline([Stage("a", enter), Stage("b", middle), Stage("c", leave)], queue_size=1, max_in_flight=4)
+    start = time.perf_counter()
+    results = []
+    for entry in pipeline.map(range(12), skip=lambda x: "skipped" if x == 7 else None):
+        results.append(entry)
+        if entry[0] != 7:
+            with lock:
+                in_flight[0] -= 1
+    elapsed = time.perf_counter() - start
+
+    assert [item for item, _, _ in results] == list(range(12))
+    assert results[3][2] is not None and results[5][1] == -5 and results[7][1] == "skipped"
+    assert results[11] == (11, 110, None)
+    # 三个阶段重叠执行：明显快于逐项串行的 11 × 3 × 20ms
+    assert elapsed < 11 * 3 * 0.02 * 0.7
+    # 已进入流水线但尚未被取走的项目不超过 max_in_flight
+    assert peak[0] <= 4
+
+    stats = pipeline.stats()
+    assert list(stats) == ["a", "b", "c"]
+    assert stats["a"]["items"] == 11 and stats["c"]["items"] == 9
+    assert all(s["max_queue"] <= 1 for s in stats.values())
+
+
+def test_pipelined_batch_matches_serial_export(tmp_path):
+    src = tmp_path / "in"
+    src.mkdir()
+    paths = []
+    for i, fmt in enumerate(("png", "jpg", "bmp")):
+        p = src / f"img_{i}.{fmt}"
+        Image.new("RGB", (300 + i * 20, 200), (60 * i, 90, 160)).save(p)
+        paths.append(p)
+    paths.append(src / "missing.png")
+    settings = {"text_content": "Pipe", "color": [255, 255, 0], "output_format": "PNG", "custom_str": "_wm"}
+
+    serial = BatchExporter(settings, tmp_path / "serial", workers=1, pipeline=False).run(paths)
+    exporter = BatchExporter(settings, tmp_path / "piped", workers=1, stage_threads={"decode": 1})
+    piped = exporter.run(paths)
+
+    assert exporter.pipeline
+    assert [r.ok for r in piped] == [True, True, True, False]
+    for a, b in zip(serial[:3], piped[:3]):
+        with Image.open(a.output) as want, Image.open(b.output) as got:
+            assert ImageChops.difference(want, got).getbbox() is None
+    stats = exporter.last_pipeline_stats
+    assert stats["decode"]["threads"] == 1 and stats["write"]["items"] == 3
@@ -0,0 +1,95 @@
+import pickle
+import sys
+from pathlib import Path
+from PIL import Image, ImageChops
+
+# 添加项目根目录到 sys.path
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from watermark.batch import BatchContext
+from watermark.plan import WatermarkPlan, compute_watermark_position
+from watermark.preview import PreviewManager, PreviewSession
+from watermark.watermark_image import ImageWatermark
+
+LOGO_PATH = Path(__file__).resolve().parents[1] / "assets" / "logo.png"
+
+SETTINGS = {
+    "text_content": "Plan WM",
+    "opacity": 170,
+    "color": [0, 200, 255],
+    "relative_font_size": 7,
+    "is_bold": True,
+    "is_italic": True,
+    "image_path": str(LOGO_PATH),
+    "image_scale": 25,
+    "position_name": "中心",
+    "wm_offset_relative": [0.1, -0.05],
+    "output_format": "PNG",
+}
+
+
+def test_plan_memoises_placement_and_survives_pickling():
+    plan = WatermarkPlan.compile(SETTINGS)
+    size = (640, 480)
+    assert plan.placement(size) == compute_watermark_position(size, SETTINGS)
+    layers = plan.layers(size)
+    assert [layer.stage for layer in layers] == ["text_composite", "logo_composite"]
+    # 同尺寸的第二次查询直接返回缓存的图层
+    assert plan.layers(size) is layers
+
+    copy = pickle.loads(pickle.dumps(plan))
+    assert copy.text.font_path == plan.text.font_path
+    assert copy.layers(size) is not layers
+    base = Image.new("RGB", size, (90, 60, 30))
+    want = plan.apply(base)
+    got = copy.apply(base)
+    assert ImageChops.difference(want, got).getbbox() is None
+
+
+def test_preview_and_export_share_the_same_plan(tmp_path):
+    src = tmp_path / "photo.png"
+    Image.new("RGB", (500, 360), (20, 120, 40)).save(src)
+    # 复用已解码的图片水印，方案结果与从路径编译的一致，且不修改传入的对象
+    decoded = ImageWatermark(str(LOGO_PATH))
+    plan = WatermarkPlan.compile(SETTINGS, image_watermark=decoded)
+    assert decoded.scale == 0.15 and decoded.opacity == 128
+
+    exported = BatchContext(SETTINGS, str(tmp_path), plan).render(src)
+    manager = PreviewManager()
+    manager.set_base_image(Image.open(src).convert("RGBA"))
+    manager.set_plan((plan, plan.placement((500, 360))))
+    preview = manager.generate_preview().convert("RGB")
+    assert ImageChops.difference(exported, preview).getbbox() is None
+
+    reference = BatchContext(SETTINGS, str(tmp_path)).render(src)
+    assert ImageChops.difference(exported, reference).getbbox() is None
+
+
+def test_preview_session_compiles_once_per_settings():
+    session = PreviewSession()
+    settings = {"text_content": "Session", "relative_font_size": 8}
+    assert session.cached_plan(settings) is None
+    plan = session.plan(settings)
+    assert session.plan(dict(settings)) is plan
+    assert session.cached_plan(dict(settings)) is plan
+
+    changed = dict(settings, opacity=90)
+    assert session.cached_plan(changed) is None
+    assert session.plan(changed) is not plan
+
+
+def test_preview_session_decodes_once_and_scales_position(tmp_path):
+    src = tmp_path / "big.png"
+    Image.new("RGB", (2000, 1000), (40, 80, 120)).save(src)
+    session = PreviewSession(max_size=(500, 500))
+
+    frame = session.render(str(src), SETTINGS)
+    assert frame.original_size == (2000, 1000)
+    assert frame.base_image.size == frame.image.size == (500, 250)
+    assert frame.scale == 0.25
+    wm_pos = compute_watermark_position((2000, 1000), SETTINGS)
+    assert frame.position == (int(wm_pos[0] * 0.25), int(wm_pos[1] * 0.25))
+
+    # 同一张图片只解码一次，设置不变时复用方案
+    again = session.render(str(src), SETTINGS)
+    assert again.base_image is frame.base_image and again.plan is frame.plan
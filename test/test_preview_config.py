@@ -7,7 +7,7 @@ sys.path.append(str(Path(__file__).resolve().parents[1]))
 
 from watermark.watermark_text import TextWatermark
 from watermark.watermark_image import ImageWatermark
-from watermark.preview import PreviewManager
+from watermark.preview import PreviewManager, load_preview_image
 from watermark.config_manager import ConfigManager
 
 
@@ -20,6 +20,16 @@ def create_sample_image(path: Path):
     return path
 
 
+def test_load_preview_image_decodes_at_preview_size(tmp_path):
+    """大尺寸 JPEG 直接解码到预览尺寸，同时返回原图尺寸"""
+    src = tmp_path / "large.jpg"
+    Image.new("RGB", (4000, 2800), (120, 30, 60)).save(src, quality=90)
+    preview_img, original_size = load_preview_image(src, (1280, 1280))
+    assert original_size == (4000, 2800)
+    assert preview_img.size == (1280, 896)
+    assert preview_img.mode == "RGBA"
+
+
 def main():
     # 准备目录
     input_dir = Path("test_inputs")
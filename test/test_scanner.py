@@ -0,0 +1,66 @@
+import os
+import sys
+import threading
+from pathlib import Path
+
+# 添加项目根目录到 sys.path
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from watermark.file_manager import FileManager
+from watermark.scanner import scan_paths
+
+EXTS = FileManager.SUPPORTED_INPUT_FORMATS
+
+
+def make_tree(root: Path):
+    """2024/01/01 形式的嵌套目录，每层放两张图片和一个无关文件"""
+    files = []
+    folder = root
+    for part in ["2024", "01", "01"]:
+        folder = folder / part
+        folder.mkdir(parents=True, exist_ok=True)
+        for name in ("IMG_a.jpg", "b.png"):
+            (folder / name).write_bytes(b"x")
+            files.append(folder / name)
+        (folder / "notes.txt").write_text("x")
+    return files
+
+
+def test_scan_recursion_depth_and_patterns(tmp_path):
+    make_tree(tmp_path)
+    top = tmp_path / "2024"
+
+    assert [p.name for p in scan_paths([top], extensions=EXTS)] == ["IMG_a.jpg", "b.png"]
+    assert len(list(scan_paths([top], recursive=True, extensions=EXTS))) == 6
+    assert len(list(scan_paths([top], recursive=True, max_depth=1, extensions=EXTS))) == 4
+
+    found = list(scan_paths([top], recursive=True, patterns=["IMG_*"], extensions=EXTS))
+    assert [p.relative_to(top).as_posix() for p in found] == ["IMG_a.jpg", "01/IMG_a.jpg", "01/01/IMG_a.jpg"]
+
+
+def test_scan_dedupes_across_roots_and_cancels(tmp_path):
+    files = make_tree(tmp_path)
+    top = tmp_path / "2024"
+    seen = set()
+
+    first = list(scan_paths([top, files[0]], recursive=True, extensions=EXTS, seen=seen))
+    assert len(first) == 6
+    assert list(scan_paths([top / "01", str(top) + os.sep + "."], recursive=True, extensions=EXTS, seen=seen)) == []
+
+    cancel = threading.Event()
+    scanned = []
+    for p in scan_paths([top], recursive=True, extensions=EXTS, cancel_event=cancel):
+        scanned.append(p)
+        cancel.set()
+    assert len(scanned) == 1
+
+
+def test_file_manager_import_dedupes_and_removes(tmp_path):
+    files = make_tree(tmp_path)
+    fm = FileManager()
+
+    assert len(fm.import_folder(str(tmp_path / "2024"), recursive=True)) == 6
+    assert fm.import_files([str(files[0]), str(files[0])]) == []
+    assert fm.remove_files([files[0], tmp_path / "missing.jpg"]) == 1
+    assert len(fm.get_imported_files()) == 5
+    assert fm.import_files([str(files[0])]) == [files[0]]
@@ -0,0 +1,103 @@
+import sys
+from pathlib import Path
+from PIL import Image, ImageDraw, ImageChops
+
+# 添加项目根目录到 sys.path
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from watermark.watermark_text import TextWatermark, _sprite_cache
+from watermark.watermark_image import ImageWatermark
+
+LOGO_PATH = Path(__file__).resolve().parents[1] / "assets" / "logo.png"
+
+
+def create_base_image(size=(640, 400)):
+    """生成一张带色块的底图"""
+    img = Image.new("RGB", size, color=(30, 120, 200))
+    ImageDraw.Draw(img).rectangle((0, 0, size[0] // 2, size[1] // 2), fill=(250, 10, 10))
+    return img
+
+
+def reference_text_apply(tw: TextWatermark, img: Image.Image, position):
+    """整幅文字图层 + 整幅 alpha 合成的参考实现"""
+    base = img.convert("RGBA")
+    font = tw._load_font(tw.pixel_font_size(img.size))
+    txt_layer = Image.new("RGBA", base.size, (255, 255, 255, 0))
+    fill = (*tw.color, tw.opacity)
+    if tw.italic:
+        bbox = ImageDraw.Draw(Image.new("RGBA", (0, 0))).textbbox((0, 0), tw.text, font=font)
+        h = bbox[3] - bbox[1]
+        surface = Image.new("RGBA", (int(bbox[2] - bbox[0] + 0.2 * h), h), (255, 255, 255, 0))
+        tw._draw_text_with_bold(ImageDraw.Draw(surface), (-bbox[0], -bbox[1]), font, fill)
+        italic_surface = tw._apply_italic(surface)
+        txt_layer.paste(italic_surface, (int(position[0]), int(position[1])), italic_surface)
+    else:
+        tw._draw_text_with_bold(ImageDraw.Draw(txt_layer), (int(position[0]), int(position[1])), font, fill)
+    return Image.alpha_composite(base, txt_layer)
+
+
+def test_text_sprite_matches_full_layer():
+    base = create_base_image()
+    for bold in (False, True):
+        for italic in (False, True):
+            for position in [(10, 10), (-20, -5), (600, 380), (100.7, 50.2)]:
+                tw = TextWatermark("Sprite 水印", relative_font_size=8, color=(10, 200, 30),
+                                   opacity=150, bold=bold, italic=italic)
+                expected = reference_text_apply(tw, base, position)
+                assert ImageChops.difference(tw.apply(base, position), expected).getbbox() is None
+
+
+def test_text_sprite_rendered_once_per_batch():
+    _sprite_cache.clear()
+    before = _sprite_cache.stats()
+    for i in range(5):
+        tw = TextWatermark("Batch", relative_font_size=6, color=(255, 255, 255), opacity=128)
+        tw.apply(create_base_image(), position=(i * 10, i * 10))
+    after = _sprite_cache.stats()
+    assert after["misses"] - before["misses"] == 1
+    assert after["hits"] - before["hits"] == 4
+
+
+def reference_image_apply(iw: ImageWatermark, img: Image.Image, position):
+    """每次都重新缩放、逐像素调整透明度的参考实现"""
+    base = img.convert("RGBA")
+    w = max(1, int(iw.original_width * iw.scale))
+    h = max(1, int(iw.original_height * iw.scale))
+    resized = iw.original_watermark.resize((w, h), Image.Resampling.LANCZOS)
+    if iw.opacity < 255:
+        resized.putalpha(resized.split()[3].point(lambda p: int(p * (iw.opacity / 255.0))))
+    base.paste(resized, (int(position[0] - w / 2), int(position[1] - h / 2)), resized)
+    return base
+
+
+def test_logo_sprite_matches_reference_and_is_cached():
+    base = create_base_image()
+    iw = ImageWatermark(str(LOGO_PATH))
+    for scale, opacity in [(0.3, 200), (1.5, 255), (0.01, 17), (0.3, 200)]:
+        iw.scale, iw.opacity = scale, opacity
+        expected = reference_image_apply(iw, base, (320, 200))
+        assert ImageChops.difference(iw.apply(base, (320, 200)), expected).getbbox() is None
+
+    stats = iw._sprite_cache.stats()
+    assert stats["misses"] == 3
+    assert stats["hits"] == 1
+
+
+def test_in_place_compositing_keeps_source_mode():
+    logo = ImageWatermark(str(LOGO_PATH), opacity=200, scale=0.5)
+    tw = TextWatermark("ROI", relative_font_size=10, color=(255, 0, 0), opacity=160, bold=True)
+
+    rgb = create_base_image()
+    expected = logo.apply(tw.apply(rgb, (40, 30)), (100, 80)).convert("RGB")
+    target = rgb.copy()
+    result = logo.apply(tw.apply(target, (40, 30), in_place=True), (100, 80), in_place=True)
+    assert result is target and result.mode == "RGB"
+    assert ImageChops.difference(result, expected).getbbox() is None
+
+    # 灰色文字可以直接合成到 L 模式底图；彩色 logo 无法保持 L，会转换为 RGBA
+    gray = create_base_image().convert("L")
+    gray_tw = TextWatermark("ROI", relative_font_size=10, color=(200, 200, 200), opacity=160)
+    expected = gray_tw.apply(gray, (40, 30)).convert("L")
+    result = gray_tw.apply(gray, (40, 30), in_place=True)
+    assert result is gray and result.mode == "L"
+    assert ImageChops.difference(result, expected).getbbox() is None
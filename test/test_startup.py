@@ -0,0 +1,34 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+# 添加项目根目录到 sys.path
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+pytest.importorskip("PyQt6.QtCore")
+
+from watermark.config_manager import ConfigManager
+from ui.startup import load_startup_state
+
+LOGO_PATH = Path(__file__).resolve().parents[1] / "assets" / "logo.png"
+
+
+def test_load_startup_state_restores_session_and_decodes_logo(tmp_path):
+    cm = ConfigManager(str(tmp_path))
+    cm.save_template("1", {"text_content": "a"})
+    cm.save_template("_last_session", {"text_content": "b", "image_path": str(LOGO_PATH)})
+
+    state = load_startup_state(cm)
+    assert state.templates == ["1"]
+    assert state.last_settings["text_content"] == "b"
+    assert state.image_watermark.watermark_path == LOGO_PATH
+    assert state.image_watermark.original_watermark.size[0] > 0
+
+
+def test_load_startup_state_without_session(tmp_path):
+    (tmp_path / "_last_session.json").write_text("{broken", encoding="utf-8")
+    state = load_startup_state(ConfigManager(str(tmp_path)))
+    assert state.templates == []
+    assert state.last_settings is None
+    assert state.image_watermark is None
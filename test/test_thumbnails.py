@@ -0,0 +1,73 @@
+import os
+import sys
+from pathlib import Path
+from PIL import Image
+
+# 添加项目根目录到 sys.path
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from watermark.thumbnails import ThumbnailCache, make_thumbnail
+
+
+def test_jpeg_thumbnail_uses_reduced_decode(tmp_path):
+    src = tmp_path / "big.jpg"
+    Image.new("RGB", (4000, 3000), (10, 20, 30)).save(src, quality=90)
+    thumb = make_thumbnail(src, 64)
+    assert thumb.size == (64, 48)
+
+
+def test_thumbnail_cache_keyed_by_mtime(tmp_path, monkeypatch):
+    src = tmp_path / "a.png"
+    Image.new("RGB", (300, 200), (200, 0, 0)).save(src)
+    cache = ThumbnailCache(cache_dir=tmp_path / "cache", size=64)
+
+    assert cache.load(src).getpixel((10, 10))[:3] == (200, 0, 0)
+    first = cache.cache_path(src)
+    assert first.exists()
+    # 命中缓存时直接读取磁盘上的缩略图，不再解码原图
+    cache_hits = []
+    original_open = Image.open
+    def counting_open(fp, *args, **kwargs):
+        cache_hits.append(Path(fp))
+        return original_open(fp, *args, **kwargs)
+    monkeypatch.setattr(Image, "open", counting_open)
+    cache.load(src)
+    monkeypatch.undo()
+    assert cache_hits == [first]
+
+    # 原图被修改后生成新的缩略图
+    Image.new("RGB", (300, 200), (0, 200, 0)).save(src)
+    os.utime(src, ns=(1_000_000_000, 1_000_000_000))
+    assert cache.cache_path(src) != first
+    assert cache.load(src).getpixel((10, 10))[:3] == (0, 200, 0)
+    assert cache.cache_path(src).exists()
+
+
+def test_cache_io_errors_still_return_thumbnail(tmp_path):
+    src = tmp_path / "a.png"
+    Image.new("RGB", (300, 200), (200, 0, 0)).save(src)
+    blocker = tmp_path / "not_a_dir"
+    blocker.write_text("")
+
+    # 缓存目录无法创建：只在内存中生成
+    cache = ThumbnailCache(cache_dir=blocker / "cache", size=64)
+    assert cache.cache_dir is None and cache.cache_path(src) is None
+    assert cache.load(src).size == (64, 43)
+
+    # 磁盘已满等写入错误：返回缩略图但不落盘
+    cache = ThumbnailCache(cache_dir=tmp_path / "cache", size=64)
+    def disk_full(thumb, thumb_path):
+        raise OSError(28, "No space left on device")
+    cache._write = disk_full
+    assert cache.load(src).getpixel((10, 10))[:3] == (200, 0, 0)
+    assert not cache.cache_path(src).exists()
+
+    # 原图本身无法解码时仍然报错
+    bad = tmp_path / "bad.png"
+    bad.write_bytes(b"not an image")
+    try:
+        cache.load(bad)
+    except OSError:
+        pass
+    else:
+        raise AssertionError("无法解码的图片应抛出异常")
@@ -0,0 +1,214 @@
+import sys
+from pathlib import Path
+import pytest
+from PIL import Image, ImageChops, ImageDraw
+
+# 添加项目根目录到 sys.path
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from watermark import tiled
+from watermark.batch import BatchExporter
+from watermark.tiled import BandReader
+
+LOGO_PATH = Path(__file__).resolve().parents[1] / "assets" / "logo.png"
+
+
+def make_source(path: Path, mode: str = "RGB", size=(640, 900)):
+    img = Image.linear_gradient("L").resize(size)
+    if mode == "RGB":
+        img = Image.merge("RGB", (img, img.rotate(90), img.transpose(Image.Transpose.FLIP_LEFT_RIGHT)))
+    ImageDraw.Draw(img).text((20, 20), "large scan", fill=0)
+    # 默认不压缩的 TIFF，可以按行带直接读取
+    img.save(path)
+    return img
+
+
+def settings(**overrides):
+    s = {
+        "text_content": "Tiled WM",
+        "opacity": 180,
+        "color": [255, 0, 0],
+        "relative_font_size": 8,
+        "image_path": str(LOGO_PATH),
+        "image_scale": 30,
+        "position_name": "下中",
+        "wm_offset_relative": [0.0, 0.05],
+        "name_rule": "suffix",
+        "custom_str": "_wm",
+        "output_format": "PNG",
+    }
+    s.update(overrides)
+    return s
+
+
+def test_band_reader_streams_uncompressed_tiff(tmp_path):
+    src = tmp_path / "scan.tif"
+    original = make_source(src)
+    original.save(tmp_path / "scan_lzw.tif", compression="tiff_lzw")
+
+    reader = BandReader(src)
+    assert reader.decoding == "raw"
+    band = reader.read(300, 437)
+    assert band.size == (640, 137)
+    assert ImageChops.difference(band, original.crop((0, 300, 640, 437))).getbbox() is None
+
+    # 压缩的 TIFF 逐个条带解码，结果相同
+    chunked = BandReader(tmp_path / "scan_lzw.tif")
+    assert chunked.decoding == "chunked"
+    assert ImageChops.difference(chunked.read(300, 437), band).getbbox() is None
+
+
+def test_band_reader_decodes_compressed_tiff_chunk_by_chunk(tmp_path):
+    original = make_source(tmp_path / "src.tif", size=(300, 250))
+    strips = tmp_path / "strips.tif"
+    original.save(strips, compression="tiff_deflate", tiffinfo={317: 2, 278: 40})
+    tiles = tmp_path / "tiles.tif"
+    with open(tiles, "wb") as f:
+        writer = tiled.TiffTileWriter(f, original.size, "RGB", tile=64, predictor=2)
+        writer.write(original)
+        writer.close()
+
+    for src, chunks in ((strips, 7), (tiles, 20)):
+        reader = BandReader(src)
+        assert reader.decoding == "chunked" and len(reader._chunks) == chunks
+        # 相邻行带可以重叠（缩放时的滤波支撑），跨越条带/分块边界
+        for top, bottom in ((0, 50), (30, 130), (120, 250)):
+            band = reader.read(top, bottom)
+            assert ImageChops.difference(band, original.crop((0, top, 300, bottom))).getbbox() is None
+        # 已在行带之上的条带/分块不再缓存
+        assert all(reader._chunks[i][0][3] > 120 for i in reader._cache)
+        reader.close()
+
+    # 只有一个条带时只能整幅解码
+    single = tmp_path / "single.tif"
+    original.save(single, compression="tiff_deflate", tiffinfo={278: 250})
+    assert BandReader(single).decoding == "full"
+
+
+def test_band_reader_full_decode_warns_or_rejects(tmp_path, monkeypatch, capsys):
+    src = tmp_path / "photo.jpg"
+    make_source(tmp_path / "src.tif", size=(400, 320)).save(src, quality=95)
+
+    reader = BandReader(src)
+    assert reader.decoding == "full" and reader.size == (400, 320)
+    assert "[WARN] photo.jpg 无法按行带解码" in capsys.readouterr().out
+
+    # 缩小导出时 JPEG 按 DCT 缩放解码
+    reader = BandReader(src, draft_size=(100, 80))
+    assert reader.size == (100, 80)
+    assert reader.read(0, 80).size == (100, 80)
+    reader.close()
+
+    # 整幅解码仍受 Pillow 的解压炸弹上限约束
+    monkeypatch.setattr(Image, "MAX_IMAGE_PIXELS", 10_000)
+    with pytest.raises(Image.DecompressionBombError):
+        BandReader(src)
+    assert BandReader(src, draft_size=(50, 40)).size == (50, 40)
+
+
+def test_band_reader_streams_tiled_and_bilevel_tiff(tmp_path):
+    # 分块存储（右侧与底部的分块超出图片）的未压缩 TIFF 与 1 位黑白 TIFF 同样按行带直接读取
+    for mode in ("RGB", "L"):
+        original = make_source(tmp_path / f"src_{mode}.tif", mode, size=(200, 150))
+        src = tmp_path / f"tiles_{mode}.tif"
+        with open(src, "wb") as f:
+            writer = tiled.TiffTileWriter(f, original.size, mode, tile=64, compression="raw")
+            writer.write(original)
+            writer.close()
+        reader = BandReader(src)
+        assert reader.decoding == "raw" and len(reader._tiles) == 12
+        band = reader.read(50, 130)
+        assert ImageChops.difference(band, original.crop((0, 50, 200, 130))).getbbox() is None
+
+    bilevel = make_source(tmp_path / "gray.tif", "L", size=(203, 90)).convert("1")
+    bilevel.save(tmp_path / "bilevel.tif")
+    reader = BandReader(tmp_path / "bilevel.tif")
+    assert reader.decoding == "raw"
+    band = reader.read(17, 60)
+    assert ImageChops.difference(band, bilevel.crop((0, 17, 203, 60)).convert(band.mode)).getbbox() is None
+
+
+def test_tiled_export_matches_whole_image_export(tmp_path, monkeypatch):
+    sources = [tmp_path / "in" / "rgb.tif", tmp_path / "in" / "gray.tif"]
+    sources[0].parent.mkdir()
+    make_source(sources[0], "RGB")
+    make_source(sources[1], "L")
+
+    for fmt in ("PNG", "TIFF"):
+        expected = BatchExporter(settings(output_format=fmt), tmp_path / f"whole_{fmt}", workers=1).run(sources)
+        monkeypatch.setattr(tiled, "TILED_PIXEL_THRESHOLD", 1000)
+        monkeypatch.setattr(tiled, "BAND_HEIGHT", 64)
+        actual = BatchExporter(settings(output_format=fmt), tmp_path / f"tiled_{fmt}", workers=1).run(sources)
+        monkeypatch.undo()
+
+        for a, b in zip(expected, actual):
+            assert a.ok and b.ok and b.output.suffix == (".png" if fmt == "PNG" else ".tif")
+            with Image.open(a.output) as want, Image.open(b.output) as got:
+                assert got.mode == want.mode and got.size == want.size
+                assert ImageChops.difference(got, want).getbbox() is None
+
+
+def test_scaled_tiled_export_matches_whole_image_export(tmp_path, monkeypatch):
+    src = tmp_path / "in" / "rgb.tif"
+    src.parent.mkdir()
+    make_source(src, "RGB")
+    s = settings(scale_percent=37)
+
+    expected, = BatchExporter(s, tmp_path / "whole", workers=1).run([src])
+    monkeypatch.setattr(tiled, "TILED_PIXEL_THRESHOLD", 1000)
+    monkeypatch.setattr(tiled, "BAND_HEIGHT", 64)
+    actual, = BatchExporter(s, tmp_path / "tiled", workers=1).run([src])
+
+    assert expected.ok and actual.ok
+    with Image.open(expected.output) as want, Image.open(actual.output) as got:
+        assert got.size == want.size == (236, 333)
+        # 逐带缩放与整幅缩放的取整可能相差 1 级
+        assert max(hi for _, hi in ImageChops.difference(got, want).getextrema()) <= 1
+
+
+def test_tiled_jpeg_output_rejects_oversized_side():
+    with pytest.raises(ValueError):
+        tiled.AssembledWriter(None, (70_000, 100), "RGB", "JPEG")
+
+
+def test_open_large_leaves_global_pixel_limit_alone(tmp_path, monkeypatch):
+    src = tmp_path / "scan.tif"
+    make_source(src, size=(400, 300))
+    # 把 Pillow 的上限调到远低于图片大小：其他调用方的 Image.open 仍然拒绝，open_large 只按自己的上限检查
+    monkeypatch.setattr(Image, "MAX_IMAGE_PIXELS", 10_000)
+    with pytest.raises(Image.DecompressionBombError):
+        Image.open(src)
+
+    with tiled.open_large(src) as img:
+        assert img.size == (400, 300)
+        assert Image.MAX_IMAGE_PIXELS == 10_000
+    assert tiled.needs_tiling(src, threshold=1000)
+
+    monkeypatch.setattr(tiled, "TILED_PIXEL_LIMIT", 100_000)
+    with pytest.raises(Image.DecompressionBombError):
+        tiled.open_large(src)
+
+
+def test_fast_profile_writes_uncompressed_tiled_tiff(tmp_path, monkeypatch):
+    src = tmp_path / "in" / "rgb.tif"
+    src.parent.mkdir()
+    original = make_source(src, "RGB", size=(600, 300))
+    monkeypatch.setattr(tiled, "TILED_PIXEL_THRESHOLD", 1000)
+    monkeypatch.setattr(tiled, "BAND_HEIGHT", 64)
+
+    outputs = {}
+    for profile in ("fast", "balanced", "smallest"):
+        s = settings(output_format="TIFF", encode_profile=profile, text_content="", image_path=None)
+        result, = BatchExporter(s, tmp_path / profile, workers=1).run([src])
+        assert result.ok
+        outputs[profile] = result.output
+
+    with Image.open(outputs["fast"]) as fast, Image.open(outputs["balanced"]) as balanced:
+        assert fast.info["compression"] == "raw" and balanced.info["compression"] == "tiff_adobe_deflate"
+        assert ImageChops.difference(fast, original).getbbox() is None
+        assert ImageChops.difference(balanced, original).getbbox() is None
+    # smallest 加水平差分预测，仍为无损，且比 balanced 小
+    with Image.open(outputs["smallest"]) as smallest:
+        assert smallest.tag_v2[317] == 2
+        assert ImageChops.difference(smallest, original).getbbox() is None
+    assert outputs["smallest"].stat().st_size < outputs["balanced"].stat().st_size
@@ -14,6 +14,8 @@ from PyQt6.QtGui import QColor
 # 动态添加项目根目录到Python路径
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
+from ui.export_panel import ExportProgressPanel
+from watermark.file_manager import FileManager
 from watermark.watermark_image import ImageWatermark
 
 
@@ -125,13 +127,18 @@ class Controls(QWidget):
         self.layout.addWidget(self.custom_str_input)
         self.layout.addWidget(QLabel("导出格式"))
         self.format_combo = QComboBox()
-        self.format_combo.addItems(["PNG", "JPEG"])
+        self.format_combo.addItems(["PNG", "JPEG", "TIFF"])
         self.layout.addWidget(self.format_combo)
         self.layout.addWidget(QLabel("JPEG 压缩质量"))
         self.jpeg_quality_slider = QSlider(Qt.Orientation.Horizontal)
         self.jpeg_quality_slider.setRange(1, 100)
         self.jpeg_quality_slider.setValue(90)
         self.layout.addWidget(self.jpeg_quality_slider)
+        self.layout.addWidget(QLabel("编码方案（fast 最快 / balanced 默认 / smallest 文件最小）"))
+        self.encode_profile_combo = QComboBox()
+        self.encode_profile_combo.addItems(list(FileManager.ENCODE_PROFILES))
+        self.encode_profile_combo.setCurrentText(FileManager.DEFAULT_ENCODE_PROFILE)
+        self.layout.addWidget(self.encode_profile_combo)
         self.layout.addWidget(QLabel("输出图片缩放比例 (%)"))
         self.scale_spinbox = QSpinBox()
         self.scale_spinbox.setRange(10, 500)
@@ -145,8 +152,13 @@ class Controls(QWidget):
         import_layout.addWidget(self.import_btn)
         import_layout.addWidget(self.import_folder_btn)
         self.layout.addLayout(import_layout)
+        self.recursive_checkbox = QCheckBox("导入文件夹时包含子文件夹")
+        self.layout.addWidget(self.recursive_checkbox)
         
         self.layout.addWidget(self.export_btn)
+        # 导出进度（导出进行中时显示）
+        self.export_panel = ExportProgressPanel()
+        self.layout.addWidget(self.export_panel)
         self.layout.addStretch()
 
         # --- 绑定内部信号 ---
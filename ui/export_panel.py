@@ -0,0 +1,88 @@
+# ui/export_panel.py
+
+import sys
+import os
+from typing import Optional
+
+from PyQt6.QtWidgets import QWidget, QVBoxLayout, QHBoxLayout, QLabel, QProgressBar, QPushButton
+from PyQt6.QtCore import pyqtSignal
+
+# 动态添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from watermark.batch import BatchProgress
+
+
+def format_duration(seconds: Optional[float]) -> str:
+    """把秒数格式化为 "1:05" / "1:02:05"；未知时返回 "--" """
+    if seconds is None:
+        return "--"
+    seconds = int(round(seconds))
+    hours, rest = divmod(seconds, 3600)
+    minutes, secs = divmod(rest, 60)
+    return f"{hours}:{minutes:02d}:{secs:02d}" if hours else f"{minutes}:{secs:02d}"
+
+
+class ExportProgressPanel(QWidget):
+    """
+    批量导出进度面板：进度条、已完成/总数、速率、剩余时间、失败数和取消按钮。
+    空闲时隐藏，start() 后显示。
+    """
+    cancelRequested = pyqtSignal()
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        layout = QVBoxLayout()
+        layout.setContentsMargins(0, 0, 0, 0)
+        self.setLayout(layout)
+
+        self.progress_bar = QProgressBar()
+        self.progress_bar.setTextVisible(True)
+        layout.addWidget(self.progress_bar)
+
+        status_layout = QHBoxLayout()
+        self.status_label = QLabel()
+        self.status_label.setWordWrap(True)
+        self.cancel_btn = QPushButton("取消")
+        self.cancel_btn.clicked.connect(self._on_cancel)
+        status_layout.addWidget(self.status_label, 1)
+        status_layout.addWidget(self.cancel_btn)
+        layout.addLayout(status_layout)
+
+        self.hide()
+
+    def start(self, total: Optional[int]):
+        self.progress_bar.setRange(0, total or 0)  # 总数未知时显示忙碌状态
+        self.progress_bar.setValue(0)
+        self.status_label.setText("正在准备导出…")
+        self.cancel_btn.setEnabled(True)
+        self.cancel_btn.setText("取消")
+        self.show()
+
+    def update_progress(self, progress: BatchProgress):
+        if progress.total:
+            self.progress_bar.setValue(min(progress.done, progress.total))
+        self.status_label.setText(self.describe(progress))
+
+    def finish(self, progress: BatchProgress):
+        self.update_progress(progress)
+        self.cancel_btn.setEnabled(False)
+        prefix = "已取消 · " if progress.cancelled else "已完成 · "
+        self.status_label.setText(prefix + self.describe(progress, with_eta=False))
+
+    @staticmethod
+    def describe(progress: BatchProgress, with_eta: bool = True) -> str:
+        """例如 "12/100 · 3.4 张/秒 · 剩余 0:26 · 失败 1" """
+        total = progress.total if progress.total is not None else "?"
+        parts = [f"{progress.done}/{total}", f"{progress.rate:.1f} 张/秒"]
+        if with_eta:
+            parts.append(f"剩余 {format_duration(progress.eta)}")
+        if progress.skipped:
+            parts.append(f"跳过 {progress.skipped}")
+        parts.append(f"失败 {progress.failed}")
+        return " · ".join(parts)
+
+    def _on_cancel(self):
+        self.cancel_btn.setEnabled(False)
+        self.cancel_btn.setText("正在取消…")
+        self.cancelRequested.emit()
@@ -0,0 +1,86 @@
+# ui/export_worker.py
+
+import sys
+import os
+import threading
+import time
+from dataclasses import replace
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional
+
+from PyQt6.QtCore import QThread, pyqtSignal
+
+# 动态添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from watermark.batch import BatchExporter, BatchProgress, ExportResult
+from watermark.plan import WatermarkPlan
+
+
+class ExportWorker(QThread):
+    """
+    在后台线程运行批量导出，界面保持响应。
+    进度通过 progress 信号（BatchProgress 的快照）交给 GUI 线程，按时间间隔合并，
+    避免成千上万张小图时信号过多；cancel() 后处理中的图片收尾即结束，已导出的文件保留。
+    """
+    progress = pyqtSignal(object)
+    # 导出结束（含取消与异常），参数为 (按输入顺序的 ExportResult 列表, 最终的 BatchProgress)
+    exportFinished = pyqtSignal(list, object)
+
+    PROGRESS_INTERVAL = 0.1  # 秒
+
+    def __init__(
+        self,
+        settings: Dict[str, Any],
+        paths: Iterable[Path],
+        output_dir: str,
+        total: Optional[int] = None,
+        plan: Optional[WatermarkPlan] = None,
+        parent=None,
+    ):
+        super().__init__(parent)
+        self.settings = settings
+        self.paths = paths
+        self.output_dir = output_dir
+        self.total = total
+        self.plan = plan
+        self._cancel = threading.Event()
+        self._last_emit = 0.0
+        # 导出整体失败（如水印文件无法读取）时的错误信息
+        self.error: Optional[str] = None
+
+    def cancel(self):
+        self._cancel.set()
+
+    def is_cancelled(self) -> bool:
+        return self._cancel.is_set()
+
+    def run(self):
+        results: List[ExportResult] = []
+        exporter = BatchExporter(
+            self.settings,
+            self.output_dir,
+            plan=self.plan,
+            progress_callback=self._on_progress,
+            cancel_event=self._cancel,
+        )
+        try:
+            for result in exporter.iter_run(self.paths, self.total):
+                results.append(result)
+        except Exception as e:
+            self.error = str(e)
+            print(f"[ERROR] 批量导出失败: {e}")
+        final = exporter.last_progress or BatchProgress(total=self.total)
+        self.progress.emit(_snapshot(final))
+        self.exportFinished.emit(results, final)
+
+    def _on_progress(self, progress: BatchProgress):
+        now = time.monotonic()
+        if now - self._last_emit >= self.PROGRESS_INTERVAL:
+            self._last_emit = now
+            self.progress.emit(_snapshot(progress))
+
+
+def _snapshot(progress: BatchProgress) -> BatchProgress:
+    # 导出线程会继续修改同一个对象，交给 GUI 线程的是一份副本
+    return replace(progress)
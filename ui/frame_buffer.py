@@ -0,0 +1,79 @@
+# ui/frame_buffer.py
+
+import threading
+from typing import Callable, Dict, List, Tuple, Union
+
+from PyQt6.QtGui import QImage
+from PIL import Image
+
+
+class Frame:
+    """
+    一帧 RGBA 预览图：PIL 图片（image）与 QImage 共享同一块预分配的内存，
+    在 PIL 中合成的结果不经复制即可交给 Qt。
+    QImage 不拥有这块内存，只能在持有 Frame 的期间使用；
+    Frame 被释放（引用计数归零）时内存自动归还帧池，供下一帧复用。
+    """
+    __slots__ = ("size", "data", "image", "_pool")
+
+    def __init__(self, size: Tuple[int, int], data: bytearray, pool: "FramePool" = None):
+        self.size = size
+        self.data = data
+        self._pool = pool
+        # bytearray 可写，PIL 默认把映射的缓冲视为只读，写入前会复制，这里取消只读以便原地合成
+        self.image = Image.frombuffer("RGBA", size, data, "raw", "RGBA", 0, 1)
+        self.image.readonly = 0
+
+    def qimage(self) -> QImage:
+        """返回直接指向帧内存的 QImage（不复制）；调用方需保证使用期间 Frame 仍存活"""
+        w, h = self.size
+        return QImage(self.data, w, h, w * 4, QImage.Format.Format_RGBA8888)
+
+    def __del__(self):
+        if self._pool is not None:
+            self._pool._recycle(self.size, self.data)
+
+
+class FramePool:
+    """
+    按尺寸复用的帧缓冲池（线程安全）：渲染线程取帧合成，界面线程显示，
+    同一尺寸的预览连续更新时不再重复分配整帧内存。
+    正在显示和正在渲染的帧各占一块，max_free 块空闲缓冲即可满足交替使用。
+    """
+
+    def __init__(self, max_free: int = 2):
+        self.max_free = max_free
+        self._free: Dict[Tuple[int, int], List[bytearray]] = {}
+        self._lock = threading.Lock()
+
+    def acquire(self, size: Tuple[int, int]) -> Frame:
+        with self._lock:
+            free = self._free.get(size)
+            data = free.pop() if free else None
+        if data is None:
+            data = bytearray(size[0] * size[1] * 4)
+        return Frame(size, data, self)
+
+    def render(self, size: Tuple[int, int], render_fn: Callable[[Image.Image], Image.Image]) -> Union[Frame, Image.Image]:
+        """
+        取一帧交给 render_fn 原地绘制（render_fn 接收并返回帧的 PIL 图片）。
+        render_fn 返回了另一张图片时（如没有底图时的占位图）原样返回该图片。
+        """
+        frame = self.acquire(size)
+        image = render_fn(frame.image)
+        return frame if image is frame.image else image
+
+    def frame_from(self, img: Image.Image) -> Frame:
+        """把 PIL 图片复制到一帧中（一次复制）"""
+        frame = self.acquire(img.size)
+        frame.image.paste(img if img.mode == "RGBA" else img.convert("RGBA"))
+        return frame
+
+    def _recycle(self, size: Tuple[int, int], data: bytearray):
+        with self._lock:
+            # 尺寸变化后旧尺寸的缓冲不再需要，只保留当前尺寸的
+            free = self._free.setdefault(size, [])
+            if len(self._free) > 1:
+                self._free = {size: free}
+            if len(free) < self.max_free:
+                free.append(data)
@@ -2,30 +2,148 @@
 
 import sys
 import os
-from PyQt6.QtWidgets import QListWidget, QListWidgetItem, QMenu
-from PyQt6.QtCore import Qt
-from PyQt6.QtGui import QPixmap, QIcon
-from pathlib import Path
+from typing import Iterable, List, Optional
+from PyQt6.QtWidgets import QListView, QMenu, QStyle, QAbstractItemView
+from PyQt6.QtCore import Qt, QAbstractListModel, QModelIndex, QTimer, pyqtSignal
+from PyQt6.QtGui import QPixmap, QIcon, QImage, QKeySequence
 
 # 动态添加项目根目录到Python路径，以便能导入watermark模块
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-# --- 新增：从 FileManager 导入格式列表 ---
-from watermark.file_manager import FileManager
-# --- 新增结束 ---
+from ui.thumbnail_loader import ThumbnailLoader
+from watermark.catalog import ImageCatalog, ImageRecord
+from watermark.lru import LRUCache
 
 
-class ImageList(QListWidget):
+class ImageListModel(QAbstractListModel):
+    """
+    以 ImageCatalog 为数据源的列表模型。
+    缩略图只在视图请求可见行的图标时才生成，已生成的图标放在有上限的 LRU 中，
+    列表再长内存也不会随之增长。
+    """
+    ICON_CACHE_SIZE = 2048  # 64x64 图标约 16KB/个
+
+    def __init__(self, catalog: ImageCatalog, loader: ThumbnailLoader, placeholder: QIcon, parent=None):
+        super().__init__(parent)
+        self.catalog = catalog
+        self.loader = loader
+        self.placeholder = placeholder
+        self._icons = LRUCache(maxsize=self.ICON_CACHE_SIZE)
+
+    def rowCount(self, parent=QModelIndex()) -> int:
+        return 0 if parent.isValid() else len(self.catalog)
+
+    def data(self, index: QModelIndex, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid() or index.row() >= len(self.catalog):
+            return None
+        record = self.catalog[index.row()]
+        if role == Qt.ItemDataRole.DisplayRole:
+            return record.name
+        if role == Qt.ItemDataRole.DecorationRole:
+            icon = self._icons.get(record.key)
+            if icon is None:
+                # 视图只为可见行请求图标，缩略图因此是按需生成的
+                self.loader.request(record.path)
+                return self.placeholder
+            return icon
+        if role == Qt.ItemDataRole.ToolTipRole:
+            return record.path
+        if role == Qt.ItemDataRole.UserRole:
+            return record.path
+        return None
+
+    def record(self, row: int) -> ImageRecord:
+        return self.catalog[row]
+
+    def add_paths(self, paths: Iterable) -> List[ImageRecord]:
+        """追加图片（目录负责过滤与去重），返回新加入的记录"""
+        first = len(self.catalog)
+        records = self.catalog.extend(paths)
+        if records:
+            self.beginInsertRows(QModelIndex(), first, first + len(records) - 1)
+            self.endInsertRows()
+        return records
+
+    def remove_rows(self, rows: Iterable[int]) -> List[ImageRecord]:
+        """批量删除行；连续的行合并为一次删除，段数很多时直接重置模型"""
+        rows = sorted(set(r for r in rows if 0 <= r < len(self.catalog)))
+        if not rows:
+            return []
+        ranges = []
+        for r in rows:
+            if ranges and r == ranges[-1][1] + 1:
+                ranges[-1][1] = r
+            else:
+                ranges.append([r, r])
+
+        if len(ranges) > 32:
+            self.beginResetModel()
+            removed = self.catalog.remove_rows(rows)
+            self.endResetModel()
+        else:
+            removed = []
+            # 从后往前删，前面的行号不受影响
+            for start, end in reversed(ranges):
+                self.beginRemoveRows(QModelIndex(), start, end)
+                removed.extend(self.catalog.remove_rows(range(start, end + 1)))
+                self.endRemoveRows()
+        for record in removed:
+            self._icons.discard(record.key)
+        return removed
+
+    def set_thumbnail(self, path: str, icon: QIcon):
+        record = self.catalog.get(path)
+        if record is None:
+            return
+        self._icons.put(record.key, icon)
+        row = self.catalog.row_of(path)
+        index = self.index(row)
+        self.dataChanged.emit(index, index, [Qt.ItemDataRole.DecorationRole])
+
+
+class ImageList(QListView):
+    # 当前图片变化时发出，参数为图片路径（没有选中时为空字符串）
+    currentImageChanged = pyqtSignal(str)
+
     def __init__(self, parent=None):
         super().__init__(parent)
 
         self.setAcceptDrops(True)
         self.setDragEnabled(False)
         self.setDropIndicatorShown(True)
+        self.setSelectionMode(QAbstractItemView.SelectionMode.ExtendedSelection)
+        # 所有行等高，视图不必逐行测量，滚动与插入的开销与总行数无关
+        self.setUniformItemSizes(True)
+        self.setLayoutMode(QListView.LayoutMode.Batched)
         self.fileDroppedCallback = None
 
+        self._placeholder_icon = self.style().standardIcon(QStyle.StandardPixmap.SP_FileIcon)
+        self.thumbnail_loader = ThumbnailLoader(size=64, parent=self)
+        self.thumbnail_loader.thumbnailReady.connect(self._on_thumbnail_ready)
+        self.thumbnail_loader.thumbnailFailed.connect(self._on_thumbnail_failed)
+
+        self.model_: Optional[ImageListModel] = None
+        self.setCatalog(ImageCatalog())
+
+        # 快速滚动时丢弃已滚出视野的缩略图请求，停下后由可见行重新请求
+        self._scroll_settle = QTimer(self)
+        self._scroll_settle.setSingleShot(True)
+        self._scroll_settle.setInterval(100)
+        self._scroll_settle.timeout.connect(self._on_scroll_settled)
+        self.verticalScrollBar().valueChanged.connect(lambda _: self._scroll_settle.start())
+
+    def setCatalog(self, catalog: ImageCatalog):
+        """设置列表对应的图片目录（与 FileManager、导出共用同一份）"""
+        self.model_ = ImageListModel(catalog, self.thumbnail_loader, self._placeholder_icon, self)
+        self.setModel(self.model_)
+        self.selectionModel().currentChanged.connect(self._on_current_changed)
+
+    @property
+    def catalog(self) -> ImageCatalog:
+        return self.model_.catalog
+
     def setFileDroppedCallback(self, callback):
-        """设置文件拖拽后的回调"""
+        """设置文件拖拽后的回调，参数为拖入的文件/文件夹路径列表（由回调方负责扫描）"""
         self.fileDroppedCallback = callback
 
     def dragEnterEvent(self, event):
@@ -45,61 +163,74 @@ class ImageList(QListWidget):
     def dropEvent(self, event):
         """拖拽释放时触发"""
         if event.mimeData().hasUrls():
-            files = []
-            for url in event.mimeData().urls():
-                f = Path(url.toLocalFile())
-                
-                # --- 修改：使用导入的格式列表进行判断 ---
-                if f.is_file() and f.suffix.lower() in FileManager.SUPPORTED_INPUT_FORMATS:
-                    files.append(str(f))
-                elif f.is_dir():
-                    for img in f.iterdir():
-                        if img.suffix.lower() in FileManager.SUPPORTED_INPUT_FORMATS:
-                            files.append(str(img))
-                # --- 修改结束 ---
-
-            if self.fileDroppedCallback and files:
-                self.fileDroppedCallback(files)
+            # 文件夹的遍历与格式过滤交给共享的扫描器，在后台线程进行
+            paths = [url.toLocalFile() for url in event.mimeData().urls() if url.isLocalFile()]
+            if self.fileDroppedCallback and paths:
+                self.fileDroppedCallback(paths)
             event.acceptProposedAction()
         else:
             event.ignore()
 
-    def add_image(self, path: str):
-        path_str = str(path)
-        if not Path(path_str).exists():
-            print(f"[WARN] 文件不存在: {path_str}")
-            return
-        try:
-            pixmap = QPixmap(path_str)
-            if pixmap.isNull():
-                print(f"[WARN] 无法加载图片: {path_str}")
-                return
-            pixmap = pixmap.scaled(64, 64, Qt.AspectRatioMode.KeepAspectRatio)
-            item = QListWidgetItem(Path(path_str).name)
-            item.setIcon(QIcon(pixmap))
-            item.setData(Qt.ItemDataRole.UserRole, path_str)
-            self.addItem(item)
-        except Exception as e:
-            print(f"[ERROR] 添加图片失败 {path_str}: {e}")
+    def add_images(self, paths: Iterable) -> List[ImageRecord]:
+        """添加图片（重复、不存在或不支持的文件会被忽略），缩略图在行可见时才生成"""
+        records = self.model_.add_paths(paths)
+        if records and not self.currentIndex().isValid():
+            self.setCurrentIndex(self.model_.index(0))
+        return records
+
+    def count(self) -> int:
+        return self.model_.rowCount()
 
     def get_selected_image(self) -> str:
         """返回当前选中的图片路径"""
-        item = self.currentItem()
-        if item:
-            return item.data(Qt.ItemDataRole.UserRole)
+        index = self.currentIndex()
+        if index.isValid():
+            return index.data(Qt.ItemDataRole.UserRole)
         return None
 
+    def remove_rows(self, rows: Iterable[int]):
+        """批量删除行，删除后保证仍有一项被选中（列表为空时通知当前图片已清空）"""
+        rows = list(rows)
+        first = min(rows, default=0)
+        self.model_.remove_rows(rows)
+        if self.currentIndex().isValid():
+            return
+        if self.count():
+            self.setCurrentIndex(self.model_.index(min(first, self.count() - 1)))
+        else:
+            self.currentImageChanged.emit("")
+
+    def _on_current_changed(self, current: QModelIndex, previous: QModelIndex):
+        path = current.data(Qt.ItemDataRole.UserRole) if current.isValid() else None
+        self.currentImageChanged.emit(path or "")
+
+    def _on_thumbnail_ready(self, path: str, image: QImage):
+        self.model_.set_thumbnail(path, QIcon(QPixmap.fromImage(image)))
+
+    def _on_thumbnail_failed(self, path: str, error: str):
+        # 与之前同步加载时一致：无法解码的图片不保留在列表中
+        print(f"[WARN] 无法加载图片: {path} ({error})")
+        row = self.catalog.row_of(path)
+        if row >= 0:
+            self.remove_rows([row])
+
+    def _on_scroll_settled(self):
+        self.thumbnail_loader.cancel_pending()
+        self.viewport().update()
+
     def contextMenuEvent(self, event):
         """重写此方法以响应右键点击"""
-        clicked_item = self.itemAt(event.pos())
-        if clicked_item:
+        clicked = self.indexAt(event.pos())
+        if clicked.isValid():
             menu = QMenu(self)
             delete_action = menu.addAction("删除")
             chosen_action = menu.exec(event.globalPos())
             if chosen_action == delete_action:
-                self.delete_item(clicked_item)
+                # 与之前一致只删除点击的那一项；删除全部选中项使用 Delete 键
+                self.remove_rows([clicked.row()])
 
-    def delete_item(self, item_to_delete: QListWidgetItem):
-        """从列表中删除指定的项"""
-        row = self.row(item_to_delete)
-        self.takeItem(row)
\ No newline at end of file
+    def keyPressEvent(self, event):
+        if event.matches(QKeySequence.StandardKey.Delete):
+            self.remove_rows(i.row() for i in self.selectionModel().selectedIndexes())
+            return
+        super().keyPressEvent(event)
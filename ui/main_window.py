@@ -1,27 +1,33 @@
 import sys
 import os
 import json
+import multiprocessing
 from pathlib import Path
 from PIL import Image
 from PyQt6.QtWidgets import (QMainWindow, QWidget, QHBoxLayout, QApplication, 
                              QFileDialog, QMessageBox, QInputDialog)
-from PyQt6.QtCore import Qt, QPoint
+from PyQt6.QtCore import QPoint, QTimer
 
 # 动态添加项目根目录到Python路径
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from ui.image_list import ImageList
 from ui.preview_widget import PreviewWidget
+from ui.preview_renderer import PreviewRenderer
 from ui.controls import Controls
-from watermark.preview import PreviewManager
-from watermark.watermark_text import TextWatermark
+from ui.startup import StartupLoader, load_startup_state
+from ui.scan_worker import ScanWorker
+from ui.export_worker import ExportWorker
+from watermark.preview import PreviewManager, PreviewSession
 from watermark.watermark_image import ImageWatermark
 from watermark.file_manager import FileManager
+from watermark.batch import format_report
+from watermark.plan import compute_watermark_position
 from watermark.config_manager import ConfigManager
 
 
 class MainWindow(QMainWindow):
-    def __init__(self):
+    def __init__(self, deferred_startup: bool = True):
         super().__init__()
         self.setWindowTitle("Photo Watermark App")
         self.resize(1200, 800)
@@ -45,24 +51,33 @@ class MainWindow(QMainWindow):
         self.layout.addWidget(self.controls, 1)
 
         # 后端管理器初始化
-        self.preview_manager = PreviewManager()
+        self.preview_renderer = PreviewRenderer(self)
         self.file_manager = FileManager()
+        self._scan_workers = []
+        self._export_worker = None
         self.config_manager = ConfigManager()
 
         # --- 核心状态变量 ---
         self.wm_offset_relative = (0.0, 0.0)
+        # 图片解码与水印方案编译都在预览线程中进行；这里保存最近一帧所用的方案，供拖拽时生成水印图层
+        self.preview_session = PreviewSession(max_size=(1280, 1280))
+        self._preview_plan = None
         self.current_wm_pos = (0, 0)
+        self.current_scaled_pos = (0, 0)
+        self._drag_overlay_anchor = (0, 0)
         self.dragging = False
         self.drag_offset = QPoint(0, 0)
 
-        # 图片缓存
-        self.current_original_image: Image.Image = None
+        # 图片缓存（由预览线程交回的最近一帧更新）
+        # 只保留原图尺寸，不常驻原图像素
+        self.current_original_size: tuple = None
         self.current_preview_image: Image.Image = None
         self.current_image_path: str = ""
         self.preview_scale_ratio: float = 1.0
 
         # --- 绑定信号 ---
-        self.image_list.currentItemChanged.connect(self.update_preview)
+        self.preview_renderer.rendered.connect(self.on_preview_rendered)
+        self.image_list.currentImageChanged.connect(self.update_preview)
         self.controls.settingsChanged.connect(self.update_preview)
         self.controls.import_btn.clicked.connect(self.import_images)
         self.controls.import_folder_btn.clicked.connect(self.import_folder) # <-- 新增信号连接
@@ -72,14 +87,35 @@ class MainWindow(QMainWindow):
         self.controls.template_combo.activated.connect(self.on_template_selected)
         for pos_name, btn in self.controls.position_buttons.items():
             btn.clicked.connect(lambda checked, name=pos_name: self.set_watermark_position(name))
-        self.image_list.setFileDroppedCallback(self.handle_import_files)
+        self.image_list.setCatalog(self.file_manager.catalog)
+        self.image_list.setFileDroppedCallback(self.import_paths)
         self.preview_widget.label.mousePressEvent = self.preview_mouse_press
         self.preview_widget.label.mouseMoveEvent = self.preview_mouse_move
         self.preview_widget.label.mouseReleaseEvent = self.preview_mouse_release
 
         # --- 初始化 ---
-        self.refresh_template_list()
-        self.load_last_settings()
+        # 模板列表、上一次会话和图片水印的解码都要读磁盘，放到窗口显示之后在后台线程完成
+        self._startup_done = False
+        self.startup_loader: StartupLoader = None
+        if deferred_startup:
+            QTimer.singleShot(0, self._start_deferred_init)
+        else:
+            self._on_startup_loaded(load_startup_state(self.config_manager))
+
+    def _start_deferred_init(self):
+        self.startup_loader = StartupLoader(self.config_manager, self)
+        self.startup_loader.loaded.connect(self._on_startup_loaded)
+        self.startup_loader.start()
+
+    def _on_startup_loaded(self, state):
+        """后台加载完成（GUI 线程）：填充模板列表并恢复上一次的会话"""
+        self.controls.update_template_list(state.templates)
+        if state.last_settings is not None:
+            self.apply_settings(state.last_settings, image_watermark=state.image_watermark)
+            print("[INFO] 已成功加载上一次的会话设置。")
+        else:
+            print("[INFO] 未找到或无法解析上一次的会话设置，使用默认值。")
+        self._startup_done = True
 
     # -------------------------------
     # 位置与拖拽
@@ -93,12 +129,24 @@ class MainWindow(QMainWindow):
         pos = event.position().toPoint()
         self.dragging = True
         self.drag_offset = pos
+        # 拖拽期间底图与水印分层显示，只移动水印层，松开鼠标后再合成一次
+        # 只在当前图片已经渲染过一帧时显示水印图层（解码与编译不在 GUI 线程进行）
+        selected_path = self.image_list.get_selected_image()
+        if selected_path and selected_path == self.current_image_path and self._preview_plan is not None:
+            base_preview = self.current_preview_image
+            scaled_pos = self._compute_scaled_wm_pos()
+            manager = PreviewManager()
+            manager.set_base_image(base_preview)
+            manager.set_plan((self._preview_plan, scaled_pos))
+            overlay, origin = manager.generate_overlay()
+            self.preview_widget.start_overlay(base_preview, overlay, origin)
+            self._drag_overlay_anchor = (origin[0] - self.current_scaled_pos[0], origin[1] - self.current_scaled_pos[1])
         event.accept()
 
     def preview_mouse_move(self, event):
-        if self.dragging and self.current_original_image:
+        if self.dragging and self.current_original_size:
             pos = event.position().toPoint()
-            w, h = self.current_original_image.size
+            w, h = self.current_original_size
             dx = (pos.x() - self.drag_offset.x()) / self.preview_scale_ratio
             dy = (pos.y() - self.drag_offset.y()) / self.preview_scale_ratio
             if w > 0 and h > 0:
@@ -109,90 +157,71 @@ class MainWindow(QMainWindow):
                     self.wm_offset_relative[1] + relative_dy
                 )
             self.drag_offset = pos
-            self.update_preview()
+            scaled_pos = self._compute_scaled_wm_pos()
+            self.preview_widget.move_overlay((scaled_pos[0] + self._drag_overlay_anchor[0], scaled_pos[1] + self._drag_overlay_anchor[1]))
             event.accept()
 
     def preview_mouse_release(self, event):
-        self.dragging = False
+        if self.dragging:
+            self.dragging = False
+            self.update_preview()
         event.accept()
 
     # -------------------------------
     # 核心：更新预览
     # -------------------------------
     def update_preview(self, *_):
-        selected_path = self.image_list.get_selected_image()
-        if not selected_path:
-            self.preview_widget.label.clear()
-            return
-
         try:
-            if self.current_image_path != selected_path:
-                self.current_image_path = selected_path
-                self.current_original_image = Image.open(selected_path).convert("RGBA")
-                max_preview_size = (1280, 1280)
-                original_w, _ = self.current_original_image.size
-                self.current_preview_image = self.current_original_image.copy()
-                self.current_preview_image.thumbnail(max_preview_size, Image.Resampling.LANCZOS)
-                preview_w, _ = self.current_preview_image.size
-                self.preview_scale_ratio = preview_w / original_w if original_w > 0 else 1.0
-
-            if not self.current_preview_image: return
-
-            preview_with_wm = self.current_preview_image.copy()
-            self.preview_manager.set_base_image(preview_with_wm)
-            
-            w, h = self.current_original_image.size
-            pos_name = self.controls.current_position
-
-            padding = int(min(w, h) * 0.02)
-
-            current_absolute_offset = (self.wm_offset_relative[0] * w, self.wm_offset_relative[1] * h)
-            
-            ref_dim = min(w, h)
-            pixel_font_size = ref_dim * (self.controls.font_size_spin.value() / 100.0)
-            wm_w = len(self.controls.text_input.text()) * pixel_font_size * 0.6
-            wm_h = pixel_font_size
-            base_positions = {
-                "左上": (padding * 5, padding),
-                "上中": (w/2 - wm_w/2, padding),
-                "右上": (w - wm_w - padding, padding),
-                "左中": (padding * 5, h/2 - wm_h/2),
-                "中心": (w/2 - wm_w/2, h/2 - wm_h/2),
-                "右中": (w - wm_w - padding, h/2 - wm_h/2),
-                "左下": (padding * 5, h - wm_h - padding),
-                "下中": (w/2 - wm_w/2, h - wm_h - padding),
-                "右下": (w - wm_w - padding, h - wm_h - padding),
-            }
-            base_pos = base_positions.get(pos_name, (0, 0))
-            self.current_wm_pos = (base_pos[0] + current_absolute_offset[0], base_pos[1] + current_absolute_offset[1])
-            scaled_pos = (int(self.current_wm_pos[0] * self.preview_scale_ratio), int(self.current_wm_pos[1] * self.preview_scale_ratio))
-
-            # 应用文本水印
-            text = self.controls.text_input.text().strip()
-            if text:
-                tw = TextWatermark(text=text, relative_font_size=self.controls.font_size_spin.value(), color=self.controls.selected_color, opacity=self.controls.opacity_slider.value(), bold=self.controls.bold_checkbox.isChecked(), italic=self.controls.italic_checkbox.isChecked())
-                self.preview_manager.set_text_watermark((tw, scaled_pos))
-            else:
-                self.preview_manager.set_text_watermark(None)
-
-            # --- 修改：使用缓存的图片水印对象 ---
-            iw = self.controls.image_watermark_obj
-            if iw:
-                iw.opacity = self.controls.opacity_slider.value()
-                iw.scale = self.controls.image_scale_slider.value() / 100.0
-                self.preview_manager.set_image_watermark((iw, scaled_pos))
-            else:
-                self.preview_manager.set_image_watermark(None)
-            # --- 修改结束 ---
-
-            final_preview_img = self.preview_manager.generate_preview()
-            self.preview_widget.show_image(final_preview_img)
-
+            state = self._snapshot_preview()
+            if not state:
+                return
+            path, settings = state
+            session = self.preview_session
+            frames = self.preview_widget.frames
+            image_watermark = self.controls.image_watermark_obj
+            # 预览线程中按预览尺寸解码（PNG/TIFF 也不会卡住界面），与导出使用同一份编译好的水印方案，
+            # 并直接在帧缓冲里合成，显示时不必再把 PIL 图片复制给 Qt
+            self.preview_renderer.submit(lambda: session.render(path, settings, image_watermark, frames.render))
         except Exception as e:
             print(f"[ERROR] 生成预览失败: {e}")
             import traceback
             traceback.print_exc()
 
+    def _compute_scaled_wm_pos(self):
+        """按当前设置计算水印在原图中的位置，并换算到预览图坐标"""
+        self.current_wm_pos = compute_watermark_position(self.current_original_size, self.get_current_settings())
+        self.current_scaled_pos = (int(self.current_wm_pos[0] * self.preview_scale_ratio), int(self.current_wm_pos[1] * self.preview_scale_ratio))
+        return self.current_scaled_pos
+
+    def _snapshot_preview(self):
+        """
+        在 GUI 线程读取控件，生成一份参数快照。
+        :return: (图片路径, 设置字典)；没有选中图片时返回 None
+        """
+        selected_path = self.image_list.get_selected_image()
+        if not selected_path:
+            self.preview_widget.label.clear()
+            return None
+        # 控件只能在 GUI 线程读取，这里只取好参数快照，解码、编译与合成都交给后台线程
+        return selected_path, self.get_current_settings()
+
+    def on_preview_rendered(self, request_id: int, frame):
+        # 排队期间又有新的请求提交时，丢弃这一帧；拖拽中由水印图层负责显示
+        if not self.preview_renderer.is_latest(request_id):
+            return
+        if frame.path != self.current_image_path:
+            self.file_manager.catalog.update_info(frame.path, size=frame.original_size)
+        self.current_image_path = frame.path
+        self.current_preview_image = frame.base_image
+        self.current_original_size = frame.original_size
+        self.preview_scale_ratio = frame.scale
+        self._preview_plan = frame.plan
+        if self.dragging:
+            return
+        self.current_scaled_pos = frame.position
+        if self.image_list.get_selected_image():
+            self.preview_widget.show_image(frame.image)
+
     # -------------------------------
     # 文件导入/导出
     # -------------------------------
@@ -211,91 +240,83 @@ class MainWindow(QMainWindow):
         )
         
         if folder_path:
-            # 使用 FileManager 中已经存在的方法来获取所有图片路径
-            image_paths_in_folder = self.file_manager.import_folder(folder_path)
-            
-            if not image_paths_in_folder:
-                QMessageBox.information(self, "提示", "所选文件夹中未找到支持的图片格式。")
-                return
-
-            # 将找到的图片路径列表交给通用的处理函数
-            self.handle_import_files(image_paths_in_folder)
+            # 在后台扫描，找到的图片分批加入列表
+            self.import_paths([folder_path], notify_empty=True)
+
+    def import_paths(self, paths, notify_empty: bool = False):
+        """后台扫描文件/文件夹（是否递归由"包含子文件夹"决定），边扫描边导入"""
+        worker = ScanWorker(paths, recursive=self.controls.recursive_checkbox.isChecked(), parent=self)
+        worker.found.connect(self.handle_import_files)
+        worker.scanFinished.connect(lambda total: self._on_scan_finished(worker, total, notify_empty))
+        self._scan_workers.append(worker)
+        worker.start()
+
+    def _on_scan_finished(self, worker, total: int, notify_empty: bool):
+        if worker in self._scan_workers:
+            self._scan_workers.remove(worker)
+        worker.wait()
+        worker.deleteLater()
+        if total == 0 and notify_empty:
+            QMessageBox.information(self, "提示", "所选文件夹中未找到支持的图片格式。")
     def handle_import_files(self, file_paths):
-        imported_files = self.file_manager.import_files(file_paths)
-        for f in imported_files:
-            self.image_list.add_image(f)
-        if imported_files and not self.image_list.currentItem():
-            self.image_list.setCurrentRow(0)
+        # 列表模型与 FileManager 共用同一个图片目录，由目录负责过滤与去重
+        self.image_list.add_images(file_paths)
 
     def export_images(self):
-        if self.image_list.count() == 0:
+        catalog = self.file_manager.catalog
+        if len(catalog) == 0:
             QMessageBox.warning(self, "提示", "请先导入至少一张图片。")
             return
             
         output_dir = QFileDialog.getExistingDirectory(self, "选择导出文件夹", "", QFileDialog.Option.DontUseNativeDialog)
         if not output_dir: return
 
-        first_image_path = Path(self.image_list.item(0).data(Qt.ItemDataRole.UserRole))
+        first_image_path = catalog[0].as_path()
         if Path(output_dir).resolve() == first_image_path.parent.resolve():
             QMessageBox.warning(self, "警告", "导出文件夹不能与原图文件夹相同，请重新选择。", QMessageBox.StandardButton.Ok)
             return
 
-        images_to_export = []
-        scale_percent = self.controls.scale_spinbox.value() / 100.0
-        current_settings = self.get_current_settings()
-        pos_name = current_settings["position_name"]
-        relative_offset = current_settings["wm_offset_relative"]
-
-        for i in range(self.image_list.count()):
-            item = self.image_list.item(i)
-            img_path = Path(item.data(Qt.ItemDataRole.UserRole))
-            img = Image.open(img_path).convert("RGBA")
-
-            if scale_percent != 1.0:
-                new_size = (int(img.width * scale_percent), int(img.height * scale_percent))
-                img = img.resize(new_size, Image.Resampling.LANCZOS)
-            
-            w, h = img.size
-            padding = int(min(w, h) * 0.02) 
-            absolute_offset = (relative_offset[0] * w, relative_offset[1] * h)
-            ref_dim = min(w, h)
-            pixel_font_size = ref_dim * (current_settings["relative_font_size"] / 100.0)
-            wm_w = len(current_settings["text_content"]) * pixel_font_size * 0.6
-            wm_h = pixel_font_size
-            base_positions = {
-                "左上": (padding * 5, padding),
-                "上中": (w/2 - wm_w/2, padding),
-                "右上": (w - wm_w - padding, padding),
-                "左中": (padding * 5, h/2 - wm_h/2),
-                "中心": (w/2 - wm_w/2, h/2 - wm_h/2),
-                "右中": (w - wm_w - padding, h/2 - wm_h/2),
-                "左下": (padding * 5, h - wm_h - padding),
-                "下中": (w/2 - wm_w/2, h - wm_h - padding),
-                "右下": (w - wm_w - padding, h - wm_h - padding),
-            }
-            base_pos = base_positions.get(pos_name, (0, 0))
-            final_pos = (base_pos[0] + absolute_offset[0], base_pos[1] + absolute_offset[1])
-            
-            if current_settings["text_content"]:
-                tw = TextWatermark(text=current_settings["text_content"], relative_font_size=current_settings["relative_font_size"], color=current_settings["color"], opacity=current_settings["opacity"], bold=current_settings["is_bold"], italic=current_settings["is_italic"])
-                img = tw.apply(img, position=final_pos)
-
-            # --- 修改：使用缓存的图片水印对象 ---
-            iw = self.controls.image_watermark_obj
-            if iw:
-                iw.opacity = current_settings["opacity"]
-                iw.scale = current_settings.get("image_scale", 15) / 100.0
-                img = iw.apply(img, position=final_pos)
-            # --- 修改结束 ---
-
-            images_to_export.append((img, img_path))
-
-        final_images_to_export = []
-        for img, path in images_to_export:
-            final_images_to_export.append((img.convert("RGB"), path))
-
-        self.file_manager.batch_export(images=final_images_to_export, output_dir=output_dir, output_format=self.controls.format_combo.currentText(), name_rule=self.controls.name_rule_combo.currentText(), custom_str=self.controls.custom_str_input.text(), jpeg_quality=self.controls.jpeg_quality_slider.value())
-        QMessageBox.information(self, "成功", f"批量导出完成，共 {len(final_images_to_export)} 张图片。")
+        # 路径按需生成（遍历的是目录的快照），导出引擎逐张解码、加水印、写盘并释放，内存不随批次大小增长；
+        # 导出在后台线程进行，设置未变时沿用预览编译好的水印方案（否则在导出线程中编译），
+        # 界面通过进度面板显示进度并可随时取消
+        paths = (record.as_path() for record in catalog)
+        settings = self.get_current_settings()
+        worker = ExportWorker(
+            settings, paths, output_dir, total=len(catalog), plan=self.preview_session.cached_plan(settings), parent=self
+        )
+        panel = self.controls.export_panel
+        worker.progress.connect(panel.update_progress)
+        worker.exportFinished.connect(lambda results, progress: self._on_export_finished(worker, results, progress))
+        panel.cancelRequested.connect(worker.cancel)
+        self._export_worker = worker
+        self.controls.export_btn.setEnabled(False)
+        panel.start(len(catalog))
+        worker.start()
+
+    def _on_export_finished(self, worker, results, progress):
+        panel = self.controls.export_panel
+        panel.cancelRequested.disconnect(worker.cancel)
+        panel.finish(progress)
+        self.controls.export_btn.setEnabled(True)
+        worker.wait()
+        worker.deleteLater()
+        self._export_worker = None
+
+        if worker.error:
+            QMessageBox.critical(self, "错误", f"批量导出失败：{worker.error}")
+            return
+        exported = progress.done - progress.failed - progress.skipped
+        text = f"批量导出{'已取消' if progress.cancelled else '完成'}：成功 {exported} 张"
+        if progress.skipped:
+            text += f"，跳过 {progress.skipped} 张"
+        if progress.failed:
+            text += f"，失败 {progress.failed} 张"
+        if progress.cancelled and progress.total:
+            text += f"，未处理 {progress.total - progress.done} 张"
+        box = QMessageBox(QMessageBox.Icon.Warning if progress.failed else QMessageBox.Icon.Information, "批量导出", text, parent=self)
+        # 逐个文件的结果放在“详细信息”中
+        box.setDetailedText(format_report(results))
+        box.exec()
 
     # -------------------------------
     # 模板功能
@@ -325,10 +346,14 @@ class MainWindow(QMainWindow):
             "custom_str": self.controls.custom_str_input.text(),
             "output_format": self.controls.format_combo.currentText(),
             "jpeg_quality": self.controls.jpeg_quality_slider.value(),
+            "encode_profile": self.controls.encode_profile_combo.currentText(),
             "scale_percent": self.controls.scale_spinbox.value(),
         }
 
-    def apply_settings(self, settings: dict):
+    def apply_settings(self, settings: dict, image_watermark: ImageWatermark = None):
+        """
+        :param image_watermark: 已解码好的图片水印（如启动时后台加载的），路径一致时直接复用
+        """
         c = self.controls
         c.text_input.setText(settings.get("text_content", ""))
         c.opacity_slider.setValue(settings.get("opacity", 180))
@@ -339,7 +364,9 @@ class MainWindow(QMainWindow):
         
         # --- 修改：从路径重新创建图片水印对象 ---
         img_wm_path = settings.get("image_path", None)
-        if img_wm_path and Path(img_wm_path).exists():
+        if image_watermark is not None and img_wm_path and Path(img_wm_path) == image_watermark.watermark_path:
+            c.image_watermark_obj = image_watermark
+        elif img_wm_path and Path(img_wm_path).exists():
             try:
                 c.image_watermark_obj = ImageWatermark(watermark_path=img_wm_path)
             except Exception as e:
@@ -362,6 +389,7 @@ class MainWindow(QMainWindow):
         c.custom_str_input.setText(settings.get("custom_str", "_watermarked"))
         c.format_combo.setCurrentText(settings.get("output_format", "PNG"))
         c.jpeg_quality_slider.setValue(settings.get("jpeg_quality", 90))
+        c.encode_profile_combo.setCurrentText(settings.get("encode_profile", FileManager.DEFAULT_ENCODE_PROFILE))
         c.scale_spinbox.setValue(settings.get("scale_percent", 100))
         
         self.update_preview()
@@ -397,21 +425,29 @@ class MainWindow(QMainWindow):
         except (FileNotFoundError, json.JSONDecodeError):
             QMessageBox.critical(self, "错误", f"加载模板 '{name}' 失败，文件不存在或已损坏。")
 
-    def load_last_settings(self):
-        try:
-            settings = self.config_manager.load_template("_last_session")
-            self.apply_settings(settings)
-            print("[INFO] 已成功加载上一次的会话设置。")
-        except (FileNotFoundError, json.JSONDecodeError):
-            print("[INFO] 未找到或无法解析上一次的会话设置，使用默认值。")
-
     def closeEvent(self, event):
-        settings = self.get_current_settings()
-        self.config_manager.save_template("_last_session", settings)
-        print("[INFO] 当前会话设置已保存。")
+        if self._startup_done:
+            settings = self.get_current_settings()
+            self.config_manager.save_template("_last_session", settings)
+            print("[INFO] 当前会话设置已保存。")
+        else:
+            # 上一次的会话还没恢复就关闭窗口时，不能用默认值覆盖它
+            if self.startup_loader is not None:
+                self.startup_loader.wait()
+            print("[INFO] 启动数据尚未加载完成，保留上一次的会话设置。")
+        for worker in list(self._scan_workers):
+            worker.cancel()
+            worker.wait()
+        if self._export_worker is not None:
+            # 关闭窗口时取消导出，等处理中的图片写完，已导出的文件保留
+            self._export_worker.cancel()
+            self._export_worker.wait()
+        self.preview_renderer.stop()
         event.accept()
 
 if __name__ == "__main__":
+    # 打包为 exe 后，批量导出的进程池需要此调用
+    multiprocessing.freeze_support()
     app = QApplication(sys.argv)
     window = MainWindow()
     window.show()
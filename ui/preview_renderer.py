@@ -0,0 +1,69 @@
+# ui/preview_renderer.py
+
+import threading
+import traceback
+from typing import Callable, Optional, Tuple
+
+from PyQt6.QtCore import QThread, pyqtSignal
+from PIL import Image
+
+
+class PreviewRenderer(QThread):
+    """
+    后台预览渲染线程。
+    同一时刻只保留最新提交的一个请求（latest-wins），拖动滑块时连续的请求会被合并；
+    渲染完成时如果已有更新的请求，结果直接丢弃。
+    """
+    # (request_id, PIL.Image)
+    rendered = pyqtSignal(int, object)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._cond = threading.Condition()
+        self._pending: Optional[Tuple[int, Callable[[], Image.Image]]] = None
+        self._latest_id = 0
+        self._stopping = False
+
+    def submit(self, render_fn: Callable[[], Image.Image]) -> int:
+        """提交一个渲染函数（在后台线程执行），替换掉尚未开始的旧请求"""
+        with self._cond:
+            self._latest_id += 1
+            self._pending = (self._latest_id, render_fn)
+            self._cond.notify()
+            request_id = self._latest_id
+        if not self.isRunning():
+            self.start()
+        return request_id
+
+    def is_latest(self, request_id: int) -> bool:
+        with self._cond:
+            return request_id == self._latest_id
+
+    def stop(self):
+        """停止线程并等待其退出（正在进行的渲染会先完成）"""
+        with self._cond:
+            self._stopping = True
+            self._pending = None
+            self._cond.notify()
+        self.wait()
+
+    def run(self):
+        while True:
+            with self._cond:
+                while self._pending is None and not self._stopping:
+                    self._cond.wait()
+                if self._stopping:
+                    return
+                request_id, render_fn = self._pending
+                self._pending = None
+
+            try:
+                image = render_fn()
+            except Exception as e:
+                print(f"[ERROR] 生成预览失败: {e}")
+                traceback.print_exc()
+                continue
+
+            # 渲染期间有新请求时，当前结果已过期
+            if self.is_latest(request_id):
+                self.rendered.emit(request_id, image)
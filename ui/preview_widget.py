@@ -1,43 +1,157 @@
 from PyQt6.QtWidgets import QWidget, QLabel, QVBoxLayout
-from PyQt6.QtCore import Qt, QPoint
-from PyQt6.QtGui import QPixmap, QImage, QMouseEvent
+from PyQt6.QtCore import Qt, QPoint, QPointF, QRectF
+from PyQt6.QtGui import QPixmap, QImage, QMouseEvent, QPainter
 from PIL import ImageQt
 
+from ui.frame_buffer import Frame, FramePool
+
+
+def pil_to_pixmap(pil_image) -> QPixmap:
+    qt_image = ImageQt.ImageQt(pil_image)
+    return QPixmap.fromImage(QImage(qt_image))
+
+
+class PreviewLabel(QLabel):
+    """居中绘制已按设备像素缩放好的预览图，再在其上绘制一层可移动的水印图层"""
+
+    def __init__(self, text: str = "", parent=None):
+        super().__init__(text, parent)
+        self._image: QImage | None = None
+        self._overlay: QPixmap | None = None
+        self._overlay_pos = QPointF(0, 0)
+
+    def set_image(self, image: QImage | None):
+        """image 已按设备像素比缩放好（setDevicePixelRatio），绘制时不再缩放"""
+        self._image = image
+        if image is not None and self.text():
+            super().clear()
+        self.update()
+
+    def image_rect(self) -> QRectF:
+        """预览图在标签内的显示区域（逻辑坐标）"""
+        if self._image is None:
+            return QRectF()
+        size = self._image.deviceIndependentSize()
+        rect = QRectF(self.contentsRect())
+        return QRectF(
+            rect.x() + (rect.width() - size.width()) / 2,
+            rect.y() + (rect.height() - size.height()) / 2,
+            size.width(),
+            size.height(),
+        )
+
+    def clear(self):
+        self._image = None
+        self._overlay = None
+        super().clear()
+
+    def set_overlay(self, pixmap: QPixmap | None, pos: QPointF = QPointF(0, 0)):
+        self._overlay = pixmap
+        self._overlay_pos = pos
+        self.update()
+
+    def paintEvent(self, event):
+        super().paintEvent(event)
+        if self._image is None and self._overlay is None:
+            return
+        painter = QPainter(self)
+        if self._image is not None:
+            painter.drawImage(self.image_rect().topLeft(), self._image)
+        if self._overlay is not None:
+            painter.drawPixmap(self._overlay_pos, self._overlay)
+        painter.end()
+
 
 class PreviewWidget(QWidget):
     def __init__(self):
         super().__init__()
         self.layout = QVBoxLayout(self)
-        self.label = QLabel("预览区")
+        self.label = PreviewLabel("预览区")
         self.label.setAlignment(Qt.AlignmentFlag.AlignCenter)
         self.layout.addWidget(self.label)
 
-        self._pixmap = None
+        # 当前显示的帧（与 PIL 共享内存），窗口尺寸变化时从它重新缩放
+        self.frames = FramePool()
+        self._frame: Frame | None = None
+        self._display_scale = 1.0
         self._dragging = False
         self._wm_offset = QPoint(0, 0)
         self._wm_pos = QPoint(0, 0)
         self.drag_callback = None  # 拖拽更新回调
 
-    def show_image(self, pil_image, wm_pos=None):
-        qt_image = ImageQt.ImageQt(pil_image)
-        pixmap = QPixmap.fromImage(QImage(qt_image))
-        self._pixmap = pixmap
+        # 拖拽时的独立水印图层：原始/按显示比例缩放后的精灵，以及其在预览图中的左上角
+        self._overlay_pixmap = None
+        self._overlay_scaled = None
+        self._overlay_origin = (0, 0)
+
+    def show_image(self, image, wm_pos=None):
+        """
+        显示合成好的预览图，同时结束拖拽图层。
+        image 为 Frame 时直接使用其内存；为 PIL 图片时先复制到一帧中。
+        """
+        self._clear_overlay()
+        self._frame = image if isinstance(image, Frame) else self.frames.frame_from(image)
         if wm_pos:
             self._wm_pos = QPoint(*wm_pos)
         self._update_scaled_pixmap()
 
+    def start_overlay(self, base_image, overlay_image, origin):
+        """
+        拖拽开始：底图与水印精灵分两层显示。
+        之后的 move_overlay 只移动水印层，不重新合成整张图片。
+        """
+        self._frame = self.frames.frame_from(base_image)
+        self._overlay_pixmap = pil_to_pixmap(overlay_image) if overlay_image is not None else None
+        self._overlay_origin = origin
+        self._update_scaled_pixmap()
+
+    def move_overlay(self, origin):
+        """移动水印层到预览图坐标 origin（左上角）"""
+        self._overlay_origin = origin
+        self._place_overlay()
+
     def resizeEvent(self, event):
         self._update_scaled_pixmap()
         super().resizeEvent(event)
 
     def _update_scaled_pixmap(self):
-        if self._pixmap:
-            scaled = self._pixmap.scaled(
-                self.label.size(),
-                Qt.AspectRatioMode.KeepAspectRatio,
+        if self._frame is None:
+            return
+        # 直接缩放到设备像素尺寸，这是每次更新唯一的一次整帧复制，绘制时不再缩放
+        dpr = self.label.devicePixelRatioF()
+        source = self._frame.qimage()
+        target = self.label.contentsRect().size() * dpr
+        scaled = source.scaled(target, Qt.AspectRatioMode.KeepAspectRatio, Qt.TransformationMode.SmoothTransformation)
+        if scaled.size() == source.size():
+            # 尺寸不变时 Qt 返回共享帧内存的浅拷贝，帧复用后内容会变，这里必须深拷贝
+            scaled = source.copy()
+        scaled.setDevicePixelRatio(dpr)
+        self.label.set_image(scaled)
+        self._display_scale = scaled.width() / dpr / source.width() if source.width() else 1.0
+        if self._overlay_pixmap is not None:
+            # 只在开始拖拽或窗口尺寸变化时缩放一次水印层
+            self._overlay_scaled = self._overlay_pixmap.scaled(
+                max(1, round(self._overlay_pixmap.width() * self._display_scale * dpr)),
+                max(1, round(self._overlay_pixmap.height() * self._display_scale * dpr)),
+                Qt.AspectRatioMode.IgnoreAspectRatio,
                 Qt.TransformationMode.SmoothTransformation
             )
-            self.label.setPixmap(scaled)
+            self._overlay_scaled.setDevicePixelRatio(dpr)
+            self._place_overlay()
+
+    def _place_overlay(self):
+        if self._overlay_scaled is None or self._frame is None:
+            return
+        # 图片在标签内居中显示，水印层按显示比例换算到标签坐标
+        rect = self.label.image_rect()
+        pos = QPointF(rect.x() + self._overlay_origin[0] * self._display_scale,
+                      rect.y() + self._overlay_origin[1] * self._display_scale)
+        self.label.set_overlay(self._overlay_scaled, pos)
+
+    def _clear_overlay(self):
+        self._overlay_pixmap = None
+        self._overlay_scaled = None
+        self.label.set_overlay(None)
 
     def mousePressEvent(self, event: QMouseEvent):
         if event.button() == Qt.MouseButton.LeftButton:
@@ -0,0 +1,55 @@
+# ui/scan_worker.py
+
+import sys
+import os
+import threading
+import time
+from typing import List
+
+from PyQt6.QtCore import QThread, pyqtSignal
+
+# 动态添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from watermark.file_manager import FileManager
+
+
+class ScanWorker(QThread):
+    """
+    在后台线程扫描文件/文件夹，扫描到的图片路径分批通过 found 信号交给 GUI 线程，
+    列表可以边扫描边填充。
+    """
+    found = pyqtSignal(list)
+    # 扫描结束（含取消），参数为找到的图片总数
+    scanFinished = pyqtSignal(int)
+
+    BATCH_SIZE = 500
+    BATCH_INTERVAL = 0.1  # 秒
+
+    def __init__(self, roots: List[str], recursive: bool = False, parent=None):
+        super().__init__(parent)
+        self.roots = list(roots)
+        self.recursive = recursive
+        self._cancel = threading.Event()
+
+    def cancel(self):
+        self._cancel.set()
+
+    def run(self):
+        total = 0
+        batch = []
+        last_emit = time.monotonic()
+        try:
+            for path in FileManager().scan(*self.roots, recursive=self.recursive, cancel_event=self._cancel):
+                batch.append(str(path))
+                if len(batch) >= self.BATCH_SIZE or time.monotonic() - last_emit >= self.BATCH_INTERVAL:
+                    total += len(batch)
+                    self.found.emit(batch)
+                    batch = []
+                    last_emit = time.monotonic()
+        except Exception as e:
+            print(f"[ERROR] 扫描文件夹失败: {e}")
+        if batch and not self._cancel.is_set():
+            total += len(batch)
+            self.found.emit(batch)
+        self.scanFinished.emit(total)
@@ -0,0 +1,67 @@
+# ui/startup.py
+
+import sys
+import os
+import json
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from PyQt6.QtCore import QThread, pyqtSignal
+
+# 动态添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from watermark.config_manager import ConfigManager
+from watermark.watermark_image import ImageWatermark
+
+LAST_SESSION = "_last_session"
+
+
+@dataclass
+class StartupState:
+    """后台加载得到的启动数据"""
+    templates: List[str] = field(default_factory=list)
+    # 上一次会话的设置；不存在或无法解析时为 None
+    last_settings: Optional[Dict[str, Any]] = None
+    # 会话中图片水印已在后台解码好的对象
+    image_watermark: Optional[ImageWatermark] = None
+
+
+def load_startup_state(config_manager: ConfigManager) -> StartupState:
+    """读取模板列表、上一次会话，并解码会话中的图片水印（都是磁盘 IO，可在后台线程执行）"""
+    state = StartupState()
+    state.templates = [t for t in config_manager.list_templates() if t != LAST_SESSION]
+
+    try:
+        state.last_settings = config_manager.load_template(LAST_SESSION)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return state
+
+    img_wm_path = state.last_settings.get("image_path")
+    if img_wm_path and Path(img_wm_path).exists():
+        try:
+            state.image_watermark = ImageWatermark(watermark_path=img_wm_path)
+        except Exception as e:
+            print(f"[WARN] 从模板加载图片水印失败: {e}")
+    return state
+
+
+class StartupLoader(QThread):
+    """
+    在后台线程执行 load_startup_state，完成后通过 loaded 信号（在 GUI 线程触发）交回结果，
+    窗口可以先显示出来，再恢复会话与模板列表。
+    """
+    loaded = pyqtSignal(object)
+
+    def __init__(self, config_manager: ConfigManager, parent=None):
+        super().__init__(parent)
+        self.config_manager = config_manager
+
+    def run(self):
+        try:
+            state = load_startup_state(self.config_manager)
+        except Exception as e:
+            print(f"[ERROR] 启动数据加载失败: {e}")
+            state = StartupState()
+        self.loaded.emit(state)
@@ -0,0 +1,71 @@
+# ui/thumbnail_loader.py
+
+import sys
+import os
+from PyQt6.QtCore import QObject, QRunnable, QThreadPool, pyqtSignal
+from PyQt6.QtGui import QImage
+
+# 动态添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from watermark.thumbnails import ThumbnailCache
+
+
+class _ThumbnailSignals(QObject):
+    ready = pyqtSignal(str, QImage)
+    failed = pyqtSignal(str, str)
+
+
+class _ThumbnailTask(QRunnable):
+    def __init__(self, path: str, cache: ThumbnailCache, signals: _ThumbnailSignals):
+        super().__init__()
+        self.path = path
+        self.cache = cache
+        self.signals = signals
+
+    def run(self):
+        try:
+            # 缓存读写失败时 load 返回内存中的缩略图，这里的异常只来自原图本身
+            thumb = self.cache.load(self.path).convert("RGBA")
+            # QImage 可以在工作线程中创建，QPixmap/QIcon 只能在 GUI 线程创建；copy() 使其脱离 PIL 的内存
+            data = thumb.tobytes()
+            image = QImage(data, thumb.width, thumb.height, thumb.width * 4, QImage.Format.Format_RGBA8888).copy()
+            self.signals.ready.emit(self.path, image)
+        except Exception as e:
+            self.signals.failed.emit(self.path, str(e))
+
+
+class ThumbnailLoader(QObject):
+    """在后台线程池中生成缩略图，完成后通过信号通知（信号在 GUI 线程触发）"""
+    thumbnailReady = pyqtSignal(str, QImage)
+    thumbnailFailed = pyqtSignal(str, str)
+
+    def __init__(self, size: int = 64, parent=None):
+        super().__init__(parent)
+        self.cache = ThumbnailCache(size=size)
+        self._pool = QThreadPool(self)
+        self._pool.setMaxThreadCount(max(2, QThreadPool.globalInstance().maxThreadCount() - 1))
+        self._pending = set()
+        self._signals = _ThumbnailSignals(self)
+        self._signals.ready.connect(self._on_ready)
+        self._signals.failed.connect(self._on_failed)
+
+    def request(self, path: str):
+        """请求生成缩略图；同一路径在完成前重复请求只会处理一次"""
+        if path in self._pending:
+            return
+        self._pending.add(path)
+        self._pool.start(_ThumbnailTask(path, self.cache, self._signals))
+
+    def cancel_pending(self):
+        """清空尚未开始的任务（正在执行的任务会继续完成）"""
+        self._pool.clear()
+        self._pending.clear()
+
+    def _on_ready(self, path: str, image: QImage):
+        self._pending.discard(path)
+        self.thumbnailReady.emit(path, image)
+
+    def _on_failed(self, path: str, error: str):
+        self._pending.discard(path)
+        self.thumbnailFailed.emit(path, error)
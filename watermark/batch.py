@@ -0,0 +1,446 @@
+# watermark/batch.py
+
+import io
+import os
+import multiprocessing
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from functools import partial
+from pathlib import Path
+from typing import Any, BinaryIO, Callable, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+from PIL import Image
+
+from . import instrumentation, tiled
+from .compositing import Layer, normalize_mode
+from .file_manager import FileManager, export_options
+from .pipeline import Finished, Pipeline, Stage, format_stats
+from .plan import WatermarkPlan
+from .streaming import ordered_bounded_map
+
+# 单进程流水线各阶段（按顺序）的默认线程数：读写文件等待 I/O，解码与编码在 Pillow 中释放 GIL
+PIPELINE_THREADS = {"read": 2, "decode": 2, "composite": 1, "encode": 2, "write": 2}
+
+
+@dataclass
+class ExportResult:
+    """单个文件的导出结果"""
+    source: Path
+    output: Optional[Path] = None
+    error: Optional[str] = None
+    # 增量导出时输出已是最新、本次未处理
+    skipped: bool = False
+    # 工作进程中记录的计时数据，由主进程合并后清空
+    profile: Optional[Dict[str, Any]] = None
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+class BatchContext:
+    """
+    单个进程内的批处理上下文。
+    字体、Logo 等资源由水印方案（WatermarkPlan）预先准备好，之后每张图片复用。
+    """
+
+    def __init__(self, settings: Dict[str, Any], output_dir: str, plan: Optional[WatermarkPlan] = None):
+        self.settings = settings
+        self.output_dir = output_dir
+        self.file_manager = FileManager()
+        # 编译好的水印方案；多进程导出时由主进程编译一次后传入
+        self.plan = plan if plan is not None else WatermarkPlan.compile(settings)
+
+    def render(self, path: Path) -> Image.Image:
+        """解码 -> 缩放 -> 加水印，返回待编码的图片"""
+        img = self.decode(path)
+        instrumentation.count("bytes_read", os.path.getsize(path))
+        return self.composite(img)
+
+    def decode(self, source: Union[Path, BinaryIO]) -> Image.Image:
+        """解码并按设置缩放；source 可以是路径或已读入内存的文件对象"""
+        # 解码后的图片只属于本次处理，水印直接原地合成，不做整幅 RGBA 转换和复制
+        with instrumentation.stage("decode"):
+            img = Image.open(source)
+            img.load()
+            img = normalize_mode(img)
+        instrumentation.count("images")
+
+        scale_percent = self.settings.get("scale_percent", 100) / 100.0
+        if scale_percent != 1.0:
+            new_size = tiled.scaled_size(img.size, scale_percent)
+            with instrumentation.stage("resize"):
+                img = img.resize(new_size, Image.Resampling.LANCZOS)
+        return img
+
+    def composite(self, img: Image.Image) -> Image.Image:
+        """原地合成水印，返回待编码的图片"""
+        img = self.plan.apply(img, in_place=True)
+        # 与之前一样去掉透明通道；RGB/L 可以直接编码
+        if img.mode in ("RGB", "L"):
+            return img
+        with instrumentation.stage("convert"):
+            return img.convert("RGB")
+
+    def iter_export(self, paths: Iterable[Path], max_in_flight: int = 1) -> Iterator[ExportResult]:
+        """在当前进程内流式导出，同时处理中的图片不超过 max_in_flight 张"""
+        work_items = ((partial(self.render, Path(p)), Path(p)) for p in paths)
+        for source, out_path, error in self.file_manager.iter_batch_export(
+            work_items,
+            self.output_dir,
+            **self.export_options(),
+            max_in_flight=max_in_flight,
+        ):
+            yield ExportResult(source=source, output=out_path, error=None if error is None else str(error))
+
+    def export_one(self, path: Path) -> ExportResult:
+        """导出单张图片，异常被收集到结果中而不是抛出；超大图片按行带处理"""
+        path = Path(path)
+        if self.needs_tiling(path):
+            return self.export_tiled(path)
+        return next(self.iter_export([path]))
+
+    def needs_tiling(self, path: Path) -> bool:
+        return tiled.needs_tiling(path)
+
+    def export_tiled(self, path: Path) -> ExportResult:
+        """按行带导出（并缩放）一张超大图片，尽量不整幅解码（见 watermark.tiled）"""
+        options = self.export_options()
+        try:
+            out_path = self.file_manager.export_large_image(
+                path,
+                self.output_dir,
+                self.watermark_layers,
+                options["output_format"],
+                options["name_rule"],
+                options["custom_str"],
+                options["jpeg_quality"],
+                options["encode_profile"],
+                self.settings.get("scale_percent", 100) / 100.0,
+            )
+        except Exception as e:
+            return ExportResult(source=path, error=str(e))
+        return ExportResult(source=path, output=out_path)
+
+    def watermark_layers(self, size: Tuple[int, int]) -> Tuple[Layer, ...]:
+        """按图片尺寸计算的文字与图片水印图层（与 render 中的合成顺序一致）"""
+        return self.plan.layers(size)
+
+    def export_options(self) -> Dict[str, Any]:
+        """传给 FileManager 的编码与命名参数"""
+        return export_options(self.settings)
+
+    # ------------------------------
+    # 分阶段流水线（见 watermark.pipeline）
+    # ------------------------------
+    def pipeline_stages(self, threads: Optional[Dict[str, int]] = None) -> List[Stage]:
+        """
+        读取 -> 解码 -> 合成 -> 编码 -> 写盘 五个阶段，各阶段之间传递 _PipelineJob。
+        :param threads: 覆盖 PIPELINE_THREADS 中各阶段的线程数
+        """
+        threads = {**PIPELINE_THREADS, **(threads or {})}
+        stage_fns = {
+            "read": self._read_stage,
+            "decode": self._decode_stage,
+            "composite": self._composite_stage,
+            "encode": self._encode_stage,
+            "write": self._write_stage,
+        }
+        return [Stage(name, stage_fns[name], threads[name]) for name in PIPELINE_THREADS]
+
+    def _read_stage(self, path: Path) -> "_PipelineJob":
+        path = Path(path)
+        options = self.export_options()
+        output = self.file_manager.prepare_output(
+            path, self.output_dir, options["output_format"], options["name_rule"], options["custom_str"]
+        )
+        if self.needs_tiling(path):
+            # 超大图片不整幅读入内存，交给解码阶段按行带导出
+            return _PipelineJob(path, output, None)
+        with instrumentation.stage("read"):
+            data = path.read_bytes()
+        instrumentation.count("bytes_read", len(data))
+        return _PipelineJob(path, output, data)
+
+    def _decode_stage(self, job: "_PipelineJob"):
+        if job.payload is None:
+            return Finished(self.export_tiled(job.source))
+        job.payload = self.decode(io.BytesIO(job.payload))
+        return job
+
+    def _composite_stage(self, job: "_PipelineJob") -> "_PipelineJob":
+        job.payload = self.composite(job.payload)
+        return job
+
+    def _encode_stage(self, job: "_PipelineJob") -> "_PipelineJob":
+        img = job.payload
+        options = self.export_options()
+        job.payload = self.file_manager.encode_image(
+            img, options["output_format"], options["jpeg_quality"], options["encode_profile"]
+        )
+        img.close()
+        return job
+
+    def _write_stage(self, job: "_PipelineJob") -> ExportResult:
+        self.file_manager.write_bytes(job.output, job.payload)
+        return ExportResult(source=job.source, output=job.output)
+
+
+class _PipelineJob:
+    """流水线中的一张图片：payload 依次是文件内容、解码后的图片、编码后的数据（超大图片为 None）"""
+    __slots__ = ("source", "output", "payload")
+
+    def __init__(self, source: Path, output: Path, payload: Any):
+        self.source = source
+        self.output = output
+        self.payload = payload
+
+
+@dataclass
+class BatchProgress:
+    """批量导出的实时进度"""
+    total: Optional[int] = None
+    done: int = 0
+    failed: int = 0
+    skipped: int = 0
+    elapsed: float = 0.0
+    cancelled: bool = False
+    # 最近完成的一张
+    last: Optional[ExportResult] = None
+
+    def add(self, result: ExportResult, elapsed: float):
+        self.done += 1
+        if not result.ok:
+            self.failed += 1
+        elif result.skipped:
+            self.skipped += 1
+        self.elapsed = elapsed
+        self.last = result
+
+    @property
+    def rate(self) -> float:
+        """每秒完成的图片数（跳过的图片也计入）"""
+        return self.done / self.elapsed if self.elapsed > 0 else 0.0
+
+    @property
+    def eta(self) -> Optional[float]:
+        """按当前速率估算的剩余秒数；总数未知或尚无速率时为 None"""
+        if self.total is None or self.rate <= 0:
+            return None
+        return max(0, self.total - self.done) / self.rate
+
+
+def format_report(results: Iterable[ExportResult]) -> str:
+    """逐个文件列出导出结果（成功 / 跳过 / 失败及原因）"""
+    lines = []
+    for r in results:
+        if not r.ok:
+            lines.append(f"[失败] {r.source}: {r.error}")
+        elif r.skipped:
+            lines.append(f"[跳过] {r.source} -> {r.output}")
+        else:
+            lines.append(f"[成功] {r.source} -> {r.output}")
+    return "\n".join(lines)
+
+
+# 每个工作进程各自持有一份上下文，由 initializer 预热
+_worker_context: Optional[BatchContext] = None
+
+
+def _init_worker(settings: Dict[str, Any], output_dir: str, profile: bool = False, plan: Optional[WatermarkPlan] = None):
+    global _worker_context
+    instrumentation.enable(profile)
+    _worker_context = BatchContext(settings, output_dir, plan)
+
+
+def _export_in_worker(path: Path) -> ExportResult:
+    result = _worker_context.export_one(path)
+    if instrumentation.is_enabled():
+        result.profile = instrumentation.drain()
+    return result
+
+
+class BatchExporter:
+    """
+    无界面的批量导出引擎，GUI 与脚本共用。
+    workers > 1 时使用进程池并行处理；无论哪种方式，输入都按需消费，
+    同时处理中的图片数不超过 max_in_flight，结果顺序与输入顺序一致。
+    profile 为 True（或设置了 PHOTO_WATERMARK_PROFILE）时记录各阶段耗时，
+    批次结束后打印汇总，并可输出 Chrome trace。
+    incremental 为 True 时按输出目录中的导出清单跳过源文件与设置都未变化的图片，
+    中断后重新运行会从上次停下的地方继续。
+    水印方案（WatermarkPlan）在主进程中只编译一次，由所有工作进程共用。
+    单进程（workers == 1）时默认使用分阶段流水线（见 watermark.pipeline），
+    读文件、解码、合成、编码与写盘相互重叠，吞吐接近最慢的阶段。
+    """
+
+    def __init__(
+        self,
+        settings: Dict[str, Any],
+        output_dir: str,
+        workers: Optional[int] = None,
+        max_in_flight: Optional[int] = None,
+        profile: Optional[bool] = None,
+        trace_path: Optional[Path] = None,
+        incremental: bool = False,
+        plan: Optional[WatermarkPlan] = None,
+        pipeline: Optional[bool] = None,
+        stage_threads: Optional[Dict[str, int]] = None,
+        progress_callback: Optional[Callable[["BatchProgress"], None]] = None,
+        cancel_event: Optional[threading.Event] = None,
+    ):
+        self.settings = dict(settings)
+        # 已按 settings 编译好的水印方案（如预览正在使用的）；None 时在导出开始时编译
+        self.plan = plan
+        self.output_dir = str(output_dir)
+        self.workers = max(1, workers or os.cpu_count() or 1)
+        # 单进程时默认使用分阶段流水线，stage_threads 可覆盖各阶段线程数（见 PIPELINE_THREADS）
+        self.pipeline = self.workers == 1 and pipeline is not False
+        self.stage_threads = stage_threads
+        default_in_flight = len(PIPELINE_THREADS) + 1 if self.pipeline else self.workers * 2
+        self.max_in_flight = max(1, max_in_flight or default_in_flight)
+        self.profile = instrumentation.is_enabled() if profile is None else profile
+        self.trace_path = trace_path or instrumentation.trace_path_from_env()
+        self.incremental = incremental
+        # 每完成（或跳过）一张图片调用一次，参数为同一个 BatchProgress 对象（在导出所在的线程调用）
+        self.progress_callback = progress_callback
+        self.cancel_event = cancel_event
+        # 最近一次批处理的阶段汇总（未开启 profile 时为 None）
+        self.last_summary: Optional[Dict[str, Any]] = None
+        # 最近一次批处理结束时的进度（含是否被取消）
+        self.last_progress: Optional[BatchProgress] = None
+        # 最近一次流水线导出中各阶段的统计（见 Pipeline.stats）
+        self.last_pipeline_stats: Optional[Dict[str, Dict[str, Any]]] = None
+
+    def iter_run(self, paths: Iterable[Path], total: Optional[int] = None) -> Iterator[ExportResult]:
+        """
+        流式导出，按输入顺序逐个产出结果。
+        每得到一个结果调用一次 progress_callback；cancel_event 被设置后不再提交新图片，
+        处理中的图片完成后结束迭代，已导出的文件保留。
+        :param total: 图片总数（用于计算进度与剩余时间）；paths 有长度时默认取其长度
+        """
+        if total is None and hasattr(paths, "__len__"):
+            total = len(paths)
+        progress = BatchProgress(total=total)
+        if self.cancel_event is not None:
+            paths = self._until_cancelled(paths, progress)
+        self.last_progress = progress
+        start = time.perf_counter()
+        for result in self._iter_profiled(paths):
+            progress.add(result, time.perf_counter() - start)
+            if self.progress_callback is not None:
+                self.progress_callback(progress)
+            yield result
+        if progress.cancelled:
+            print(f"[INFO] 批量导出已取消：已完成 {progress.done} 张")
+
+    def _until_cancelled(self, paths: Iterable[Path], progress: "BatchProgress") -> Iterator[Path]:
+        # 取消后不再交出新的图片；已提交的图片照常完成并产出结果，报告与磁盘上的文件一致
+        for path in paths:
+            if self.cancel_event.is_set():
+                progress.cancelled = True
+                return
+            yield path
+
+    def _iter_profiled(self, paths: Iterable[Path]) -> Iterator[ExportResult]:
+        if not self.profile:
+            yield from self._iter_run(paths)
+            return
+
+        was_enabled = instrumentation.is_enabled()
+        instrumentation.enable(True)
+        instrumentation.reset()
+        try:
+            with instrumentation.stage("batch"):
+                yield from self._iter_run(paths)
+        finally:
+            self.last_summary = instrumentation.summary()
+            print(f"[INFO] 批量导出各阶段耗时:\n{instrumentation.format_summary(self.last_summary)}")
+            if self.trace_path:
+                instrumentation.write_chrome_trace(self.trace_path)
+                print(f"[INFO] Chrome trace 已保存: {self.trace_path}")
+            instrumentation.enable(was_enabled)
+
+    def _iter_run(self, paths: Iterable[Path]) -> Iterator[ExportResult]:
+        paths = (Path(p) for p in paths)
+        if not self.incremental:
+            for result in self._iter_results(paths):
+                self._report(result)
+                yield result
+            return
+
+        manifest = FileManager.open_manifest(self.output_dir, self.settings)
+        options = export_options(self.settings)
+        # 源路径 -> 处理前取得的源文件指纹
+        stamps = {}
+
+        def skip_fresh(path: Path) -> Optional[ExportResult]:
+            out_path = FileManager.build_output_path(
+                path, self.output_dir, options["output_format"], options["name_rule"], options["custom_str"]
+            )
+            fresh, stamp = manifest.check(path, out_path)
+            stamps[path] = stamp
+            return ExportResult(source=path, output=out_path, skipped=True) if fresh else None
+
+        try:
+            for result in self._iter_results(paths, skip_fresh):
+                stamp = stamps.pop(result.source, None)
+                if result.ok and not result.skipped:
+                    manifest.record(result.source, result.output, stamp)
+                self._report(result)
+                yield result
+        finally:
+            manifest.save()
+            if manifest.skipped:
+                print(f"[INFO] 增量导出：跳过 {manifest.skipped} 张未变化的图片")
+
+    def _iter_results(self, paths: Iterator[Path], skip=None) -> Iterator[ExportResult]:
+        # 水印方案只在主进程编译一次，工作进程收到的是 pickle 后的副本，不再各自加载字体和 Logo
+        plan = self.plan if self.plan is not None else WatermarkPlan.compile(self.settings)
+        if self.pipeline:
+            yield from self._iter_pipeline(BatchContext(self.settings, self.output_dir, plan), paths, skip)
+            return
+        if self.workers == 1:
+            context = BatchContext(self.settings, self.output_dir, plan)
+            for path, result, error in ordered_bounded_map(context.export_one, paths, self.max_in_flight, skip=skip):
+                yield result if error is None else ExportResult(source=path, error=str(error))
+            return
+
+        # GUI 进程中已有 Qt 线程，fork 不安全，统一使用 spawn
+        mp_context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=mp_context,
+            initializer=_init_worker,
+            initargs=(self.settings, self.output_dir, self.profile, plan),
+        ) as executor:
+            for path, result, error in ordered_bounded_map(
+                _export_in_worker, paths, self.max_in_flight, executor=executor, skip=skip
+            ):
+                if error is not None:
+                    result = ExportResult(source=path, error=str(error))
+                if result.profile is not None:
+                    instrumentation.merge(result.profile)
+                    result.profile = None
+                yield result
+
+    def _iter_pipeline(self, context: BatchContext, paths: Iterator[Path], skip=None) -> Iterator[ExportResult]:
+        pipeline = Pipeline(context.pipeline_stages(self.stage_threads), max_in_flight=self.max_in_flight)
+        try:
+            for path, result, error in pipeline.map(paths, skip=skip):
+                yield result if error is None else ExportResult(source=path, error=str(error))
+        finally:
+            self.last_pipeline_stats = pipeline.stats()
+            if self.profile:
+                print(f"[INFO] 流水线各阶段统计:\n{format_stats(self.last_pipeline_stats)}")
+
+    def run(self, paths: Iterable[Path], total: Optional[int] = None) -> List[ExportResult]:
+        """导出所有图片（被取消时只到取消为止），返回与输入顺序一致的结果列表"""
+        return list(self.iter_run(paths, total))
+
+    @staticmethod
+    def _report(result: ExportResult):
+        if not result.ok:
+            print(f"[WARN] 导出失败 {result.source}: {result.error}")
@@ -0,0 +1,184 @@
+# watermark/catalog.py
+
+import os
+import stat
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence
+
+from PIL import Image
+
+from .scanner import path_key
+
+
+class ImageRecord:
+    """
+    目录中的一张图片。使用 __slots__，10 万条记录也只占很少内存；
+    路径以 str 保存（比 Path 对象小得多），需要时再转换。
+    """
+    __slots__ = ("path", "key", "size", "mtime_ns", "width", "height", "format", "thumbnail")
+
+    def __init__(self, path: str, key: str, size: int = 0, mtime_ns: int = 0, fmt: Optional[str] = None):
+        self.path = path
+        self.key = key
+        self.size = size
+        self.mtime_ns = mtime_ns
+        # 尺寸在首次解码（预览、缩略图）或调用 load_info 时才填写
+        self.width = 0
+        self.height = 0
+        self.format = fmt
+        # 缩略图句柄，由界面层设置（如 QIcon）
+        self.thumbnail: Any = None
+
+    @property
+    def name(self) -> str:
+        return os.path.basename(self.path)
+
+    def as_path(self) -> Path:
+        return Path(self.path)
+
+    def load_info(self):
+        """只读取文件头，填写尺寸与格式"""
+        with Image.open(self.path) as img:
+            self.width, self.height = img.size
+            self.format = img.format
+
+    def __repr__(self):
+        return f"ImageRecord({self.path!r})"
+
+
+class ImageCatalog:
+    """
+    已导入图片的目录，界面列表与批量导出共用的唯一数据源。
+    按导入顺序保存，按路径键（真实路径）O(1) 查找与去重；
+    行号索引在删除后惰性重建，批量删除只需重建一次。
+    """
+
+    def __init__(self, extensions: Optional[Sequence[str]] = None):
+        self.extensions = None if extensions is None else {e.lower() for e in extensions}
+        self._records: List[ImageRecord] = []
+        self._by_key: Dict[str, ImageRecord] = {}
+        # 按导入时的原始路径字符串索引，界面用同一字符串查询时不必再解析真实路径
+        self._by_path: Dict[str, ImageRecord] = {}
+        self._rows: Dict[str, int] = {}
+        self._rows_valid = True
+        # 文件夹 -> 解析后的真实路径；同一文件夹下的图片只解析一次
+        self._real_dirs: Dict[str, str] = {}
+
+    # ------------------------------
+    # 添加/删除
+    # ------------------------------
+    def add(self, path, key: Optional[str] = None) -> Optional[ImageRecord]:
+        """添加一张图片；不支持的格式、不存在的文件和重复的路径返回 None"""
+        path = os.fspath(path)
+        if path in self._by_path:
+            return None
+        ext = os.path.splitext(path)[1].lower()
+        if self.extensions is not None and ext not in self.extensions:
+            return None
+        try:
+            st = os.lstat(path)
+            if stat.S_ISLNK(st.st_mode):
+                st = os.stat(path)
+                key = key or path_key(path)
+        except OSError:
+            return None
+        key = key or self._key(path)
+        if key in self._by_key:
+            return None
+
+        record = ImageRecord(path, key, st.st_size, st.st_mtime_ns, Image.registered_extensions().get(ext))
+        if self._rows_valid:
+            self._rows[key] = len(self._records)
+        self._records.append(record)
+        self._by_key[key] = record
+        self._by_path[path] = record
+        return record
+
+    def _key(self, path: str) -> str:
+        """非符号链接文件的路径键：解析过的文件夹 + 文件名，结果与 scanner.path_key 一致"""
+        folder, name = os.path.split(os.path.abspath(path))
+        real_folder = self._real_dirs.get(folder)
+        if real_folder is None:
+            real_folder = self._real_dirs[folder] = os.path.realpath(folder)
+        return os.path.normcase(os.path.join(real_folder, name))
+
+    def extend(self, paths: Iterable) -> List[ImageRecord]:
+        """批量添加，返回新加入的记录"""
+        added = []
+        for p in paths:
+            record = self.add(p)
+            if record is not None:
+                added.append(record)
+        return added
+
+    def remove(self, paths: Iterable) -> List[ImageRecord]:
+        """批量删除（参数可以是路径或记录），返回实际删除的记录"""
+        removed = []
+        for p in paths:
+            record = p if isinstance(p, ImageRecord) else self.get(p)
+            if record is not None and self._by_key.pop(record.key, None) is not None:
+                self._by_path.pop(record.path, None)
+                removed.append(record)
+        if removed:
+            gone = {r.key for r in removed}
+            self._records = [r for r in self._records if r.key not in gone]
+            self._rows_valid = False
+        return removed
+
+    def remove_rows(self, rows: Iterable[int]) -> List[ImageRecord]:
+        """按行号批量删除"""
+        return self.remove([self._records[r] for r in sorted(set(rows))])
+
+    def clear(self):
+        self._records.clear()
+        self._by_key.clear()
+        self._by_path.clear()
+        self._rows.clear()
+        self._rows_valid = True
+
+    # ------------------------------
+    # 查询
+    # ------------------------------
+    def get(self, path) -> Optional[ImageRecord]:
+        path = os.fspath(path)
+        record = self._by_path.get(path)
+        if record is not None:
+            return record
+        if os.path.islink(path):
+            return self._by_key.get(path_key(path))
+        return self._by_key.get(self._key(path))
+
+    def row_of(self, path) -> int:
+        """返回图片所在行号，不存在时返回 -1"""
+        if not self._rows_valid:
+            self._rows = {r.key: i for i, r in enumerate(self._records)}
+            self._rows_valid = True
+        record = self.get(path)
+        return -1 if record is None else self._rows[record.key]
+
+    def update_info(self, path, size=None, fmt: Optional[str] = None, thumbnail: Any = None):
+        """补充记录的尺寸、格式或缩略图句柄"""
+        record = self.get(path)
+        if record is None:
+            return
+        if size is not None:
+            record.width, record.height = size
+        if fmt is not None:
+            record.format = fmt
+        if thumbnail is not None:
+            record.thumbnail = thumbnail
+
+    def paths(self) -> List[Path]:
+        return [Path(r.path) for r in self._records]
+
+    def __getitem__(self, row: int) -> ImageRecord:
+        return self._records[row]
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+    def __iter__(self) -> Iterator[ImageRecord]:
+        return iter(list(self._records))
+
+    def __contains__(self, path) -> bool:
+        return self.get(path) is not None
@@ -0,0 +1,159 @@
+# watermark/cli.py
+"""
+命令行批量加水印（不依赖 PyQt，可在无显示环境的服务器、定时任务中运行）：
+
+    python -m watermark photos/ "more/*.jpg" -o out --template 1 -j 4
+"""
+
+import argparse
+import glob
+import json
+import os
+import sys
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional
+
+from .compositing import BACKENDS
+from .file_manager import FileManager
+
+# 未指定 -j 时，图片不少于该数量才启动多进程：spawn 进程池的启动（每个进程重新导入 Pillow 等）约需 1 秒，
+# 小批量在当前进程的流水线中处理反而更早出结果
+AUTO_PARALLEL_MIN_IMAGES = 32
+
+
+def default_workers(image_count: int) -> int:
+    """未指定 -j 时的进程数：小批量用当前进程的流水线，大批量用 min(CPU 核数, 图片数) 个进程"""
+    if image_count < AUTO_PARALLEL_MIN_IMAGES:
+        return 1
+    return max(1, min(os.cpu_count() or 1, image_count))
+
+
+def collect_inputs(patterns: Iterable[str], recursive: bool = False) -> List[Path]:
+    """
+    把文件、文件夹、通配符展开为图片路径列表（保持顺序并去重）
+    """
+    roots: List[str] = []
+    for pattern in patterns:
+        if os.path.exists(pattern):
+            roots.append(pattern)
+            continue
+        matches = sorted(glob.glob(pattern, recursive=True))
+        if not matches:
+            print(f"[WARN] 没有匹配的文件: {pattern}", file=sys.stderr)
+        roots.extend(matches)
+    return list(FileManager().scan(*roots, recursive=recursive))
+
+
+def load_settings(args: argparse.Namespace) -> Dict[str, Any]:
+    """从模板或设置 JSON 读取水印参数，再用命令行选项覆盖"""
+    settings: Dict[str, Any] = {}
+    if args.template:
+        from .config_manager import ConfigManager
+        settings = ConfigManager(args.template_dir).load_template(args.template)
+    elif args.settings:
+        with open(args.settings, "r", encoding="utf-8") as f:
+            settings = json.load(f)
+
+    overrides = {
+        "text_content": args.text,
+        "output_format": args.format,
+        "name_rule": args.name_rule,
+        "custom_str": args.custom_str,
+        "jpeg_quality": args.quality,
+        "encode_profile": args.encode_profile,
+        "scale_percent": args.scale,
+        "compositing_backend": args.backend,
+    }
+    settings.update({k: v for k, v in overrides.items() if v is not None})
+    return settings
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="python -m watermark",
+        description="批量给图片添加水印（无界面）",
+    )
+    parser.add_argument("inputs", nargs="+", help="图片文件、文件夹或通配符（如 \"photos/**/*.jpg\"）")
+    parser.add_argument("-o", "--output", required=True, help="导出目录（不能是原图所在目录）")
+    parser.add_argument("-r", "--recursive", action="store_true", help="递归导入文件夹中的图片")
+
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument("-t", "--template", help="使用已保存的模板名称")
+    source.add_argument("-s", "--settings", help="水印设置 JSON 文件（与界面 get_current_settings 的键相同）")
+    parser.add_argument("--template-dir", default="templates", help="模板目录（默认 templates）")
+
+    parser.add_argument("--text", help="文本水印内容（覆盖模板）")
+    parser.add_argument("-f", "--format", choices=FileManager.SUPPORTED_OUTPUT_FORMATS, help="导出格式")
+    parser.add_argument("--name-rule", choices=["original", "prefix", "suffix"], help="命名规则")
+    parser.add_argument("--custom-str", help="命名前缀/后缀")
+    parser.add_argument("--quality", type=int, help="JPEG 质量（0-100）")
+    parser.add_argument(
+        "--encode-profile", choices=list(FileManager.ENCODE_PROFILES), help="编码方案：fast 最快、balanced 默认、smallest 文件最小"
+    )
+    parser.add_argument("--scale", type=int, help="导出缩放百分比")
+    parser.add_argument("--backend", choices=BACKENDS, help="合成后端（numpy 需要安装 NumPy，默认 pillow）")
+    parser.add_argument("-i", "--incremental", action="store_true", help="增量导出：跳过源文件与设置都未变化的图片")
+    parser.add_argument(
+        "-j", "--jobs", type=int,
+        help=f"并行进程数（默认：少于 {AUTO_PARALLEL_MIN_IMAGES} 张时在当前进程处理，否则为 CPU 核数）",
+    )
+    parser.add_argument("--no-pipeline", action="store_true", help="单进程（-j 1）时逐张串行处理，不使用分阶段流水线")
+    parser.add_argument("--profile", action="store_true", help="打印各阶段耗时")
+    parser.add_argument("--trace", help="输出 Chrome trace JSON 的路径（隐含 --profile）")
+    parser.add_argument("-q", "--quiet", action="store_true", help="只输出错误")
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = build_parser().parse_args(argv)
+    start = time.perf_counter()
+
+    from .plan import WatermarkPlan
+
+    try:
+        settings = load_settings(args)
+    except (OSError, ValueError) as e:
+        print(f"[ERROR] 读取水印设置失败: {e}", file=sys.stderr)
+        return 2
+    try:
+        # 在处理图片之前编译水印方案，Logo 路径无效等错误同样以状态码 2 退出，而不是抛出异常
+        plan = WatermarkPlan.compile(settings)
+    except Exception as e:
+        print(f"[ERROR] 水印设置无效: {e}", file=sys.stderr)
+        return 2
+
+    paths = collect_inputs(args.inputs, args.recursive)
+    if not paths:
+        print("[ERROR] 没有找到可处理的图片", file=sys.stderr)
+        return 2
+
+    # 放在参数检查之后导入，--help 与参数错误时不加载进程池相关模块
+    from .batch import BatchExporter
+
+    # 图片少于进程数时多开进程只会增加启动开销；只有一张图时直接在当前进程处理
+    workers = max(1, min(args.jobs, len(paths))) if args.jobs else default_workers(len(paths))
+    exporter = BatchExporter(
+        settings,
+        args.output,
+        workers=workers,
+        profile=True if (args.profile or args.trace) else None,
+        trace_path=Path(args.trace) if args.trace else None,
+        incremental=args.incremental,
+        pipeline=False if args.no_pipeline else None,
+        plan=plan,
+    )
+
+    failed = skipped = 0
+    for i, result in enumerate(exporter.iter_run(paths), 1):
+        if not result.ok:
+            failed += 1
+        elif result.skipped:
+            skipped += 1
+        elif not args.quiet:
+            print(f"[{i}/{len(paths)}] {result.source} -> {result.output}")
+
+    elapsed = time.perf_counter() - start
+    if not args.quiet or failed:
+        print(f"[OK] 导出完成: 成功 {len(paths) - failed - skipped} 张，跳过 {skipped} 张，失败 {failed} 张，用时 {elapsed:.2f}s")
+    return 1 if failed else 0
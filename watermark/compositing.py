@@ -0,0 +1,143 @@
+# watermark/compositing.py
+
+import os
+from typing import Callable, NamedTuple, Optional, Tuple
+from PIL import Image, ImageChops
+
+# 可以不做整幅转换、直接在原模式下合成的底图模式
+INPLACE_MODES = ("RGBA", "RGB", "L")
+
+# 合成后端："pillow"（默认）或 "numpy"（需要安装 NumPy，见 compositing_numpy）
+BACKENDS = ("pillow", "numpy")
+# 环境变量指定默认后端：PHOTO_WATERMARK_BACKEND=numpy
+BACKEND_ENV = "PHOTO_WATERMARK_BACKEND"
+_numpy_warned = False
+
+
+def clip_box(
+    base_size: Tuple[int, int],
+    sprite_size: Tuple[int, int],
+    dest: Tuple[int, int],
+) -> Optional[Tuple[Tuple[int, int, int, int], Tuple[int, int]]]:
+    """
+    计算精灵贴到底图 dest 处时与底图相交的区域。
+    :return: (底图上的区域 box, 精灵内对应区域的左上角)；完全不相交时返回 None
+    """
+    bw, bh = base_size
+    sw, sh = sprite_size
+    x, y = dest
+    left, top = max(0, x), max(0, y)
+    right, bottom = min(bw, x + sw), min(bh, y + sh)
+    if right <= left or bottom <= top:
+        return None
+    return (left, top, right, bottom), (left - x, top - y)
+
+
+def normalize_mode(img: Image.Image) -> Image.Image:
+    """
+    把解码后的图片转换为可原地合成的模式：RGB/RGBA/L 保持不变，
+    带透明通道的其他模式转为 RGBA，其余转为 RGB。
+    """
+    if img.mode in INPLACE_MODES:
+        return img
+    if img.mode in ("LA", "PA", "La", "RGBa") or "transparency" in img.info:
+        return img.convert("RGBA")
+    return img.convert("RGB")
+
+
+def prepare_base(img: Image.Image, in_place: bool = False, allow_gray: bool = False) -> Image.Image:
+    """
+    返回用于合成水印的底图。
+    in_place=False 时返回 RGBA 副本（原图不变）；
+    in_place=True 时 RGB/RGBA 直接在原图上修改，L 仅在水印本身是灰度时原地修改，
+    其余模式仍转换为 RGBA。
+    """
+    if not in_place:
+        return img.convert("RGBA") if img.mode != "RGBA" else img.copy()
+    if img.mode in ("RGBA", "RGB") or (img.mode == "L" and allow_gray):
+        return img
+    return img.convert("RGBA")
+
+
+def is_grayscale(sprite: Image.Image) -> bool:
+    """判断 RGBA 精灵的颜色通道是否全为灰度（决定能否直接合成到 L 模式底图）"""
+    r, g, b = sprite.split()[:3]
+    return ImageChops.difference(r, g).getbbox() is None and ImageChops.difference(g, b).getbbox() is None
+
+
+def composite_sprite(base: Image.Image, sprite: Image.Image, dest: Tuple[int, int]):
+    """
+    把 RGBA 精灵以 alpha 合成的方式原地叠加到底图上，只处理精灵覆盖的区域。
+    RGBA 底图直接合成；RGB/L 底图只把该区域转换为 RGBA，合成后再写回原模式。
+    超出底图边界的部分被裁掉（包括负坐标）。
+    """
+    clipped = clip_box(base.size, sprite.size, dest)
+    if clipped is None:
+        return
+    box, src = clipped
+    src_box = src + (src[0] + box[2] - box[0], src[1] + box[3] - box[1])
+    if base.mode == "RGBA":
+        base.alpha_composite(sprite, dest=box[:2], source=src_box)
+        return
+
+    region = base.crop(box).convert("RGBA")
+    region.alpha_composite(sprite, source=src_box)
+    base.paste(region.convert(base.mode), box)
+
+
+def paste_sprite(base: Image.Image, sprite: Image.Image, dest: Tuple[int, int]):
+    """以精灵自身的 alpha 为蒙版原地粘贴，Pillow 只会处理精灵覆盖的区域"""
+    base.paste(sprite, dest, sprite)
+
+
+class Layer(NamedTuple):
+    """
+    已定位好的水印图层：sprite 贴到底图 dest 处，由 blend（composite_sprite 或 paste_sprite）合成。
+    gray 表示水印本身是灰度的，可以直接合成到 L 模式底图；stage 为计时阶段名。
+    """
+    sprite: Image.Image
+    dest: Tuple[int, int]
+    blend: Callable[[Image.Image, Image.Image, Tuple[int, int]], None]
+    gray: bool
+    stage: str
+
+    def rows(self) -> Tuple[int, int]:
+        """图层覆盖的行范围 [top, bottom)"""
+        return self.dest[1], self.dest[1] + self.sprite.height
+
+    def apply(self, base: Image.Image, origin: Tuple[int, int] = (0, 0)):
+        """
+        把图层合成到 base 上；base 是整幅图片中左上角位于 origin 的一块（如按行带处理时的一带），
+        图层坐标按 origin 平移后再合成，超出 base 的部分被裁掉。
+        """
+        self.blend(base, self.sprite, (self.dest[0] - origin[0], self.dest[1] - origin[1]))
+
+
+def resolve_backend(backend: Optional[str] = None) -> str:
+    """
+    确定实际使用的合成后端：参数优先，其次是环境变量，默认 "pillow"。
+    指定了 "numpy" 但没有安装 NumPy 时退回 "pillow"。
+    """
+    name = (backend or os.environ.get(BACKEND_ENV) or "pillow").lower()
+    if name not in BACKENDS:
+        raise ValueError(f"未知的合成后端: {name}（可选: {', '.join(BACKENDS)}）")
+    if name == "numpy":
+        from . import compositing_numpy
+        if not compositing_numpy.AVAILABLE:
+            global _numpy_warned
+            if not _numpy_warned:
+                print("[WARN] 未安装 NumPy，合成后端退回 pillow")
+                _numpy_warned = True
+            return "pillow"
+    return name
+
+
+def blend_function(kind: str, backend: Optional[str] = None) -> Callable[[Image.Image, Image.Image, Tuple[int, int]], None]:
+    """
+    返回指定后端的合成函数。
+    :param kind: "over"（alpha 合成，同 composite_sprite）或 "mask"（以 alpha 为蒙版粘贴，同 paste_sprite）
+    """
+    if resolve_backend(backend) == "numpy":
+        from . import compositing_numpy
+        return compositing_numpy.composite_sprite if kind == "over" else compositing_numpy.paste_sprite
+    return composite_sprite if kind == "over" else paste_sprite
@@ -0,0 +1,157 @@
+# watermark/compositing_numpy.py
+
+import threading
+from typing import Dict, NamedTuple, Sequence, Tuple
+
+from PIL import Image
+
+from .compositing import clip_box
+
+try:
+    import numpy as np
+except ImportError:  # NumPy 是可选依赖
+    np = None
+
+# NumPy 合成后端：水印精灵预乘 alpha 后缓存，合成时直接在底图数组（或其视图）上原地计算，
+# 全部使用整数运算并精确舍入，与 Pillow 路径的结果每个通道相差不超过 1
+AVAILABLE = np is not None
+
+# 合成方式："over" 与 Image.alpha_composite 一致，"mask" 与 Image.paste(sprite, dest, sprite) 一致
+MODES = ("over", "mask")
+
+
+class PremultipliedSprite(NamedTuple):
+    """
+    预乘后的精灵（uint16）：color = 颜色 × alpha（不除以 255，不损失精度），inverse = 255 - alpha。
+    255 × 255 以内的乘积与和都能放进 uint16，不透明底图的合成全程不必升到 32 位。
+    """
+    color: "np.ndarray"  # (h, w, c)
+    alpha: "np.ndarray"  # (h, w, 1)
+    inverse: "np.ndarray"  # (h, w, 1)
+
+    @property
+    def size(self) -> Tuple[int, int]:
+        return self.alpha.shape[1], self.alpha.shape[0]
+
+
+def premultiply(sprite: Image.Image, gray: bool = False) -> PremultipliedSprite:
+    """
+    把 RGBA 精灵转换为预乘形式。
+    gray 为 True 时先转换为 LA（与 Pillow 把水印合成到 L 底图时的亮度公式一致）。
+    """
+    arr = np.asarray(sprite.convert("LA") if gray else sprite.convert("RGBA"), dtype=np.uint16)
+    alpha = arr[..., -1:]
+    return PremultipliedSprite(arr[..., :-1] * alpha, alpha, 255 - alpha)
+
+
+def _div255(x: "np.ndarray") -> "np.ndarray":
+    """整数精确计算 round(x / 255)，x 取值 0 ~ 65025（255 × 255 以内）；原地修改并返回 x"""
+    x += 128
+    x += x >> 8
+    x >>= 8
+    return x
+
+
+def _blend_opaque(region: "np.ndarray", color: "np.ndarray", inverse: "np.ndarray"):
+    """region = round((s·a + d·(255 - a)) / 255)，uint16 原地计算"""
+    acc = region.astype(np.uint16)
+    acc *= inverse
+    acc += color
+    region[...] = _div255(acc)
+
+
+def blend(dst: "np.ndarray", sprite: PremultipliedSprite, dest: Tuple[int, int], mode: str = "over"):
+    """
+    把预乘精灵原地合成到 dst 上，超出边界的部分被裁掉。
+    :param dst: uint8 数组，形状为 (..., H, W, C)：C 与精灵颜色通道数相同时视为不透明底图，
+                多一个通道时最后一个通道为 alpha；前面可以有任意批量维度（一叠同尺寸图片），
+                同一精灵会在一次向量化运算中合成到所有图片上。dst 可以是更大数组的视图。
+    :param dest: 精灵左上角在 dst 中的坐标
+    :param mode: "over"（alpha 合成）或 "mask"（以精灵 alpha 为蒙版粘贴，alpha 通道同样按蒙版混合）
+    """
+    h, w, channels = dst.shape[-3:]
+    clipped = clip_box((w, h), sprite.size, dest)
+    if clipped is None:
+        return
+    (left, top, right, bottom), (sx, sy) = clipped
+    region = dst[..., top:bottom, left:right, :]
+    rows, cols = bottom - top, right - left
+    s_color = sprite.color[sy:sy + rows, sx:sx + cols]
+    s_alpha = sprite.alpha[sy:sy + rows, sx:sx + cols]
+    inverse = sprite.inverse[sy:sy + rows, sx:sx + cols]
+    c = s_color.shape[-1]
+
+    if channels == c:
+        # 不透明底图上 "over" 与 "mask" 结果相同
+        _blend_opaque(region, s_color, inverse)
+        return
+    if channels != c + 1:
+        raise ValueError(f"底图通道数 {channels} 与精灵通道数 {c} 不匹配")
+
+    if mode == "mask":
+        _blend_opaque(region[..., :c], s_color, inverse)
+        _blend_opaque(region[..., c:], s_alpha * s_alpha, inverse)
+        return
+
+    # alpha 合成：out_a·255 = a·255 + d_a·(255 - a)，颜色按 out_a 归一化后精确舍入（需要 32 位）
+    d_color = region[..., :c].astype(np.uint32)
+    d_alpha = region[..., c:].astype(np.uint32)
+    weight = d_alpha * inverse
+    out_a255 = s_alpha * np.uint32(255) + weight
+    numerator = s_color * np.uint32(255) + d_color * weight
+    safe = np.maximum(out_a255, 1)
+    region[..., :c] = np.where(out_a255 > 0, (numerator + safe // 2) // safe, d_color)
+    region[..., c:] = _div255(out_a255)
+
+
+# 预乘结果缓存：(id(精灵), 是否灰度) -> (精灵, 预乘结果)；精灵本身也被引用，id 不会被复用
+_CACHE_SIZE = 32
+_cache: Dict[Tuple[int, bool], Tuple[Image.Image, PremultipliedSprite]] = {}
+_cache_lock = threading.Lock()
+
+
+def _premultiplied(sprite: Image.Image, gray: bool) -> PremultipliedSprite:
+    key = (id(sprite), gray)
+    with _cache_lock:
+        entry = _cache.get(key)
+        if entry is not None and entry[0] is sprite:
+            return entry[1]
+    result = premultiply(sprite, gray)
+    with _cache_lock:
+        if len(_cache) >= _CACHE_SIZE:
+            _cache.pop(next(iter(_cache)))
+        _cache[key] = (sprite, result)
+    return result
+
+
+def _to_array(img: Image.Image) -> "np.ndarray":
+    arr = np.array(img)
+    return arr[..., None] if arr.ndim == 2 else arr
+
+
+def composite_stack(bases: Sequence[Image.Image], sprite: Image.Image, dest: Tuple[int, int], mode: str = "over"):
+    """
+    把同一个精灵原地合成到一组同尺寸、同模式（RGB/RGBA/L）的图片上。
+    只取出精灵覆盖的区域组成一个数组，一次向量化运算完成后再写回各图片。
+    """
+    if not bases:
+        return
+    clipped = clip_box(bases[0].size, sprite.size, dest)
+    if clipped is None:
+        return
+    box, _ = clipped
+    gray = bases[0].mode == "L"
+    stack = np.stack([_to_array(img.crop(box)) for img in bases])
+    blend(stack, _premultiplied(sprite, gray), (dest[0] - box[0], dest[1] - box[1]), mode)
+    for img, region in zip(bases, stack):
+        img.paste(Image.fromarray(region[..., 0] if gray else region), box)
+
+
+def composite_sprite(base: Image.Image, sprite: Image.Image, dest: Tuple[int, int]):
+    """与 compositing.composite_sprite 相同的接口与语义（alpha 合成）"""
+    composite_stack([base], sprite, dest, "over")
+
+
+def paste_sprite(base: Image.Image, sprite: Image.Image, dest: Tuple[int, int]):
+    """与 compositing.paste_sprite 相同的接口与语义（以精灵 alpha 为蒙版粘贴）"""
+    composite_stack([base], sprite, dest, "mask")
@@ -1,38 +1,78 @@
 # watermark/file_manager.py
+import io
 import os
 from pathlib import Path
-from typing import List, Tuple, Optional
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Tuple, Optional, Union
 from PIL import Image
 
+from . import instrumentation
+from .catalog import ImageCatalog
+from .manifest import ExportManifest, atomic_open, atomic_write_bytes, settings_hash
+from .scanner import scan_paths
+from .streaming import ordered_bounded_map
+from .tiled import LayersForSize, export_tiled
+
+# 批量导出的工作项图片：已解码的图片，或按需解码并返回图片的函数
+ImageSource = Union[Image.Image, Callable[[], Image.Image]]
+
 
 class FileManager:
-    SUPPORTED_INPUT_FORMATS = [".jpg", ".jpeg", ".png", ".bmp", ".tiff"]
-    SUPPORTED_OUTPUT_FORMATS = ["JPEG", "PNG"]
+    SUPPORTED_INPUT_FORMATS = [".jpg", ".jpeg", ".png", ".bmp", ".tiff", ".tif"]
+    SUPPORTED_OUTPUT_FORMATS = ["JPEG", "PNG", "TIFF"]
+    OUTPUT_EXTENSIONS = {"JPEG": ".jpg", "PNG": ".png", "TIFF": ".tif"}
+    # 编码方案：按速度与文件大小的取舍设置各格式的保存参数（JPEG 质量仍由 jpeg_quality 单独控制）
+    # balanced 与之前的默认编码完全相同；方案中没有列出的格式使用 balanced 的参数
+    ENCODE_PROFILES = {
+        # 不含 JPEG：Pillow 的默认 JPEG 编码（4:2:0、不优化哈夫曼表）已是最快的设置，没有更快的选项
+        "fast": {
+            "PNG": {"compress_level": 1},
+            # 照片用 Deflate 压缩收益有限，最快的方案直接不压缩
+            "TIFF": {"compression": "raw"},
+        },
+        "balanced": {
+            "JPEG": {},
+            "PNG": {"compress_level": 6},
+            "TIFF": {"compression": "tiff_deflate"},
+        },
+        "smallest": {
+            "JPEG": {"subsampling": "4:2:0", "optimize": True, "progressive": True},
+            "PNG": {"compress_level": 9},
+            # 水平差分预测（Predictor=2）：存相邻像素的差值，照片的 Deflate 压缩率约提高一倍，仍为无损
+            "TIFF": {"compression": "tiff_deflate", "tiffinfo": {317: 2}},
+        },
+    }
+    DEFAULT_ENCODE_PROFILE = "balanced"
 
     def __init__(self):
-        self.imported_files: List[Path] = []
+        # 已导入图片的目录（按导入顺序，按真实路径去重），界面与导出共用
+        self.catalog = ImageCatalog(self.SUPPORTED_INPUT_FORMATS)
+
+    @property
+    def imported_files(self) -> List[Path]:
+        return self.catalog.paths()
 
     # ------------------------------
     # 导入功能
     # ------------------------------
     def import_files(self, file_paths: List[str]) -> List[Path]:
-        """导入单张或多张图片，返回有效文件路径列表"""
-        valid_files = []
-        for f in file_paths:
-            p = Path(f)
-            if p.suffix.lower() in self.SUPPORTED_INPUT_FORMATS and p.exists():
-                valid_files.append(p)
-        self.imported_files.extend(valid_files)
-        return valid_files
-
-    def import_folder(self, folder_path: str) -> List[Path]:
+        """导入单张或多张图片，返回新导入的有效文件路径列表（已导入过的文件会被忽略）"""
+        return [Path(record.path) for record in self.catalog.extend(file_paths)]
+
+    def import_folder(self, folder_path: str, recursive: bool = False, max_depth: Optional[int] = None) -> List[Path]:
         """导入整个文件夹中的图片"""
         folder = Path(folder_path)
         if not folder.is_dir():
             return []
-        valid_files = [f for f in folder.iterdir() if f.suffix.lower() in self.SUPPORTED_INPUT_FORMATS]
-        self.imported_files.extend(valid_files)
-        return valid_files
+        return self.import_files(list(self.scan(folder, recursive=recursive, max_depth=max_depth)))
+
+    def scan(self, *roots, **kwargs) -> Iterator[Path]:
+        """按支持的输入格式扫描文件/文件夹（参数见 scanner.scan_paths），边扫描边产出"""
+        kwargs.setdefault("extensions", self.SUPPORTED_INPUT_FORMATS)
+        return scan_paths(roots, **kwargs)
+
+    def remove_files(self, file_paths: Iterable) -> int:
+        """从已导入列表中移除文件，返回实际移除的数量"""
+        return len(self.catalog.remove(file_paths))
 
     def get_imported_files(self) -> List[Path]:
         """返回当前已导入的文件列表"""
@@ -50,33 +90,100 @@ class FileManager:
         name_rule: str = "suffix",
         custom_str: str = "_watermarked",
         jpeg_quality: int = 90,
-        scale_percent: float = 1.0
+        scale_percent: float = 1.0,
+        encode_profile: str = DEFAULT_ENCODE_PROFILE
     ) -> Path:
         """
         导出单张图片
         :param img: PIL.Image
         :param original_path: 原图路径
         :param output_dir: 导出目录
-        :param output_format: "JPEG" 或 "PNG"
+        :param output_format: "JPEG"、"PNG" 或 "TIFF"
         :param name_rule: "original"/"prefix"/"suffix"
         :param custom_str: 前/后缀字符串
         :param jpeg_quality: JPEG质量
         :param scale_percent: 缩放比例（0.1 ~ 5.0）
+        :param encode_profile: 编码方案（见 ENCODE_PROFILES）
         """
-        if output_format not in self.SUPPORTED_OUTPUT_FORMATS:
-            raise ValueError(f"不支持的导出格式: {output_format}")
+        output_path = self.prepare_output(original_path, output_dir, output_format, name_rule, custom_str)
 
         # 缩放图片
         if scale_percent != 1.0:
             new_size = (int(img.width * scale_percent), int(img.height * scale_percent))
-            img = img.resize(new_size, Image.Resampling.LANCZOS)
+            with instrumentation.stage("resize"):
+                img = img.resize(new_size, Image.Resampling.LANCZOS)
+
+        # 保存：编码与写盘分开，便于分别计时
+        data = self.encode_image(img, output_format, jpeg_quality, encode_profile)
+        self.write_bytes(output_path, data)
+        return output_path
+
+    def export_large_image(
+        self,
+        original_path: Path,
+        output_dir: str,
+        layers_for_size: LayersForSize,
+        output_format: str = "PNG",
+        name_rule: str = "suffix",
+        custom_str: str = "_watermarked",
+        jpeg_quality: int = 90,
+        encode_profile: str = DEFAULT_ENCODE_PROFILE,
+        scale_percent: float = 1.0
+    ) -> Path:
+        """
+        按行带导出超大图片：逐带读取（并缩放）、只在水印覆盖的行带上合成、逐带编码写盘，
+        峰值内存取决于行带大小而不是图片尺寸（无法按行带解码的输入与 JPEG 输出除外，见 watermark.tiled）。
+        :param layers_for_size: 根据输出尺寸返回水印图层列表的函数
+        :param scale_percent: 缩放比例（同 export_image）
+        其余参数同 export_image
+        """
+        original_path = Path(original_path)
+        output_path = self.prepare_output(original_path, output_dir, output_format, name_rule, custom_str)
+        with atomic_open(output_path) as f:
+            export_tiled(
+                original_path,
+                f,
+                layers_for_size,
+                output_format,
+                jpeg_quality,
+                save_params=self.encode_params(output_format, jpeg_quality, encode_profile),
+                compress_level=self.zlib_level(encode_profile),
+                scale=scale_percent,
+            )
+            instrumentation.count("bytes_written", f.tell())
+        return output_path
+
+    def prepare_output(
+        self,
+        original_path: Path,
+        output_dir: str,
+        output_format: str = "PNG",
+        name_rule: str = "suffix",
+        custom_str: str = "_watermarked"
+    ) -> Path:
+        """检查导出格式、创建导出目录并返回导出路径"""
+        if output_format not in self.SUPPORTED_OUTPUT_FORMATS:
+            raise ValueError(f"不支持的导出格式: {output_format}")
 
         # 处理输出目录
-        output_dir = Path(output_dir)
-        output_dir.mkdir(parents=True, exist_ok=True)
+        Path(output_dir).mkdir(parents=True, exist_ok=True)
+        output_path = self.build_output_path(original_path, output_dir, output_format, name_rule, custom_str)
+
+        # 防止覆盖原文件
+        if output_path.resolve().parent == Path(original_path).parent:
+            raise ValueError("禁止导出到原文件夹！")
+        return output_path
 
-        # 文件名处理
-        stem = original_path.stem
+    @staticmethod
+    def build_output_path(
+        original_path: Path,
+        output_dir: str,
+        output_format: str = "PNG",
+        name_rule: str = "suffix",
+        custom_str: str = "_watermarked"
+    ) -> Path:
+        """按命名规则计算导出路径（不访问磁盘）"""
+        stem = Path(original_path).stem
         if name_rule == "prefix":
             new_name = f"{custom_str}{stem}"
         elif name_rule == "suffix":
@@ -84,40 +191,78 @@ class FileManager:
         else:
             new_name = stem
 
-        ext = ".jpg" if output_format == "JPEG" else ".png"
-        output_path = output_dir / f"{new_name}{ext}"
-
-        # 防止覆盖原文件
-        if output_path.resolve().parent == original_path.parent:
-            raise ValueError("禁止导出到原文件夹！")
+        ext = FileManager.OUTPUT_EXTENSIONS.get(output_format, ".png")
+        return Path(output_dir) / f"{new_name}{ext}"
 
-        # 保存
-        save_params = {}
+    @classmethod
+    def encode_params(
+        cls, output_format: str, jpeg_quality: int = 90, encode_profile: str = DEFAULT_ENCODE_PROFILE
+    ) -> Dict[str, Any]:
+        """按编码方案返回 Image.save 的参数"""
+        profile = cls.ENCODE_PROFILES.get(encode_profile)
+        if profile is None:
+            raise ValueError(f"未知的编码方案: {encode_profile}")
+        default_params = cls.ENCODE_PROFILES[cls.DEFAULT_ENCODE_PROFILE].get(output_format, {})
+        save_params = dict(profile.get(output_format, default_params))
         if output_format == "JPEG":
             save_params["quality"] = jpeg_quality
+        return save_params
+
+    @classmethod
+    def zlib_level(cls, encode_profile: str = DEFAULT_ENCODE_PROFILE) -> int:
+        """超大图片逐带写出 PNG/分块 TIFF 时使用的 zlib 压缩级别（取该方案的 PNG 压缩级别）"""
+        return cls.encode_params("PNG", encode_profile=encode_profile)["compress_level"]
+
+    def encode_image(
+        self,
+        img: Image.Image,
+        output_format: str = "PNG",
+        jpeg_quality: int = 90,
+        encode_profile: str = DEFAULT_ENCODE_PROFILE
+    ) -> bytes:
+        """把图片编码为指定格式的字节串"""
+        save_params = self.encode_params(output_format, jpeg_quality, encode_profile)
+
+        buffer = io.BytesIO()
+        with instrumentation.stage("encode"):
+            img.save(buffer, output_format, **save_params)
+        return buffer.getvalue()
 
-        img.save(output_path, output_format, **save_params)
+    def write_bytes(self, output_path: Path, data: bytes) -> Path:
+        """把编码好的数据写入磁盘（先写临时文件再改名，中断时不会留下损坏的输出）"""
+        with instrumentation.stage("write"):
+            atomic_write_bytes(output_path, data)
+        instrumentation.count("bytes_written", len(data))
         return output_path
 
-    def batch_export(
+    def iter_batch_export(
         self,
-        images: List[Tuple[Image.Image, Path]],
+        images: Iterable[Tuple[ImageSource, Path]],
         output_dir: str,
         output_format: str = "PNG",
         name_rule: str = "suffix",
         custom_str: str = "_watermarked",
         jpeg_quality: int = 90,
-        scale_percent: float = 1.0
-    ) -> List[Path]:
+        scale_percent: float = 1.0,
+        max_in_flight: int = 1,
+        incremental: bool = False,
+        settings: Optional[Dict[str, Any]] = None,
+        encode_profile: str = DEFAULT_ENCODE_PROFILE
+    ) -> Iterator[Tuple[Path, Optional[Path], Optional[Exception]]]:
         """
-        批量导出
-        :param images: [(PIL.Image, Path), ...]
-        :return: 导出路径列表
+        流式批量导出：每张图片解码、处理、编码写盘后立即释放，再处理下一张
+        :param images: [(PIL.Image 或返回 PIL.Image 的函数, Path), ...]，可以是生成器
+        :param max_in_flight: 同时处理中的最大图片数，峰值内存只取决于它
+        :param incremental: 增量模式，跳过导出清单中已是最新的图片（不会调用其加载函数）
+        :param settings: 增量模式下参与指纹计算的水印参数
+        :param encode_profile: 编码方案（见 ENCODE_PROFILES）
+        :return: 按输入顺序产出 (原图路径, 导出路径, 异常)；跳过的图片同样产出其已有的导出路径
         """
-        exported_files = []
-        for img, original_path in images:
+        def export_item(item):
+            source, original_path = item
+            img = source() if callable(source) else source
             try:
-                out_path = self.export_image(
+                return self.export_image(
                     img,
                     original_path,
                     output_dir,
@@ -125,9 +270,119 @@ class FileManager:
                     name_rule,
                     custom_str,
                     jpeg_quality,
-                    scale_percent
+                    scale_percent,
+                    encode_profile
                 )
+            finally:
+                # 由本方法解码的图片在这里释放，调用方传入的图片交给调用方管理
+                if callable(source):
+                    img.close()
+
+        if not incremental:
+            for (_, original_path), out_path, error in ordered_bounded_map(export_item, images, max_in_flight):
+                yield original_path, out_path, error
+            return
+
+        manifest = self.open_manifest(output_dir, {
+            **(settings or {}),
+            "output_format": output_format,
+            "name_rule": name_rule,
+            "custom_str": custom_str,
+            "jpeg_quality": jpeg_quality,
+            # 这里的缩放是比例，设置字典中是百分比
+            "scale_percent": scale_percent * 100,
+            "encode_profile": encode_profile,
+        })
+        # 原图路径 -> 处理前取得的源文件指纹
+        stamps = {}
+
+        def skip_fresh(item):
+            original_path = item[1]
+            out_path = self.build_output_path(original_path, output_dir, output_format, name_rule, custom_str)
+            fresh, stamp = manifest.check(original_path, out_path)
+            stamps[original_path] = stamp
+            return out_path if fresh else None
+
+        try:
+            for (_, original_path), out_path, error in ordered_bounded_map(
+                export_item, images, max_in_flight, skip=skip_fresh
+            ):
+                stamp = stamps.pop(original_path, None)
+                if error is None:
+                    manifest.record(original_path, out_path, stamp)
+                yield original_path, out_path, error
+        finally:
+            manifest.save()
+            if manifest.skipped:
+                print(f"[INFO] 增量导出：跳过 {manifest.skipped} 张未变化的图片")
+
+    @staticmethod
+    def open_manifest(output_dir: str, settings: Dict[str, Any]) -> ExportManifest:
+        """打开输出目录中的导出清单，settings 为 get_current_settings() 格式的全部参数（见 export_settings_key）"""
+        return ExportManifest(Path(output_dir), export_settings_key(settings))
+
+    def batch_export(
+        self,
+        images: Iterable[Tuple[ImageSource, Path]],
+        output_dir: str,
+        output_format: str = "PNG",
+        name_rule: str = "suffix",
+        custom_str: str = "_watermarked",
+        jpeg_quality: int = 90,
+        scale_percent: float = 1.0,
+        max_in_flight: int = 1,
+        incremental: bool = False,
+        settings: Optional[Dict[str, Any]] = None,
+        encode_profile: str = DEFAULT_ENCODE_PROFILE
+    ) -> List[Path]:
+        """
+        批量导出
+        :param images: [(PIL.Image 或返回 PIL.Image 的函数, Path), ...]，可以是生成器
+        :param max_in_flight: 同时处理中的最大图片数
+        :param incremental: 增量模式，源文件与参数都未变化的图片直接跳过
+        :param settings: 增量模式下参与指纹计算的水印参数
+        :param encode_profile: 编码方案（见 ENCODE_PROFILES）
+        :return: 导出路径列表（含增量模式下跳过的已有文件）
+        """
+        exported_files = []
+        for original_path, out_path, error in self.iter_batch_export(
+            images,
+            output_dir,
+            output_format,
+            name_rule,
+            custom_str,
+            jpeg_quality,
+            scale_percent,
+            max_in_flight,
+            incremental,
+            settings,
+            encode_profile
+        ):
+            if error is not None:
+                print(f"[WARN] 导出失败 {original_path}: {error}")
+            else:
                 exported_files.append(out_path)
-            except Exception as e:
-                print(f"[WARN] 导出失败 {original_path}: {e}")
         return exported_files
+
+
+def export_options(settings: Dict[str, Any]) -> Dict[str, Any]:
+    """从水印设置中取出编码与命名参数"""
+    return {
+        "output_format": settings.get("output_format", "PNG"),
+        "name_rule": settings.get("name_rule", "suffix"),
+        "custom_str": settings.get("custom_str", "_watermarked"),
+        "jpeg_quality": settings.get("jpeg_quality", 90),
+        "encode_profile": settings.get("encode_profile") or FileManager.DEFAULT_ENCODE_PROFILE,
+    }
+
+
+def export_settings_key(settings: Dict[str, Any]) -> str:
+    """
+    导出清单使用的设置指纹：水印设置加上规范化后的导出参数（缺省值补齐，缩放统一为百分比），
+    BatchExporter 与 FileManager.iter_batch_export 对同一份设置得到相同的指纹，可共用同一份清单。
+    """
+    return settings_hash({
+        **settings,
+        **export_options(settings),
+        "scale_percent": round(float(settings.get("scale_percent", 100)), 6),
+    })
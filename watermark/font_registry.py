@@ -0,0 +1,247 @@
+# watermark/font_registry.py
+
+import os
+import json
+import fnmatch
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from PIL import ImageFont
+
+from . import instrumentation
+from .lru import LRUCache
+from .paths import get_cache_dir
+
+FONT_SEARCH_DIRS = [Path("C:/Windows/Fonts"), Path("/usr/share/fonts"), Path("/System/Library/Fonts")]
+FONT_SUFFIXES = (".ttf", ".otf", ".ttc")
+FALLBACK_FONTS = ["msyh.ttc", "simhei.ttf", "simsun.ttc", "Arial.ttf"]
+
+
+class FontRegistry:
+    """
+    字体注册表：
+    1. 字体目录只扫描一次，名称->路径索引持久化到磁盘，按目录 mtime 判断是否失效；
+    2. 已加载的 FreeTypeFont 按 (路径, 像素字号) 放入 LRU 缓存。
+    """
+    # 2：名称匹配改为精确优先，旧索引中缓存的查询结果作废
+    INDEX_VERSION = 2
+
+    def __init__(
+        self,
+        search_dirs: Optional[List[Path]] = None,
+        index_path: Optional[Path] = None,
+        max_fonts: int = 64,
+    ):
+        self.search_dirs = [Path(d) for d in (search_dirs or FONT_SEARCH_DIRS)]
+        # 索引路径在第一次读写时才解析：缓存目录不可用时只在内存中保留索引
+        self._index_path: Optional[Path] = Path(index_path) if index_path else None
+        self._index_path_resolved = index_path is not None
+        self._lock = threading.RLock()
+        self._files: Optional[List[str]] = None      # 按目录优先级排列的字体文件
+        self._dir_mtimes: Dict[str, int] = {}
+        self._lookup: Dict[str, Optional[str]] = {}  # 字体名 -> 路径（None 表示未找到）
+        self._fonts = LRUCache(maxsize=max_fonts)
+        self.lookup_hits = 0
+        self.lookup_misses = 0
+
+    @property
+    def index_path(self) -> Optional[Path]:
+        """磁盘索引的路径；缓存目录无法创建时为 None"""
+        if not self._index_path_resolved:
+            self._index_path_resolved = True
+            try:
+                self._index_path = get_cache_dir() / "font_index.json"
+            except OSError as e:
+                print(f"[WARN] 缓存目录不可用，字体索引只保存在内存中: {e}")
+        return self._index_path
+
+    # ------------------------------
+    # 查询
+    # ------------------------------
+    def resolve(self, font_name: str) -> Optional[Path]:
+        """按名称查找字体文件，找不到时依次尝试回退字体"""
+        with self._lock:
+            if font_name in self._lookup:
+                self.lookup_hits += 1
+                path = self._lookup[font_name]
+                return Path(path) if path else None
+
+            self.lookup_misses += 1
+            self._ensure_index()
+            path = self._find(font_name)
+            if path is None:
+                for fb in FALLBACK_FONTS:
+                    path = self._match(fb)
+                    if path:
+                        break
+            self._lookup[font_name] = path
+            self._save_index()
+            return Path(path) if path else None
+
+    def get_font(self, font_name: str, font_size: int) -> ImageFont.FreeTypeFont:
+        """返回指定名称和像素字号的字体对象（带 LRU 缓存）"""
+        return self.get_font_file(self.resolve(font_name), font_size)
+
+    def get_font_file(self, font_path: Optional[Path], font_size: int) -> ImageFont.FreeTypeFont:
+        """按已解析的字体文件路径加载字体（与 get_font 共用 LRU 缓存）；路径为 None 时使用默认字体"""
+        key = (str(font_path) if font_path else None, font_size)
+
+        def load():
+            with instrumentation.stage("font_load"):
+                return self._load(font_path, font_size)
+
+        return self._fonts.get_or_create(key, load)
+
+    def stats(self) -> Dict[str, int]:
+        """返回名称索引和字体缓存的命中/未命中次数"""
+        font_stats = self._fonts.stats()
+        return {
+            "lookup_hits": self.lookup_hits,
+            "lookup_misses": self.lookup_misses,
+            "font_hits": font_stats["hits"],
+            "font_misses": font_stats["misses"],
+            "fonts_cached": font_stats["entries"],
+        }
+
+    def refresh(self):
+        """丢弃内存和磁盘上的索引，下次查询时重新扫描"""
+        with self._lock:
+            self._files = None
+            self._dir_mtimes = {}
+            self._lookup = {}
+            self._fonts.clear()
+            if self.index_path is None:
+                return
+            try:
+                self.index_path.unlink()
+            except FileNotFoundError:
+                pass
+
+    # ------------------------------
+    # 索引
+    # ------------------------------
+    def _find(self, font_name: str) -> Optional[str]:
+        """
+        按字体名查找（不区分大小写）：先找文件名（不含扩展名）完全相同的，
+        再找包含该名称的，其中文件名最短的优先（DejaVuSans 取 DejaVuSans.ttf 而不是 DejaVuSans-Bold.ttf）；
+        同样长度时按目录优先级取第一个。
+        """
+        wanted = font_name.lower()
+        best, best_len = None, None
+        for f in self._files:
+            stem, suffix = os.path.splitext(os.path.basename(f))
+            if suffix.lower() not in FONT_SUFFIXES:
+                continue
+            stem = stem.lower()
+            if stem == wanted:
+                return f
+            if wanted in stem and (best_len is None or len(stem) < best_len):
+                best, best_len = f, len(stem)
+        return best
+
+    def _match(self, pattern: str) -> Optional[str]:
+        for f in self._files:
+            name = os.path.basename(f)
+            if fnmatch.fnmatch(name, pattern) and name.lower().endswith(FONT_SUFFIXES):
+                return f
+        return None
+
+    def _ensure_index(self):
+        if self._files is not None:
+            return
+        if not self._load_index():
+            self._scan()
+
+    def _scan(self):
+        files, dir_mtimes = [], {}
+        for folder in self.search_dirs:
+            if not folder.is_dir():
+                continue
+            for root, dirs, names in os.walk(folder):
+                dirs.sort()
+                dir_mtimes[root] = os.stat(root).st_mtime_ns
+                files.extend(os.path.join(root, n) for n in sorted(names) if n.lower().endswith(FONT_SUFFIXES))
+        self._files = files
+        self._dir_mtimes = dir_mtimes
+        self._lookup = {}
+
+    def _load_index(self) -> bool:
+        """读取磁盘索引，目录有任何变化时视为失效"""
+        if self.index_path is None:
+            return False
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return False
+
+        if data.get("version") != self.INDEX_VERSION:
+            return False
+        if data.get("search_dirs") != [str(d) for d in self.search_dirs if d.is_dir()]:
+            return False
+        for folder, mtime in data.get("dir_mtimes", {}).items():
+            try:
+                if os.stat(folder).st_mtime_ns != mtime:
+                    return False
+            except OSError:
+                return False
+
+        self._files = data.get("files", [])
+        self._dir_mtimes = data.get("dir_mtimes", {})
+        self._lookup = data.get("lookup", {})
+        return True
+
+    def _save_index(self):
+        if self.index_path is None:
+            return
+        data = {
+            "version": self.INDEX_VERSION,
+            "search_dirs": [str(d) for d in self.search_dirs if d.is_dir()],
+            "dir_mtimes": self._dir_mtimes,
+            "files": self._files,
+            "lookup": self._lookup,
+        }
+        tmp_path = self.index_path.with_name(f"{self.index_path.name}.{os.getpid()}.tmp")
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False)
+            os.replace(tmp_path, self.index_path)
+        except OSError as e:
+            print(f"[WARN] 字体索引保存失败 {self.index_path}: {e}")
+
+    # ------------------------------
+    # 加载
+    # ------------------------------
+    @staticmethod
+    def _load(font_path: Optional[Path], font_size: int) -> ImageFont.FreeTypeFont:
+        if not font_path:
+            print("[警告] 未找到可用字体，使用Pillow默认字体")
+            return FontRegistry._load_default(font_size)
+        try:
+            return ImageFont.truetype(str(font_path), font_size)
+        except Exception as e:
+            print(f"[警告] 字体加载失败 '{font_path}': {e}")
+            return FontRegistry._load_default(font_size)
+
+    @staticmethod
+    def _load_default(font_size: int):
+        try:
+            # Pillow 9.2.0 之后 load_default 需要字号参数
+            return ImageFont.load_default(font_size)
+        except TypeError:
+            return ImageFont.load_default()
+
+
+_default_registry: Optional[FontRegistry] = None
+_default_registry_lock = threading.Lock()
+
+
+def get_font_registry() -> FontRegistry:
+    """返回进程内共享的字体注册表"""
+    global _default_registry
+    if _default_registry is None:
+        with _default_registry_lock:
+            if _default_registry is None:
+                _default_registry = FontRegistry()
+    return _default_registry
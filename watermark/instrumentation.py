@@ -0,0 +1,162 @@
+# watermark/instrumentation.py
+
+import json
+import os
+import threading
+import time
+from contextlib import nullcontext
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+# 环境变量开启：PHOTO_WATERMARK_PROFILE=1，PHOTO_WATERMARK_TRACE=导出 Chrome trace 的路径
+PROFILE_ENV = "PHOTO_WATERMARK_PROFILE"
+TRACE_ENV = "PHOTO_WATERMARK_TRACE"
+
+_enabled = os.environ.get(PROFILE_ENV, "") not in ("", "0")
+_lock = threading.Lock()
+# (阶段名, 开始时间 us, 耗时 us, pid, tid)
+_events: List[tuple] = []
+_counters: Dict[str, int] = {}
+# 关闭时所有 stage() 共用同一个空上下文，开销只有一次全局变量判断
+_NULL_STAGE = nullcontext()
+
+
+def enable(flag: bool = True):
+    """开启/关闭计时与计数"""
+    global _enabled
+    _enabled = bool(flag)
+
+
+def is_enabled() -> bool:
+    return _enabled
+
+
+def trace_path_from_env() -> Optional[Path]:
+    """环境变量中指定的 Chrome trace 输出路径"""
+    value = os.environ.get(TRACE_ENV)
+    return Path(value) if value else None
+
+
+class _Stage:
+    __slots__ = ("name", "start")
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        end = time.perf_counter_ns()
+        event = (self.name, self.start // 1000, (end - self.start) // 1000, os.getpid(), threading.get_ident())
+        with _lock:
+            _events.append(event)
+        return False
+
+
+def stage(name: str):
+    """
+    记录一个阶段的耗时：
+        with instrumentation.stage("encode"):
+            ...
+    """
+    if not _enabled:
+        return _NULL_STAGE
+    return _Stage(name)
+
+
+def count(name: str, value: int = 1):
+    """累加计数器（如读写字节数）"""
+    if not _enabled:
+        return
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + value
+
+
+def reset():
+    """清空已记录的事件和计数器"""
+    with _lock:
+        _events.clear()
+        _counters.clear()
+
+
+def drain() -> Dict[str, Any]:
+    """取出并清空当前记录，用于把工作进程的数据带回主进程"""
+    with _lock:
+        payload = {"events": list(_events), "counters": dict(_counters)}
+        _events.clear()
+        _counters.clear()
+    return payload
+
+
+def merge(payload: Optional[Dict[str, Any]]):
+    """合并 drain() 得到的数据"""
+    if not payload:
+        return
+    with _lock:
+        _events.extend(tuple(e) for e in payload.get("events", ()))
+        for name, value in payload.get("counters", {}).items():
+            _counters[name] = _counters.get(name, 0) + value
+
+
+def _percentile(sorted_values: List[float], q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    idx = min(len(sorted_values) - 1, max(0, round(q * (len(sorted_values) - 1))))
+    return sorted_values[idx]
+
+
+def summary() -> Dict[str, Any]:
+    """
+    按阶段汇总：次数、总耗时、p50/p95（毫秒），以及所有计数器
+    """
+    with _lock:
+        events = list(_events)
+        counters = dict(_counters)
+
+    durations: Dict[str, List[float]] = {}
+    for name, _, dur_us, _, _ in events:
+        durations.setdefault(name, []).append(dur_us / 1000.0)
+
+    stages = {}
+    for name, values in durations.items():
+        values.sort()
+        stages[name] = {
+            "count": len(values),
+            "total_ms": round(sum(values), 3),
+            "p50_ms": round(_percentile(values, 0.50), 3),
+            "p95_ms": round(_percentile(values, 0.95), 3),
+        }
+    return {"stages": stages, "counters": counters}
+
+
+def format_summary(data: Optional[Dict[str, Any]] = None) -> str:
+    """把 summary() 格式化为便于打印的表格"""
+    data = data or summary()
+    lines = [f"{'阶段':24s}{'次数':>8s}{'总耗时ms':>12s}{'p50ms':>10s}{'p95ms':>10s}"]
+    stages = sorted(data["stages"].items(), key=lambda item: item[1]["total_ms"], reverse=True)
+    for name, s in stages:
+        lines.append(f"{name:24s}{s['count']:>8d}{s['total_ms']:>12.1f}{s['p50_ms']:>10.2f}{s['p95_ms']:>10.2f}")
+    for name, value in sorted(data["counters"].items()):
+        lines.append(f"{name}: {value}")
+    return "\n".join(lines)
+
+
+def write_chrome_trace(path: Path) -> Path:
+    """
+    导出 Chrome trace 格式的 JSON，可在 chrome://tracing 或 Perfetto 中以火焰图方式查看
+    """
+    with _lock:
+        events = list(_events)
+    trace = {
+        "traceEvents": [
+            {"name": name, "ph": "X", "ts": ts, "dur": dur, "pid": pid, "tid": tid}
+            for name, ts, dur, pid, tid in events
+        ],
+        "displayTimeUnit": "ms",
+    }
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps(trace), encoding="utf-8")
+    return path
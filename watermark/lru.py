@@ -0,0 +1,101 @@
+# watermark/lru.py
+
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional
+
+
+class LRUCache:
+    """
+    线程安全的 LRU 缓存，可同时限制条目数和总字节数，并统计命中/未命中次数。
+    """
+
+    def __init__(
+        self,
+        maxsize: int = 128,
+        max_bytes: Optional[int] = None,
+        sizeof: Optional[Callable[[Any], int]] = None,
+    ):
+        self.maxsize = maxsize
+        self.max_bytes = max_bytes
+        self._sizeof = sizeof or (lambda value: 0)
+        self._data: "OrderedDict[Hashable, Any]" = OrderedDict()
+        self._sizes: Dict[Hashable, int] = {}
+        self._total_bytes = 0
+        self._lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return self._data[key]
+            self.misses += 1
+            return default
+
+    def put(self, key: Hashable, value: Any):
+        with self._lock:
+            if key in self._data:
+                self._remove(key)
+            size = self._sizeof(value)
+            self._data[key] = value
+            self._sizes[key] = size
+            self._total_bytes += size
+            self._evict()
+
+    def get_or_create(self, key: Hashable, factory: Callable[[], Any]) -> Any:
+        """命中时直接返回；未命中时调用 factory 创建并放入缓存"""
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return self._data[key]
+            self.misses += 1
+        # 创建可能很耗时，不持锁，避免阻塞其它线程的查询
+        value = factory()
+        self.put(key, value)
+        return value
+
+    def discard(self, key: Hashable):
+        """删除一项（不存在时忽略）"""
+        with self._lock:
+            if key in self._data:
+                self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._sizes.clear()
+            self._total_bytes = 0
+
+    def stats(self) -> Dict[str, int]:
+        """返回命中/未命中次数、条目数与占用字节数"""
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "entries": len(self._data),
+                "bytes": self._total_bytes,
+            }
+
+    def __contains__(self, key: Hashable) -> bool:
+        with self._lock:
+            return key in self._data
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._data)
+
+    def _remove(self, key: Hashable):
+        del self._data[key]
+        self._total_bytes -= self._sizes.pop(key)
+
+    def _evict(self):
+        # 至少保留最新放入的一项，即使它本身超过字节上限
+        while len(self._data) > 1 and (
+            len(self._data) > self.maxsize
+            or (self.max_bytes is not None and self._total_bytes > self.max_bytes)
+        ):
+            self._remove(next(iter(self._data)))
@@ -0,0 +1,145 @@
+# watermark/manifest.py
+
+import os
+import json
+import hashlib
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, BinaryIO, Dict, Iterator, Optional, Tuple
+
+MANIFEST_NAME = ".watermark_manifest.json"
+MANIFEST_VERSION = 1
+
+# 源文件指纹：(大小, 修改时间 ns)
+SourceStamp = Tuple[int, int]
+
+
+def settings_hash(settings: Dict[str, Any]) -> str:
+    """
+    水印与导出参数的指纹。图片水印还计入 Logo 文件的大小与修改时间，
+    替换 Logo 文件后已导出的图片同样会被视为过期。
+    """
+    effective = dict(settings)
+    image_path = effective.get("image_path")
+    if image_path:
+        try:
+            st = os.stat(image_path)
+            effective["_image_stamp"] = [st.st_size, st.st_mtime_ns]
+        except OSError:
+            pass
+    data = json.dumps(effective, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha1(data.encode("utf-8")).hexdigest()
+
+
+def source_stamp(path: Path) -> SourceStamp:
+    st = os.stat(path)
+    return st.st_size, st.st_mtime_ns
+
+
+@contextmanager
+def atomic_open(path: Path) -> Iterator[BinaryIO]:
+    """
+    打开同目录下的临时文件供写入，正常结束后改名为 path；
+    中途出错或崩溃不会留下半个文件。
+    """
+    path = Path(path)
+    tmp_path = path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    try:
+        with open(tmp_path, "wb") as f:
+            yield f
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def atomic_write_bytes(path: Path, data: bytes):
+    """先写同目录下的临时文件再改名，中途崩溃不会留下半个文件"""
+    with atomic_open(path) as f:
+        f.write(data)
+
+
+class ExportManifest:
+    """
+    输出目录中的导出清单，记录每个源文件导出时的指纹：
+        源路径 -> {size, mtime_ns, settings, output}
+    源文件未变化、参数指纹相同且输出文件仍在时，视为已是最新，可跳过。
+    清单只由一个线程（批处理的消费方）读写，每记录 flush_every 条落盘一次，
+    中断后重新运行会从上次落盘处继续。
+    """
+
+    def __init__(self, output_dir: Path, settings_key: str, flush_every: int = 20, flush_interval: float = 5.0):
+        self.output_dir = Path(output_dir)
+        self.path = self.output_dir / MANIFEST_NAME
+        self.settings_key = settings_key
+        self.flush_every = max(1, flush_every)
+        self.flush_interval = flush_interval
+        self.entries: Dict[str, Dict[str, Any]] = self._load()
+        self.skipped = 0
+        self._dirty = 0
+        self._last_flush = time.monotonic()
+
+    @staticmethod
+    def _key(path: Path) -> str:
+        return os.path.normcase(str(Path(path).resolve()))
+
+    def _load(self) -> Dict[str, Dict[str, Any]]:
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("version") == MANIFEST_VERSION:
+                return data.get("entries", {})
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError) as e:
+            print(f"[WARN] 导出清单无法读取，将重新导出全部图片: {e}")
+        return {}
+
+    def check(self, source: Path, output: Path) -> Tuple[bool, Optional[SourceStamp]]:
+        """
+        :return: (是否已是最新, 源文件当前指纹)；源文件无法访问时指纹为 None
+        """
+        try:
+            stamp = source_stamp(source)
+        except OSError:
+            return False, None
+        entry = self.entries.get(self._key(source))
+        fresh = (
+            entry is not None
+            and entry.get("size") == stamp[0]
+            and entry.get("mtime_ns") == stamp[1]
+            and entry.get("settings") == self.settings_key
+            and entry.get("output") == Path(output).name
+            and Path(output).is_file()
+        )
+        if fresh:
+            self.skipped += 1
+        return fresh, stamp
+
+    def record(self, source: Path, output: Path, stamp: Optional[SourceStamp]):
+        """记录一次成功导出（stamp 应为处理前取得的指纹）"""
+        if stamp is None:
+            return
+        self.entries[self._key(source)] = {
+            "size": stamp[0],
+            "mtime_ns": stamp[1],
+            "settings": self.settings_key,
+            "output": Path(output).name,
+        }
+        self._dirty += 1
+        if self._dirty >= self.flush_every or time.monotonic() - self._last_flush >= self.flush_interval:
+            self.save()
+
+    def save(self):
+        if not self._dirty:
+            return
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        data = json.dumps({"version": MANIFEST_VERSION, "entries": self.entries}, ensure_ascii=False)
+        atomic_write_bytes(self.path, data.encode("utf-8"))
+        self._dirty = 0
+        self._last_flush = time.monotonic()
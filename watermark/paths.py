@@ -0,0 +1,22 @@
+# watermark/paths.py
+
+import os
+import sys
+from pathlib import Path
+
+
+def get_cache_dir() -> Path:
+    """
+    返回本工具的磁盘缓存目录（字体索引、缩略图等）。
+    可通过环境变量 PHOTO_WATERMARK_CACHE_DIR 指定。
+    目录无法创建时（如 HOME 不可写）抛出 OSError，缓存只是优化，调用方应退回到不落盘的方式。
+    """
+    env_dir = os.environ.get("PHOTO_WATERMARK_CACHE_DIR")
+    if env_dir:
+        cache_dir = Path(env_dir)
+    elif sys.platform == "win32":
+        cache_dir = Path(os.environ.get("LOCALAPPDATA", Path.home() / "AppData" / "Local")) / "PhotoWatermark"
+    else:
+        cache_dir = Path(os.environ.get("XDG_CACHE_HOME", Path.home() / ".cache")) / "photo_watermark"
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    return cache_dir
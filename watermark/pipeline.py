@@ -0,0 +1,197 @@
+# watermark/pipeline.py
+
+import queue
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, Iterator, NamedTuple, Optional, Sequence, Tuple
+
+from . import instrumentation
+
+
+class Stage(NamedTuple):
+    """流水线中的一个阶段：name 用于计时与统计，fn 接收上一阶段的输出并返回本阶段的输出"""
+    name: str
+    fn: Callable[[Any], Any]
+    threads: int = 1
+
+
+class Finished(NamedTuple):
+    """阶段函数返回 Finished(结果) 时跳过后续阶段，value 直接作为该项的最终结果"""
+    value: Any
+
+
+# 通知阶段线程退出
+_STOP = object()
+
+
+class StageStats:
+    """单个阶段的运行统计（由该阶段的各线程共同更新）"""
+    __slots__ = ("threads", "items", "busy_ns", "blocked_ns", "max_depth", "depth_total", "_lock")
+
+    def __init__(self, threads: int):
+        self.threads = threads
+        self.items = 0
+        self.busy_ns = 0        # 执行阶段函数的总时间
+        self.blocked_ns = 0     # 下一阶段队列已满、等待放入的总时间（背压）
+        self.max_depth = 0      # 取任务时输入队列的最大深度
+        self.depth_total = 0
+        self._lock = threading.Lock()
+
+    def record(self, depth: int, busy_ns: int, blocked_ns: int):
+        with self._lock:
+            self.items += 1
+            self.busy_ns += busy_ns
+            self.blocked_ns += blocked_ns
+            self.depth_total += depth
+            self.max_depth = max(self.max_depth, depth)
+
+    def as_dict(self, wall_ns: int) -> Dict[str, Any]:
+        return {
+            "threads": self.threads,
+            "items": self.items,
+            "busy_ms": round(self.busy_ns / 1e6, 3),
+            "blocked_ms": round(self.blocked_ns / 1e6, 3),
+            # 各线程忙碌时间占总时长的比例，最接近 1 的阶段就是瓶颈
+            "utilization": round(self.busy_ns / (wall_ns * self.threads), 3) if wall_ns else 0.0,
+            "max_queue": self.max_depth,
+            "mean_queue": round(self.depth_total / self.items, 2) if self.items else 0.0,
+        }
+
+
+class Pipeline:
+    """
+    分阶段流水线：每个阶段有自己的线程池，阶段之间用有界队列连接。
+    某一阶段处理不过来时上游会阻塞在放入队列处（背压），
+    整体吞吐接近最慢的阶段，而不是各阶段耗时之和。
+    Pillow 在解码、缩放和编码时释放 GIL，读写文件时同样不占用 GIL，因此线程即可让各阶段重叠执行。
+    同时在流水线中的项目不超过 max_in_flight 个，结果按输入顺序产出。
+    """
+
+    def __init__(self, stages: Sequence[Stage], queue_size: int = 2, max_in_flight: Optional[int] = None):
+        if not stages:
+            raise ValueError("流水线至少需要一个阶段")
+        self.stages = list(stages)
+        self.queue_size = max(1, queue_size)
+        # 默认每个阶段各有一项在处理，另留一项在队列中等待
+        self.max_in_flight = max(1, max_in_flight or len(self.stages) + 1)
+        self._stats: Dict[str, StageStats] = {}
+        self._wall_ns = 0
+
+    def map(
+        self,
+        items: Iterable[Any],
+        skip: Optional[Callable[[Any], Any]] = None,
+    ) -> Iterator[Tuple[Any, Any, Optional[Exception]]]:
+        """
+        与 streaming.ordered_bounded_map 相同的约定：按输入顺序产出 (item, result, error)，
+        输入按需消费；skip 在当前线程对每项调用，返回值不为 None 时直接作为该项结果。
+        第一个阶段收到的是 item 本身。
+        """
+        queues = [queue.Queue(maxsize=self.queue_size) for _ in self.stages]
+        self._stats = {stage.name: StageStats(max(1, stage.threads)) for stage in self.stages}
+        # 序号 -> (item, result, error)，等待按顺序取走
+        done: Dict[int, Tuple[Any, Any, Optional[Exception]]] = {}
+        cond = threading.Condition()
+        cancelled = threading.Event()
+
+        def finish(seq: int, entry: Tuple[Any, Any, Optional[Exception]]):
+            with cond:
+                done[seq] = entry
+                cond.notify()
+
+        def run_stage(index: int):
+            stage = self.stages[index]
+            stats = self._stats[stage.name]
+            inbox = queues[index]
+            outbox = queues[index + 1] if index + 1 < len(queues) else None
+            while True:
+                depth = inbox.qsize()
+                task = inbox.get()
+                if task is _STOP:
+                    return
+                seq, item, value = task
+                if cancelled.is_set():
+                    # 迭代已提前结束，丢弃剩余任务
+                    continue
+                start = time.perf_counter_ns()
+                try:
+                    with instrumentation.stage(f"pipeline.{stage.name}"):
+                        value = stage.fn(value)
+                except Exception as e:
+                    stats.record(depth, time.perf_counter_ns() - start, 0)
+                    finish(seq, (item, None, e))
+                    continue
+                busy = time.perf_counter_ns() - start
+
+                if outbox is None or isinstance(value, Finished):
+                    stats.record(depth, busy, 0)
+                    finish(seq, (item, value.value if isinstance(value, Finished) else value, None))
+                    continue
+                put_start = time.perf_counter_ns()
+                outbox.put((seq, item, value))
+                stats.record(depth, busy, time.perf_counter_ns() - put_start)
+
+        workers = [
+            [
+                threading.Thread(target=run_stage, args=(i,), name=f"pipeline-{stage.name}-{n}", daemon=True)
+                for n in range(max(1, stage.threads))
+            ]
+            for i, stage in enumerate(self.stages)
+        ]
+        for group in workers:
+            for t in group:
+                t.start()
+
+        started = time.perf_counter_ns()
+        items = iter(items)
+        submitted = 0
+        next_seq = 0
+        exhausted = False
+        try:
+            while True:
+                # 补充任务直到在途项目达到上限；第一个队列已满时在这里阻塞
+                while not exhausted and submitted - next_seq < self.max_in_flight:
+                    try:
+                        item = next(items)
+                    except StopIteration:
+                        exhausted = True
+                        break
+                    skipped = skip(item) if skip is not None else None
+                    if skipped is not None:
+                        finish(submitted, (item, skipped, None))
+                    else:
+                        queues[0].put((submitted, item, item))
+                    submitted += 1
+                if next_seq == submitted:
+                    break
+                with cond:
+                    while next_seq not in done:
+                        cond.wait()
+                    entry = done.pop(next_seq)
+                next_seq += 1
+                yield entry
+        finally:
+            if next_seq < submitted:
+                cancelled.set()
+            # 逐级关闭：上一阶段的线程全部退出后，它的输出都已进入下一队列，再通知下一阶段
+            for inbox, group in zip(queues, workers):
+                for _ in group:
+                    inbox.put(_STOP)
+                for t in group:
+                    t.join()
+            self._wall_ns = time.perf_counter_ns() - started
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """最近一次 map 中各阶段的统计：处理数、忙碌/阻塞时间、利用率、输入队列的最大/平均深度"""
+        return {name: s.as_dict(self._wall_ns) for name, s in self._stats.items()}
+
+
+def format_stats(stats: Dict[str, Dict[str, Any]]) -> str:
+    """把 Pipeline.stats() 格式化为便于打印的表格"""
+    lines = [f"{'阶段':12s}{'线程':>6s}{'数量':>8s}{'忙碌ms':>12s}{'阻塞ms':>12s}{'利用率':>8s}{'最大队列':>8s}{'平均队列':>8s}"]
+    for name, s in stats.items():
+        lines.append(
+            f"{name:12s}{s['threads']:>6d}{s['items']:>8d}{s['busy_ms']:>12.1f}{s['blocked_ms']:>12.1f}"
+            f"{s['utilization']:>8.2f}{s['max_queue']:>8d}{s['mean_queue']:>8.2f}"
+        )
+    return "\n".join(lines)
@@ -0,0 +1,199 @@
+# watermark/plan.py
+
+import copy
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+
+from PIL import Image
+
+from . import instrumentation
+from .compositing import Layer, blend_function, is_grayscale, prepare_base, resolve_backend
+from .font_registry import get_font_registry
+from .lru import LRUCache
+from .watermark_image import ImageWatermark
+from .watermark_text import TextWatermark
+
+# 每个方案缓存的尺寸/位置数：批次中的尺寸种类通常很少，预览拖拽时位置会不断变化
+PLACEMENT_CACHE_SIZE = 64
+
+
+def layout_position(
+    size: Tuple[int, int],
+    position_name: str,
+    offset_relative: Tuple[float, float],
+    relative_font_size: float,
+    text_content: str,
+) -> Tuple[float, float]:
+    """根据九宫格位置、相对偏移和图片尺寸，计算水印左上角坐标"""
+    w, h = size
+    padding = int(min(w, h) * 0.02)
+    absolute_offset = (offset_relative[0] * w, offset_relative[1] * h)
+
+    ref_dim = min(w, h)
+    pixel_font_size = ref_dim * (relative_font_size / 100.0)
+    wm_w = len(text_content) * pixel_font_size * 0.6
+    wm_h = pixel_font_size
+    base_positions = {
+        "左上": (padding * 5, padding),
+        "上中": (w/2 - wm_w/2, padding),
+        "右上": (w - wm_w - padding, padding),
+        "左中": (padding * 5, h/2 - wm_h/2),
+        "中心": (w/2 - wm_w/2, h/2 - wm_h/2),
+        "右中": (w - wm_w - padding, h/2 - wm_h/2),
+        "左下": (padding * 5, h - wm_h - padding),
+        "下中": (w/2 - wm_w/2, h - wm_h - padding),
+        "右下": (w - wm_w - padding, h - wm_h - padding),
+    }
+    base_pos = base_positions.get(position_name, (0, 0))
+    return (base_pos[0] + absolute_offset[0], base_pos[1] + absolute_offset[1])
+
+
+def compute_watermark_position(size: Tuple[int, int], settings: Dict[str, Any]) -> Tuple[float, float]:
+    """按设置字典计算水印左上角坐标（见 layout_position）"""
+    return layout_position(
+        size,
+        settings.get("position_name", "左上"),
+        settings.get("wm_offset_relative", (0.0, 0.0)),
+        settings.get("relative_font_size", 5),
+        settings.get("text_content", ""),
+    )
+
+
+@dataclass(frozen=True, eq=False)
+class WatermarkPlan:
+    """
+    由一份水印设置编译出的不可变水印方案，预览与导出（包括各工作进程）共用同一份。
+    字体在编译时解析为文件路径，Logo 在编译时缩放并调好透明度；
+    每种图片尺寸的水印位置与图层在第一次用到时计算并缓存，之后同尺寸的图片只需一次字典查找。
+    方案可以 pickle 传给工作进程，缓存不随之传递，在各进程中重新填充。
+    """
+    position_name: str = "左上"
+    offset_relative: Tuple[float, float] = (0.0, 0.0)
+    relative_font_size: float = 5
+    text: Optional[TextWatermark] = None
+    # 已按缩放比例与透明度处理好的 Logo 精灵
+    logo: Optional[Image.Image] = field(default=None, repr=False)
+    logo_gray: bool = False
+    backend: str = "pillow"
+
+    def __post_init__(self):
+        self._init_caches()
+
+    @classmethod
+    def compile(cls, settings: Dict[str, Any], image_watermark: Optional[ImageWatermark] = None) -> "WatermarkPlan":
+        """
+        编译 get_current_settings() 格式的设置字典。
+        :param image_watermark: 已解码好的图片水印（如界面中缓存的），路径与设置一致时复用其原图与精灵缓存
+        """
+        with instrumentation.stage("plan_compile"):
+            backend = resolve_backend(settings.get("compositing_backend"))
+            opacity = settings.get("opacity", 180)
+
+            text = None
+            if settings.get("text_content"):
+                font_name = settings.get("font_name") or "SimHei"
+                font_path = get_font_registry().resolve(font_name)
+                text = TextWatermark(
+                    text=settings["text_content"],
+                    font_name=font_name,
+                    relative_font_size=settings.get("relative_font_size", 5),
+                    color=tuple(settings.get("color", (255, 255, 255))),
+                    opacity=opacity,
+                    bold=settings.get("is_bold", False),
+                    italic=settings.get("is_italic", False),
+                    backend=backend,
+                    font_path=str(font_path) if font_path else None,
+                )
+
+            logo = None
+            image_path = settings.get("image_path")
+            if image_path:
+                if image_watermark is None or Path(image_path) != image_watermark.watermark_path:
+                    image_watermark = ImageWatermark(watermark_path=image_path)
+                # 浅拷贝后再改参数，共享已解码的原图与精灵缓存，不影响调用方的对象
+                image_watermark = copy.copy(image_watermark)
+                image_watermark.opacity = opacity
+                image_watermark.scale = settings.get("image_scale", 15) / 100.0
+                logo = image_watermark.render_sprite()
+
+            return cls(
+                position_name=settings.get("position_name", "左上"),
+                offset_relative=tuple(settings.get("wm_offset_relative", (0.0, 0.0))),
+                relative_font_size=settings.get("relative_font_size", 5),
+                text=text,
+                logo=logo,
+                logo_gray=logo is not None and is_grayscale(logo),
+                backend=backend,
+            )
+
+    def placement(self, size: Tuple[int, int]) -> Tuple[float, float]:
+        """返回该尺寸图片上的水印位置（按尺寸缓存）"""
+        position = self._positions.get(size)
+        if position is None:
+            position = layout_position(
+                size,
+                self.position_name,
+                self.offset_relative,
+                self.relative_font_size,
+                self.text.text if self.text else "",
+            )
+            self._positions.put(size, position)
+        return position
+
+    def layers(self, size: Tuple[int, int], position: Optional[Tuple[float, float]] = None) -> Tuple[Layer, ...]:
+        """
+        返回该尺寸图片上按合成顺序排列的水印图层（先文字后 Logo）。
+        :param position: 水印位置；None 时按布局规则计算（见 placement）。
+                         预览按原图位置换算后的坐标传入，与导出结果保持一致
+        """
+        key = (size, position)
+        layers = self._layers.get(key)
+        if layers is None:
+            layers = self._build_layers(size, self.placement(size) if position is None else position)
+            self._layers.put(key, layers)
+        return layers
+
+    def apply(
+        self,
+        img: Image.Image,
+        position: Optional[Tuple[float, float]] = None,
+        in_place: bool = False,
+    ) -> Image.Image:
+        """
+        在图片上合成全部水印图层。
+        :param in_place: 与 TextWatermark.apply 相同，为 True 时允许直接修改 img
+        """
+        layers = self.layers(img.size, position)
+        base = prepare_base(img, in_place, allow_gray=all(layer.gray for layer in layers))
+        for layer in layers:
+            with instrumentation.stage(layer.stage):
+                layer.apply(base)
+        return base
+
+    def _build_layers(self, size: Tuple[int, int], position: Tuple[float, float]) -> Tuple[Layer, ...]:
+        layers = []
+        if self.text:
+            layer = self.text.layer(size, position)
+            if layer is not None:
+                layers.append(layer)
+        if self.logo is not None:
+            # Logo 以中心点对齐水印位置（与 ImageWatermark.layer 一致）
+            dest = (int(position[0] - self.logo.width / 2), int(position[1] - self.logo.height / 2))
+            layers.append(Layer(self.logo, dest, blend_function("mask", self.backend), self.logo_gray, "logo_composite"))
+        return tuple(layers)
+
+    def _init_caches(self):
+        # 冻结的 dataclass 不能直接赋值，缓存本身不参与比较与 pickle
+        object.__setattr__(self, "_positions", LRUCache(maxsize=PLACEMENT_CACHE_SIZE))
+        object.__setattr__(self, "_layers", LRUCache(maxsize=PLACEMENT_CACHE_SIZE))
+
+    def __getstate__(self) -> Dict[str, Any]:
+        state = dict(self.__dict__)
+        state.pop("_positions", None)
+        state.pop("_layers", None)
+        return state
+
+    def __setstate__(self, state: Dict[str, Any]):
+        self.__dict__.update(state)
+        self._init_caches()
@@ -1,17 +1,38 @@
 # watermark/preview.py
 
-from typing import Optional, Tuple
+import threading
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Tuple
 from PIL import Image
+from . import instrumentation
+from .compositing import Layer
+from .plan import WatermarkPlan, compute_watermark_position
 from .watermark_text import TextWatermark
 from .watermark_image import ImageWatermark
 
 
+def load_preview_image(path, max_size: Tuple[int, int] = (1280, 1280)) -> Tuple[Image.Image, Tuple[int, int]]:
+    """
+    按预览尺寸解码图片，不在内存中保留完整分辨率的像素。
+    JPEG 使用 draft 模式在解码阶段做 DCT 缩放，其他格式借助 reducing_gap 先整数倍缩小。
+    :return: (RGBA 预览图, 原图尺寸)
+    """
+    with instrumentation.stage("preview_decode"), Image.open(path) as img:
+        original_size = img.size
+        if img.format == "JPEG":
+            img.draft("RGB", max_size)
+        img.thumbnail(max_size, Image.Resampling.LANCZOS, reducing_gap=3.0)
+        preview = img.convert("RGBA")
+    return preview, original_size
+
+
 class PreviewManager:
     def __init__(self):
         self.base_image: Optional[Image.Image] = None
         # 修改：将属性名改为 *_info，清晰地表明它包含对象和位置信息
         self.text_wm_info: Optional[Tuple[TextWatermark, Tuple[int, int]]] = None
         self.img_wm_info: Optional[Tuple[ImageWatermark, Tuple[int, int]]] = None
+        # 与导出共用的水印方案及其在预览图上的位置；设置后优先于上面两项
+        self.plan_info: Optional[Tuple[WatermarkPlan, Tuple[int, int]]] = None
 
     def set_base_image(self, img: Image.Image):
         """设置当前预览的基础图片"""
@@ -27,26 +48,149 @@ class PreviewManager:
         """设置图片水印及其位置"""
         self.img_wm_info = img_wm_info
 
-    def generate_preview(self) -> Image.Image:
-        """生成带水印的预览图"""
-        if self.base_image is None:
-            # 返回一个提示图，避免在没有选择图片时程序崩溃
-            return Image.new("RGBA", (400, 300), (220, 220, 220, 255))
+    def set_plan(self, plan_info: Optional[Tuple[WatermarkPlan, Tuple[int, int]]]):
+        """设置编译好的水印方案及其在预览图上的位置"""
+        self.plan_info = plan_info
 
-        preview_img = self.base_image.copy()
+    def layers(self) -> List[Layer]:
+        """当前底图上按合成顺序排列的水印图层"""
+        size = self.base_image.size
+        if self.plan_info:
+            plan, wm_pos = self.plan_info
+            return list(plan.layers(size, wm_pos))
 
-        # 修正：应用文本水印
+        layers = []
         if self.text_wm_info:
-            # 1. 从元组中解包出水印对象和位置
             wm_obj, wm_pos = self.text_wm_info
-            # 2. 调用 apply 方法，并传入位置参数
-            preview_img = wm_obj.apply(preview_img, position=wm_pos)
-
-        # 修正：应用图片水印
+            layer = wm_obj.layer(size, wm_pos)
+            if layer is not None:
+                layers.append(layer)
         if self.img_wm_info:
-            # 1. 解包
             wm_obj, wm_pos = self.img_wm_info
-            # 2. 调用 apply
-            preview_img = wm_obj.apply(preview_img, position=wm_pos)
+            layers.append(wm_obj.layer(wm_pos))
+        return layers
+
+    def generate_preview(self, out: Optional[Image.Image] = None) -> Image.Image:
+        """
+        生成带水印的预览图
+        :param out: 与底图同尺寸的 RGBA 图片（如与 QImage 共享内存的帧缓冲）；
+                    给出时直接在其上合成并返回它，不再分配新图片
+        """
+        with instrumentation.stage("preview_render"):
+            return self._generate_preview(out)
+
+    def _generate_preview(self, out: Optional[Image.Image] = None) -> Image.Image:
+        if self.base_image is None:
+            # 返回一个提示图，避免在没有选择图片时程序崩溃
+            return Image.new("RGBA", (400, 300), (220, 220, 220, 255))
+
+        # 只复制一次底图，之后的水印都原地合成
+        if out is not None and out.mode == "RGBA" and out.size == self.base_image.size:
+            out.paste(self.base_image if self.base_image.mode == "RGBA" else self.base_image.convert("RGBA"))
+            preview_img = out
+        else:
+            preview_img = self.base_image.convert("RGBA") if self.base_image.mode != "RGBA" else self.base_image.copy()
+
+        for layer in self.layers():
+            with instrumentation.stage(layer.stage):
+                layer.apply(preview_img)
+
+        return preview_img
+
+    def generate_overlay(self) -> Tuple[Optional[Image.Image], Tuple[int, int]]:
+        """
+        只渲染水印层（不含底图），供拖拽时作为独立图层显示
+        :return: (紧贴水印的 RGBA 图层, 图层左上角在底图中的坐标)；没有水印时图层为 None
+        """
+        if self.base_image is None:
+            return None, (0, 0)
+
+        layers = [(layer.sprite, layer.dest) for layer in self.layers()]
+        if not layers:
+            return None, (0, 0)
+
+        left = min(x for _, (x, _) in layers)
+        top = min(y for _, (_, y) in layers)
+        right = max(x + sprite.width for sprite, (x, _) in layers)
+        bottom = max(y + sprite.height for sprite, (_, y) in layers)
+        overlay = Image.new("RGBA", (right - left, bottom - top), (0, 0, 0, 0))
+        for sprite, (x, y) in layers:
+            overlay.alpha_composite(sprite, (x - left, y - top))
+        return overlay, (left, top)
+
+
+class PreviewFrame(NamedTuple):
+    """一帧预览及渲染它时的状态，交回 GUI 线程用于显示、拖拽和坐标换算"""
+    image: Any                      # 合成好的预览图（PIL 图片或界面的帧缓冲）
+    path: str
+    base_image: Image.Image         # 按预览尺寸解码的底图（不含水印）
+    original_size: Tuple[int, int]
+    scale: float                    # 预览图宽度 / 原图宽度
+    position: Tuple[int, int]       # 水印在预览图上的位置
+    plan: WatermarkPlan
+
+
+class PreviewSession:
+    """
+    预览渲染线程持有的状态：GUI 线程只提交图片路径和设置快照，
+    解码与水印方案的编译都在渲染线程中进行。
+    同一张图片只按预览尺寸解码一次；编译（Logo 缩放、字体查找）可能较慢，
+    设置不变时直接复用上一次的方案（包括其中缓存的图层）。
+    """
+
+    def __init__(self, max_size: Tuple[int, int] = (1280, 1280)):
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._plan: Optional[WatermarkPlan] = None
+        self._plan_settings: Optional[Dict[str, Any]] = None
+        self._source: Optional[Tuple[str, Image.Image, Tuple[int, int]]] = None
+
+    def load(self, path: str) -> Tuple[Image.Image, Tuple[int, int]]:
+        """返回 (预览底图, 原图尺寸)，只缓存最近一张图片"""
+        with self._lock:
+            source = self._source
+        if source is not None and source[0] == path:
+            return source[1], source[2]
+        preview, original_size = load_preview_image(path, self.max_size)
+        with self._lock:
+            self._source = (path, preview, original_size)
+        return preview, original_size
+
+    def render(
+        self,
+        path: str,
+        settings: Dict[str, Any],
+        image_watermark: Optional[ImageWatermark] = None,
+        render_into: Optional[Callable[[Tuple[int, int], Callable], Any]] = None,
+    ) -> PreviewFrame:
+        """
+        解码（或复用）图片、编译（或复用）水印方案并合成一帧预览。
+        :param render_into: (尺寸, 合成函数) -> 预览图，如界面帧缓冲池的 render；为空时直接返回新的 PIL 图片
+        """
+        base_image, original_size = self.load(path)
+        scale = base_image.width / original_size[0] if original_size[0] > 0 else 1.0
+        wm_pos = compute_watermark_position(original_size, settings)
+        position = (int(wm_pos[0] * scale), int(wm_pos[1] * scale))
+
+        plan = self.plan(settings, image_watermark)
+        manager = PreviewManager()
+        manager.set_base_image(base_image)
+        manager.set_plan((plan, position))
+        image = render_into(base_image.size, manager.generate_preview) if render_into else manager.generate_preview()
+        return PreviewFrame(image, path, base_image, original_size, scale, position, plan)
+
+    def plan(self, settings: Dict[str, Any], image_watermark: Optional[ImageWatermark] = None) -> WatermarkPlan:
+        """
+        返回与设置对应的水印方案，设置变化时重新编译。
+        :param image_watermark: 界面中已解码的图片水印，路径一致时复用，不重复读取 Logo 文件
+        """
+        with self._lock:
+            if self._plan is None or settings != self._plan_settings:
+                self._plan = WatermarkPlan.compile(settings, image_watermark=image_watermark)
+                self._plan_settings = settings
+            return self._plan
 
-        return preview_img
\ No newline at end of file
+    def cached_plan(self, settings: Dict[str, Any]) -> Optional[WatermarkPlan]:
+        """设置与最近编译的方案一致时返回该方案，否则返回 None（不编译）"""
+        with self._lock:
+            return self._plan if settings == self._plan_settings else None
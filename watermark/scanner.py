@@ -0,0 +1,99 @@
+# watermark/scanner.py
+
+import os
+import fnmatch
+import threading
+from pathlib import Path
+from typing import Iterable, Iterator, List, Optional, Sequence, Set
+
+
+def path_key(path) -> str:
+    """去重用的路径键：解析符号链接与相对路径，并按平台规则统一大小写"""
+    return os.path.normcase(os.path.realpath(path))
+
+
+def scan_paths(
+    roots: Iterable,
+    recursive: bool = False,
+    max_depth: Optional[int] = None,
+    patterns: Optional[Sequence[str]] = None,
+    extensions: Optional[Sequence[str]] = None,
+    seen: Optional[Set[str]] = None,
+    cancel_event: Optional[threading.Event] = None,
+) -> Iterator[Path]:
+    """
+    扫描文件与文件夹，边扫描边产出支持格式的图片路径。
+    :param roots: 文件或文件夹路径；文件直接检查扩展名，文件夹按 os.scandir 遍历
+    :param recursive: 是否进入子文件夹
+    :param max_depth: 递归时的最大深度（roots 中的文件夹为第 0 层），None 为不限
+    :param extensions: 接受的扩展名（如 FileManager.SUPPORTED_INPUT_FORMATS），None 为不限
+    :param patterns: 文件名通配符（如 ["IMG_*", "*.jpg"]），满足任意一个即可；None 为不过滤
+    :param seen: 已产出过的路径键集合（path_key），跨多次扫描共享即可去重
+    :param cancel_event: 置位后扫描尽快结束
+    同一文件夹内按名称排序；先产出文件夹中的文件，再依次进入子文件夹。
+    """
+    extensions = None if extensions is None else {e.lower() for e in extensions}
+    seen = set() if seen is None else seen
+    visited_dirs: Set[str] = set()
+
+    def accept(name: str) -> bool:
+        if extensions is not None and os.path.splitext(name)[1].lower() not in extensions:
+            return False
+        return patterns is None or any(fnmatch.fnmatch(name, p) for p in patterns)
+
+    def cancelled() -> bool:
+        return cancel_event is not None and cancel_event.is_set()
+
+    for root in roots:
+        if cancelled():
+            return
+        root = os.fspath(root)
+        if os.path.isfile(root):
+            key = path_key(root)
+            if accept(os.path.basename(root)) and key not in seen:
+                seen.add(key)
+                yield Path(root)
+            continue
+        if not os.path.isdir(root):
+            continue
+
+        # 深度优先：栈中保存 (文件夹, 解析后的文件夹, 深度)
+        stack = [(root, path_key(root), 0)]
+        while stack:
+            folder, real_folder, depth = stack.pop()
+            if real_folder in visited_dirs:
+                continue
+            visited_dirs.add(real_folder)
+            try:
+                with os.scandir(folder) as it:
+                    entries = sorted(it, key=lambda e: e.name)
+            except OSError as e:
+                print(f"[WARN] 无法读取文件夹 {folder}: {e}")
+                continue
+
+            subdirs: List[os.DirEntry] = []
+            for entry in entries:
+                if cancelled():
+                    return
+                try:
+                    if entry.is_dir():
+                        subdirs.append(entry)
+                        continue
+                    if not entry.is_file() or not accept(entry.name):
+                        continue
+                except OSError:
+                    continue
+                # 文件夹已解析过，普通文件直接拼接即可；只有符号链接需要单独解析
+                if entry.is_symlink():
+                    key = path_key(entry.path)
+                else:
+                    key = os.path.normcase(os.path.join(real_folder, entry.name))
+                if key not in seen:
+                    seen.add(key)
+                    yield Path(entry.path)
+
+            if recursive and (max_depth is None or depth < max_depth):
+                for entry in reversed(subdirs):
+                    real = path_key(entry.path) if entry.is_symlink() else os.path.normcase(
+                        os.path.join(real_folder, entry.name))
+                    stack.append((entry.path, real, depth + 1))
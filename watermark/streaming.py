@@ -0,0 +1,76 @@
+# watermark/streaming.py
+
+from collections import deque
+from concurrent.futures import Executor, Future, ThreadPoolExecutor
+from typing import Any, Callable, Iterable, Iterator, Optional, Tuple
+
+
+def ordered_bounded_map(
+    fn: Callable[[Any], Any],
+    items: Iterable[Any],
+    max_in_flight: int = 1,
+    executor: Optional[Executor] = None,
+    skip: Optional[Callable[[Any], Any]] = None,
+) -> Iterator[Tuple[Any, Any, Optional[Exception]]]:
+    """
+    惰性地对 items 逐项调用 fn，按输入顺序产出 (item, result, error)。
+    同一时刻最多只有 max_in_flight 个任务在处理中，输入迭代器也只会被按需消费，
+    因此峰值内存只取决于并发数，与批次大小无关。
+    :param executor: 指定执行器（如进程池）；为空时按 max_in_flight 创建线程池
+    :param skip: 在当前线程对每项调用；返回值不为 None 时直接作为该项结果，不再提交 fn
+    """
+    max_in_flight = max(1, max_in_flight)
+
+    if executor is None and max_in_flight == 1:
+        for item in items:
+            skipped = skip(item) if skip is not None else None
+            if skipped is not None:
+                yield item, skipped, None
+                continue
+            try:
+                yield item, fn(item), None
+            except Exception as e:
+                yield item, None, e
+        return
+
+    own_executor = executor is None
+    if own_executor:
+        executor = ThreadPoolExecutor(max_workers=max_in_flight)
+
+    pending = deque()
+    try:
+        for item in items:
+            skipped = skip(item) if skip is not None else None
+            if skipped is not None:
+                if not pending:
+                    yield item, skipped, None
+                    continue
+                # 前面还有处理中的项目，为保持顺序排在它们后面
+                pending.append((item, _resolved(skipped)))
+                while pending and pending[0][1].done():
+                    yield _collect(*pending.popleft())
+                continue
+            pending.append((item, executor.submit(fn, item)))
+            if len(pending) >= max_in_flight:
+                yield _collect(*pending.popleft())
+        while pending:
+            yield _collect(*pending.popleft())
+    finally:
+        # 提前结束迭代时取消尚未开始的任务
+        for _, future in pending:
+            future.cancel()
+        if own_executor:
+            executor.shutdown(wait=True)
+
+
+def _resolved(result) -> Future:
+    future = Future()
+    future.set_result(result)
+    return future
+
+
+def _collect(item, future):
+    try:
+        return item, future.result(), None
+    except Exception as e:
+        return item, None, e
@@ -0,0 +1,85 @@
+# watermark/thumbnails.py
+
+import os
+import hashlib
+from pathlib import Path
+from typing import Optional
+
+from PIL import Image
+
+from .paths import get_cache_dir
+
+
+def make_thumbnail(path: Path, size: int = 64) -> Image.Image:
+    """
+    生成缩略图。JPEG 使用 draft 模式在解码时直接按 1/2~1/8 缩小，
+    其余格式借助 reducing_gap 先做整数倍缩小，再精细缩放。
+    """
+    with Image.open(path) as img:
+        if img.format == "JPEG":
+            img.draft("RGB", (size, size))
+        img.thumbnail((size, size), Image.Resampling.LANCZOS, reducing_gap=2.0)
+        return img.convert("RGBA") if img.mode not in ("RGB", "RGBA") else img.copy()
+
+
+class ThumbnailCache:
+    """
+    磁盘缩略图缓存，按 (路径, 尺寸, 修改时间) 作为 key。
+    原图被修改后 key 随之变化，旧缩略图自然失效。
+    缓存目录不可写或磁盘已满时 load 仍返回内存中的缩略图，只是不落盘。
+    """
+
+    def __init__(self, cache_dir: Optional[Path] = None, size: int = 64):
+        self.size = size
+        try:
+            self.cache_dir = Path(cache_dir) if cache_dir else get_cache_dir() / "thumbnails"
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+        except OSError as e:
+            print(f"[WARN] 缩略图缓存目录不可用，缩略图不写入磁盘: {e}")
+            self.cache_dir = None
+
+    def cache_path(self, path: Path) -> Optional[Path]:
+        """缩略图在磁盘缓存中的路径；缓存目录不可用时返回 None"""
+        if self.cache_dir is None:
+            return None
+        path = Path(path).resolve()
+        st = path.stat()
+        key = f"{path}|{self.size}|{st.st_mtime_ns}|{st.st_size}"
+        digest = hashlib.sha1(key.encode("utf-8")).hexdigest()
+        return self.cache_dir / digest[:2] / f"{digest}.png"
+
+    def load(self, path: Path) -> Image.Image:
+        """
+        返回缩略图图像：优先读取磁盘缓存，未命中时生成并尝试写入。
+        只有原图无法读取/解码时才抛出异常，缓存本身的读写错误只打印警告。
+        """
+        thumb_path = self.cache_path(path)
+        if thumb_path is not None and thumb_path.exists():
+            try:
+                with Image.open(thumb_path) as cached:
+                    cached.load()
+                    return cached.copy()
+            except OSError:
+                pass  # 缓存文件损坏，重新生成
+
+        thumb = make_thumbnail(path, self.size)
+        if thumb_path is not None:
+            try:
+                self._write(thumb, thumb_path)
+            except OSError as e:
+                print(f"[WARN] 缩略图缓存写入失败 {thumb_path}: {e}")
+        return thumb
+
+    def _write(self, thumb: Image.Image, thumb_path: Path):
+        thumb_path.parent.mkdir(parents=True, exist_ok=True)
+        # 先写临时文件再改名，避免并发读取到半个文件
+        tmp_path = thumb_path.with_name(f"{thumb_path.stem}.{os.getpid()}.{id(thumb)}.tmp")
+        try:
+            thumb.save(tmp_path, "PNG")
+            os.replace(tmp_path, thumb_path)
+        except OSError:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
@@ -0,0 +1,531 @@
+# watermark/tiled.py
+
+import io
+import math
+import os
+import struct
+import zlib
+from pathlib import Path
+from typing import BinaryIO, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from PIL import ExifTags, Image, ImageChops, TiffImagePlugin
+
+from . import instrumentation
+from .compositing import Layer, normalize_mode
+
+# 像素数超过该值的输入按行带处理（约 50MP，RGBA 整幅解码需要 200MB 以上）
+TILED_PIXEL_THRESHOLD = 50_000_000
+# 按行带处理时允许的最大像素数（约 1GP），超过时视为解压炸弹，与 Pillow 的检查一样拒绝处理
+TILED_PIXEL_LIMIT = 1_000_000_000
+# 每次读取、合成、编码的行数；同时也是 TIFF 输出的分块边长（须为 16 的倍数）
+BAND_HEIGHT = 256
+
+# 根据图片尺寸返回水印图层
+LayersForSize = Callable[[Tuple[int, int]], Sequence[Layer]]
+
+def open_large(path) -> Image.Image:
+    """
+    打开（只读文件头）可能超过 Pillow 像素上限的图片。
+    不修改进程全局的 Image.MAX_IMAGE_PIXELS（其他线程中的 Image.open 仍受解压炸弹检查保护），
+    而是按已注册的格式插件直接读取文件头，再自行检查尺寸不超过 TILED_PIXEL_LIMIT。
+    """
+    img = _open_unchecked(path)
+    if img.width * img.height > TILED_PIXEL_LIMIT:
+        img.close()
+        raise Image.DecompressionBombError(
+            f"图片尺寸 {img.width}x{img.height} 超过按行带处理的上限 {TILED_PIXEL_LIMIT} 像素"
+        )
+    return img
+
+
+def _open_unchecked(path) -> Image.Image:
+    """与 Image.open 相同地按文件头识别格式（不发出 DecompressionBombWarning，也不抛出 DecompressionBombError）"""
+    with open(path, "rb") as f:
+        prefix = f.read(16)
+    Image.init()
+    for fmt in Image.ID:
+        factory, accept = Image.OPEN[fmt]
+        accepted = accept(prefix) if accept else True
+        if not accepted or isinstance(accepted, str):
+            continue
+        try:
+            # 传入路径时由图片对象自己打开并在 close 时关闭文件
+            return factory(os.fspath(path))
+        except (SyntaxError, IndexError, TypeError, struct.error):
+            continue
+    raise Image.UnidentifiedImageError(f"cannot identify image file {str(path)!r}")
+
+
+def scaled_size(size: Tuple[int, int], scale: float) -> Tuple[int, int]:
+    """按缩放比例（1.0 为原尺寸）计算输出尺寸，与整幅处理时的取整方式相同"""
+    return int(size[0] * scale), int(size[1] * scale)
+
+
+def needs_tiling(path, threshold: Optional[int] = None) -> bool:
+    """只读文件头判断图片是否应按行带处理；无法识别的文件交给常规路径报错"""
+    threshold = TILED_PIXEL_THRESHOLD if threshold is None else threshold
+    try:
+        with open_large(path) as img:
+            return img.width * img.height > threshold
+    except Exception:
+        return False
+
+
+class BandReader:
+    """
+    按行带读取图片，decoding 表示读取方式：
+    - "raw"：未压缩的 TIFF（按条带或分块存储）直接读取与行带相交的那部分数据，内存只与行带大小有关；
+    - "chunked"：压缩的 TIFF 逐个条带/分块解码（由 libtiff 解码，支持 Deflate、LZW、PackBits、JPEG 等），
+      内存与条带/分块大小有关；
+    - "full"：其他格式（JPEG、PNG 等）、只有一个条带或带方向标记的 TIFF 只能整幅解码，解码一次后按行带裁出。
+      整幅解码时打印警告，且仍受 Pillow 的解压炸弹上限约束。
+    :param draft_size: 最终需要的尺寸（缩小导出时）；JPEG 按 DCT 缩放（draft）直接解码为不小于该尺寸的图片
+    """
+    # 逐个条带/分块解码时需要带上的 TIFF 标签（位深、压缩、颜色、预测、JPEG 表等）
+    CHUNK_TAGS = (258, 259, 262, 266, 277, 284, 317, 320, 338, 339, 347, 529, 530, 531, 532)
+
+    def __init__(self, path, draft_size: Optional[Tuple[int, int]] = None):
+        self.path = Path(path)
+        self._draft_size = draft_size
+        with open_large(self.path) as img:
+            if draft_size and img.format == "JPEG":
+                # 只能按 1/2、1/4、1/8 缩放，目标不够小时尺寸不变
+                img.draft(img.mode, draft_size)
+            self.size = img.size
+            self.mode = img.mode
+            self.format = img.format
+            self.decoding = self._decoding(img)
+            self._tiles = list(img.tile) if self.decoding == "raw" else []
+            self._bits = self._bits_per_pixel(img) if self.decoding == "raw" else 0
+            self._chunk_tags = self._copy_chunk_tags(img) if self.decoding == "chunked" else None
+            self._chunks = list(self._chunk_layout(img)) if self.decoding == "chunked" else []
+        self._cache: Dict[int, Image.Image] = {}
+        self._full: Optional[Image.Image] = None
+        if self.decoding == "full":
+            self._check_full_decode()
+
+    @staticmethod
+    def _decoding(img: Image.Image) -> str:
+        if not isinstance(img, TiffImagePlugin.TiffImageFile) or not img.tile:
+            return "full"
+        if getattr(img, "_planar_configuration", 1) != 1:
+            return "full"
+        # 带方向标记的图片加载时会被旋转，行号与文件中的不再对应
+        if img.tag_v2.get(ExifTags.Base.Orientation, 1) != 1:
+            return "full"
+        if not getattr(img, "use_load_libtiff", False) and all(tile[0] == "raw" for tile in img.tile):
+            return "raw"
+        offsets = img.tag_v2.get(TiffImagePlugin.TILEOFFSETS) or img.tag_v2.get(TiffImagePlugin.STRIPOFFSETS)
+        # 整幅只有一个条带时逐块解码与整幅解码相同
+        return "chunked" if offsets and len(offsets) > 1 else "full"
+
+    @staticmethod
+    def _bits_per_pixel(img: Image.Image) -> int:
+        bps = img.tag_v2.get(TiffImagePlugin.BITSPERSAMPLE, (1,))
+        bps = bps if isinstance(bps, tuple) else (bps,)
+        samples = img.tag_v2.get(TiffImagePlugin.SAMPLESPERPIXEL, 1)
+        if len(bps) == 1 and samples > 1:
+            bps = bps * samples
+        return sum(bps)
+
+    def _check_full_decode(self):
+        pixels = self.size[0] * self.size[1]
+        limit = Image.MAX_IMAGE_PIXELS
+        if limit and pixels > 2 * limit:
+            raise Image.DecompressionBombError(
+                f"{self.format} 图片 {self.size[0]}x{self.size[1]} 无法按行带解码，整幅解码超过 Pillow 的像素上限 "
+                f"{2 * limit}；请转换为多条带或分块存储的 TIFF，或缩小导出尺寸（JPEG）"
+            )
+        print(f"[WARN] {self.path.name} 无法按行带解码（{self.format}），将整幅解码 {self.size[0]}x{self.size[1]}，"
+              f"内存与图片大小相关")
+
+    def read(self, top: int, bottom: int) -> Image.Image:
+        """读取 [top, bottom) 行，返回已转换为可合成模式的行带；top 须单调不减"""
+        with instrumentation.stage("decode"):
+            if self.decoding == "raw":
+                band = self._read_streaming(top, bottom)
+            elif self.decoding == "chunked":
+                band = self._read_chunked(top, bottom)
+            else:
+                band = self._read_full(top, bottom)
+            return normalize_mode(band)
+
+    def _read_streaming(self, top: int, bottom: int) -> Image.Image:
+        # 只用公开接口：按 img.tile 给出的偏移读取与行带相交的原始字节，再用 Image.frombytes 解出各段
+        band = Image.new(self.mode, (self.size[0], bottom - top))
+        with open(self.path, "rb") as f:
+            for codec, (x0, y0, x1, y1), offset, args in self._tiles:
+                start, end = max(y0, top), min(y1, bottom)
+                if start >= end:
+                    continue
+                args = args if isinstance(args, tuple) else (args,)
+                # 未压缩数据逐行连续存放，跳过行带之前的行即可
+                stride = args[1] if len(args) > 1 and args[1] else 0
+                row_bytes = stride or math.ceil((x1 - x0) * self._bits / 8)
+                f.seek(offset + (start - y0) * row_bytes)
+                data = f.read((end - start) * row_bytes)
+                piece = Image.frombytes(self.mode, (x1 - x0, end - start), data, codec, *args)
+                # 分块 TIFF 右侧的分块可能超出图片宽度，paste 会裁掉超出的部分
+                band.paste(piece, (x0, start - top))
+        return band
+
+    @classmethod
+    def _copy_chunk_tags(cls, img: Image.Image) -> TiffImagePlugin.ImageFileDirectory_v2:
+        tags = TiffImagePlugin.ImageFileDirectory_v2(prefix=img.tag_v2.prefix)
+        for tag in cls.CHUNK_TAGS:
+            if tag in img.tag_v2:
+                tags[tag] = img.tag_v2[tag]
+                tags.tagtype[tag] = img.tag_v2.tagtype[tag]
+        return tags
+
+    @staticmethod
+    def _chunk_layout(img: Image.Image) -> Iterator[Tuple[Tuple[int, int, int, int], int, int]]:
+        """依次产出各条带/分块的 (区域, 文件偏移, 字节数)；区域可能超出图片右侧与底部"""
+        tags = img.tag_v2
+        width, height = img.size
+        if TiffImagePlugin.TILEOFFSETS in tags:
+            tile_w, tile_h = tags[322], tags[323]
+            across = math.ceil(width / tile_w)
+            for i, (offset, count) in enumerate(zip(tags[TiffImagePlugin.TILEOFFSETS], tags[325])):
+                x0, y0 = (i % across) * tile_w, (i // across) * tile_h
+                yield (x0, y0, x0 + tile_w, y0 + tile_h), offset, count
+        else:
+            rows = min(tags.get(TiffImagePlugin.ROWSPERSTRIP, height), height)
+            for i, (offset, count) in enumerate(
+                zip(tags[TiffImagePlugin.STRIPOFFSETS], tags[TiffImagePlugin.STRIPBYTECOUNTS])
+            ):
+                yield (0, i * rows, width, min((i + 1) * rows, height)), offset, count
+
+    def _read_chunked(self, top: int, bottom: int) -> Image.Image:
+        # 行带只会向下移动，已完全在行带之上的条带/分块不会再用到
+        self._cache = {i: chunk for i, chunk in self._cache.items() if self._chunks[i][0][3] > top}
+        band = Image.new(self.mode, (self.size[0], bottom - top))
+        with open(self.path, "rb") as f:
+            for i, (box, offset, count) in enumerate(self._chunks):
+                if box[1] >= bottom or box[3] <= top:
+                    continue
+                chunk = self._cache.get(i)
+                if chunk is None:
+                    f.seek(offset)
+                    chunk = self._cache[i] = self._decode_chunk(box, f.read(count))
+                band.paste(chunk, (box[0], box[1] - top))
+        return band
+
+    def _decode_chunk(self, box: Tuple[int, int, int, int], data: bytes) -> Image.Image:
+        """把一个条带/分块包装成只有一个条带的 TIFF，交给 Pillow（libtiff）解码"""
+        tags = self._chunk_tags
+        width, height = box[2] - box[0], box[3] - box[1]
+        # 条带偏移由 tobytes 换算到 IFD 之后，0 即紧跟在 IFD 后面
+        for tag, value in ((256, width), (257, height), (278, height), (273, (0,)), (279, (len(data),))):
+            tags[tag] = value
+            tags.tagtype[tag] = 4
+        endian = "<" if tags.prefix == b"II" else ">"
+        header = tags.prefix + struct.pack(f"{endian}HI", 42, 8)
+        chunk = Image.open(io.BytesIO(header + tags.tobytes(8) + data))
+        chunk.load()
+        return chunk if chunk.mode == self.mode else chunk.convert(self.mode)
+
+    def _read_full(self, top: int, bottom: int) -> Image.Image:
+        if self._full is None:
+            self._full = open_large(self.path)
+            if self._draft_size and self.format == "JPEG":
+                self._full.draft(self.mode, self._draft_size)
+            self._full.load()
+        return self._full.crop((0, top, self.size[0], bottom))
+
+    def bands(self, band_height: int = BAND_HEIGHT) -> Iterator[Tuple[int, Image.Image]]:
+        """依次产出 (起始行, 行带)"""
+        try:
+            for top in range(0, self.size[1], band_height):
+                yield top, self.read(top, min(top + band_height, self.size[1]))
+        finally:
+            self.close()
+
+    def scaled_bands(self, size: Tuple[int, int], band_height: int = BAND_HEIGHT) -> Iterator[Tuple[int, Image.Image]]:
+        """
+        依次产出缩放到 size 后的 (起始行, 行带)。
+        每带多读上下若干行作为 Lanczos 滤波的支撑，结果与整幅缩放至多相差 1 级灰度。
+        """
+        width, height = self.size
+        margin = math.ceil(3 * max(1.0, height / size[1])) + 2
+        try:
+            for out_top in range(0, size[1], band_height):
+                out_bottom = min(out_top + band_height, size[1])
+                src_top, src_bottom = out_top * height / size[1], out_bottom * height / size[1]
+                top = max(0, math.floor(src_top) - margin)
+                bottom = min(height, math.ceil(src_bottom) + margin)
+                band = self.read(top, bottom)
+                with instrumentation.stage("resize"):
+                    box = (0, src_top - top, width, src_bottom - top)
+                    yield out_top, band.resize((size[0], out_bottom - out_top), Image.Resampling.LANCZOS, box=box)
+        finally:
+            self.close()
+
+    def close(self):
+        self._cache.clear()
+        if self._full is not None:
+            self._full.close()
+            self._full = None
+
+
+class TiffTileWriter:
+    """
+    分块（tile）TIFF 编码器：每凑满一行分块就压缩（Deflate）或原样写出，
+    只需缓存一行分块，输出按块存储，其他软件也能按块读取。
+    predictor 为 2 时先做水平差分（与 Image.save 的 tiffinfo={317: 2} 相同）。
+    """
+    # 与 Image.save 的 compression 参数同名；值为 TIFF 的 Compression 标签
+    COMPRESSIONS = {"tiff_deflate": 8, "raw": 1}
+    # TIFF 的 Predictor 标签：1 为不预测，2 为水平差分
+    PREDICTORS = (1, 2)
+
+    def __init__(
+        self,
+        f: BinaryIO,
+        size: Tuple[int, int],
+        mode: str,
+        tile: int = BAND_HEIGHT,
+        compress_level: int = 6,
+        compression: str = "tiff_deflate",
+        predictor: int = 1,
+    ):
+        if mode not in ("L", "RGB"):
+            raise ValueError(f"TIFF 分块输出不支持的模式: {mode}")
+        if compression not in self.COMPRESSIONS:
+            raise ValueError(f"TIFF 分块输出不支持的压缩方式: {compression}")
+        if predictor not in self.PREDICTORS:
+            raise ValueError(f"TIFF 分块输出不支持的预测方式: {predictor}")
+        self.compression = compression
+        self.predictor = predictor
+        self.f = f
+        self.size = size
+        self.mode = mode
+        self.tile = tile
+        self.compress_level = compress_level
+        self.offsets: List[int] = []
+        self.byte_counts: List[int] = []
+        self._buffer = Image.new(mode, (size[0], tile))
+        self._filled = 0
+        # 文件头，IFD 偏移在写完所有分块后回填
+        self._start = f.tell()
+        f.write(b"II*\x00\x00\x00\x00\x00")
+
+    def write(self, band: Image.Image):
+        top = 0
+        while top < band.height:
+            rows = min(self.tile - self._filled, band.height - top)
+            self._buffer.paste(band.crop((0, top, band.width, top + rows)), (0, self._filled))
+            self._filled += rows
+            top += rows
+            if self._filled == self.tile:
+                self._flush_row()
+
+    def _flush_row(self):
+        # 最后一行分块不足的部分以 0 填充（TIFF 规范要求分块大小一致）
+        for left in range(0, self.size[0], self.tile):
+            tile = self._buffer.crop((left, 0, left + self.tile, self.tile))
+            if self.predictor == 2:
+                tile = self._horizontal_difference(tile)
+            data = tile.tobytes()
+            if self.compression == "tiff_deflate":
+                data = zlib.compress(data, self.compress_level)
+            self.offsets.append(self.f.tell() - self._start)
+            self.byte_counts.append(len(data))
+            self.f.write(data)
+        self._buffer.paste(0, (0, 0) + self._buffer.size)
+        self._filled = 0
+
+    @staticmethod
+    def _horizontal_difference(tile: Image.Image) -> Image.Image:
+        """每个像素减去同一行左侧像素（按 256 取模），每行第一个像素保持原值"""
+        left = ImageChops.offset(tile, 1, 0)
+        left.paste(0, (0, 0, 1, tile.height))
+        return ImageChops.subtract_modulo(tile, left)
+
+    def close(self):
+        if self._filled:
+            self._flush_row()
+        # 偏移量为 32 位，分块数据与 IFD 都要落在前 4GB 内
+        if self.f.tell() - self._start + 12 * len(self.offsets) + 1024 >= 2 ** 32:
+            raise ValueError("输出超过 4GB，经典 TIFF 无法保存")
+        bands = len(self.mode)
+        # (tag, 类型, 值)；类型 3 为 SHORT，4 为 LONG
+        entries = [
+            (256, 4, [self.size[0]]),
+            (257, 4, [self.size[1]]),
+            (258, 3, [8] * bands),
+            (259, 3, [self.COMPRESSIONS[self.compression]]),
+            (262, 3, [1 if self.mode == "L" else 2]),
+            (277, 3, [bands]),
+            (284, 3, [1]),
+            (317, 3, [self.predictor]),
+            (322, 4, [self.tile]),
+            (323, 4, [self.tile]),
+            (324, 4, self.offsets),
+            (325, 4, self.byte_counts),
+        ]
+        # 超过 4 字节的值放在 IFD 之前，按字对齐
+        if (self.f.tell() - self._start) % 2:
+            self.f.write(b"\x00")
+        packed = []
+        for tag, kind, values in entries:
+            fmt = "H" if kind == 3 else "I"
+            data = struct.pack(f"<{len(values)}{fmt}", *values)
+            if len(data) <= 4:
+                packed.append((tag, kind, len(values), data.ljust(4, b"\x00")))
+                continue
+            offset = self.f.tell() - self._start
+            self.f.write(data)
+            packed.append((tag, kind, len(values), struct.pack("<I", offset)))
+
+        ifd_offset = self.f.tell() - self._start
+        self.f.write(struct.pack("<H", len(packed)))
+        for tag, kind, count, value in packed:
+            self.f.write(struct.pack("<HHI", tag, kind, count) + value)
+        self.f.write(b"\x00\x00\x00\x00")
+        end = self.f.tell()
+        self.f.seek(self._start + 4)
+        self.f.write(struct.pack("<I", ifd_offset))
+        self.f.seek(end)
+
+
+class PngStripWriter:
+    """
+    逐带写出的 PNG 编码器：所有行共用一个 zlib 流，每带压缩后立即写出 IDAT。
+    行过滤统一使用 Sub（与左侧像素相减），由 ImageChops 整带计算，压缩率接近 Pillow 的自适应过滤。
+    """
+
+    def __init__(self, f: BinaryIO, size: Tuple[int, int], mode: str, compress_level: int = 6):
+        if mode not in ("L", "RGB"):
+            raise ValueError(f"PNG 逐带输出不支持的模式: {mode}")
+        self.f = f
+        self.size = size
+        self.row_bytes = size[0] * len(mode)
+        self._compressor = zlib.compressobj(compress_level)
+        f.write(b"\x89PNG\r\n\x1a\n")
+        color_type = 0 if mode == "L" else 2
+        self._chunk(b"IHDR", struct.pack(">IIBBBBB", size[0], size[1], 8, color_type, 0, 0, 0))
+
+    def _chunk(self, kind: bytes, data: bytes):
+        self.f.write(struct.pack(">I", len(data)) + kind + data)
+        self.f.write(struct.pack(">I", zlib.crc32(data, zlib.crc32(kind))))
+
+    def write(self, band: Image.Image):
+        # 左移一个像素（最左列补 0），按通道相减即为 Sub 过滤
+        shifted = band.crop((-1, 0, band.width - 1, band.height))
+        data = ImageChops.subtract_modulo(band, shifted).tobytes()
+        rows = b"".join(
+            b"\x01" + data[i:i + self.row_bytes] for i in range(0, len(data), self.row_bytes)
+        )
+        compressed = self._compressor.compress(rows)
+        if compressed:
+            self._chunk(b"IDAT", compressed)
+
+    def close(self):
+        self._chunk(b"IDAT", self._compressor.flush())
+        self._chunk(b"IEND", b"")
+
+
+class AssembledWriter:
+    """
+    逐带拼回整幅图片再一次性编码，用于无法逐带编码的格式（JPEG）。
+    此时峰值内存为一幅输出图片（RGB/L），仍省去了 RGBA 转换与编码缓冲的副本；创建时打印警告。
+    JPEG 的边长上限为 65535 像素，超过时在读取任何行带之前直接拒绝。
+    """
+    JPEG_MAX_SIDE = 65535
+
+    def __init__(self, f: BinaryIO, size: Tuple[int, int], mode: str, output_format: str, **save_params):
+        if output_format == "JPEG" and max(size) > self.JPEG_MAX_SIDE:
+            raise ValueError(
+                f"JPEG 的边长不能超过 {self.JPEG_MAX_SIDE} 像素（输出为 {size[0]}x{size[1]}），请导出为 TIFF 或 PNG"
+            )
+        print(f"[WARN] {output_format} 无法逐带编码，需拼出整幅输出图片 {size[0]}x{size[1]}，内存与图片大小相关")
+        self.f = f
+        self.output_format = output_format
+        self.save_params = save_params
+        self._image = Image.new(mode, size)
+        self._top = 0
+
+    def write(self, band: Image.Image):
+        self._image.paste(band, (0, self._top))
+        self._top += band.height
+
+    def close(self):
+        self._image.save(self.f, self.output_format, **self.save_params)
+        self._image.close()
+
+
+def output_mode(mode: str, layers: Sequence[Layer]) -> str:
+    """与常规路径一致：L 底图且水印都是灰度时保持 L，其余输出 RGB"""
+    if mode == "L" and all(layer.gray for layer in layers):
+        return "L"
+    return "RGB"
+
+
+def open_writer(
+    f: BinaryIO,
+    size: Tuple[int, int],
+    mode: str,
+    output_format: str,
+    jpeg_quality: int = 90,
+    save_params: Optional[dict] = None,
+    compress_level: int = 6,
+):
+    """
+    :param save_params: 编码方案给出的 Image.save 参数：需要拼出整幅图片的格式（JPEG）直接使用，
+                        TIFF 只取其中的 compression 与 tiffinfo 中的 Predictor；为空时只设置质量
+    :param compress_level: 逐带写出的 PNG/分块 TIFF 的 zlib 压缩级别
+    """
+    if output_format == "TIFF":
+        params = save_params or {}
+        compression = params.get("compression", "tiff_deflate")
+        predictor = params.get("tiffinfo", {}).get(317, 1)
+        return TiffTileWriter(
+            f, size, mode, compress_level=compress_level, compression=compression, predictor=predictor
+        )
+    if output_format == "PNG":
+        return PngStripWriter(f, size, mode, compress_level=compress_level)
+    return AssembledWriter(f, size, mode, output_format, **(save_params or {"quality": jpeg_quality}))
+
+
+def export_tiled(
+    source: Path,
+    f: BinaryIO,
+    layers_for_size: LayersForSize,
+    output_format: str = "PNG",
+    jpeg_quality: int = 90,
+    band_height: Optional[int] = None,
+    save_params: Optional[dict] = None,
+    compress_level: int = 6,
+    scale: float = 1.0,
+):
+    """
+    按行带导出：读一带 -> （缩放）-> 只合成与该带相交的水印图层 -> 编码写出，再处理下一带。
+    水印坐标在整幅（缩放后）图片的坐标系中计算，结果与整幅处理一致。
+    """
+    with open_large(source) as img:
+        size = scaled_size(img.size, scale)
+    reader = BandReader(source, draft_size=size if scale != 1.0 else None)
+    layers = list(layers_for_size(size))
+    mode = output_mode(reader.mode, layers)
+    writer = open_writer(f, size, mode, output_format, jpeg_quality, save_params, compress_level)
+    instrumentation.count("bytes_read", os.path.getsize(source))
+    instrumentation.count("images")
+
+    band_height = band_height or BAND_HEIGHT
+    bands = reader.bands(band_height) if reader.size == size else reader.scaled_bands(size, band_height)
+    for top, band in bands:
+        bottom = top + band.height
+        hits = [layer for layer in layers if layer.rows()[0] < bottom and layer.rows()[1] > top]
+        if hits and band.mode == "L" and mode == "RGB":
+            band = band.convert("RGB")
+        for layer in hits:
+            with instrumentation.stage(layer.stage):
+                layer.apply(band, (0, top))
+        if band.mode != mode:
+            with instrumentation.stage("convert"):
+                band = band.convert(mode)
+        with instrumentation.stage("encode"):
+            writer.write(band)
+    with instrumentation.stage("encode"):
+        writer.close()
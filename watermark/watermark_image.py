@@ -1,20 +1,35 @@
 # watermark/watermark_image.py
 
-from typing import Tuple, Optional
+from functools import lru_cache
+from typing import List, Tuple, Optional
 from pathlib import Path
 from PIL import Image
 
+from . import instrumentation
+from .compositing import Layer, blend_function, is_grayscale, prepare_base, resolve_backend
+from .lru import LRUCache
+
+
+@lru_cache(maxsize=256)
+def _alpha_lut(opacity: int) -> List[int]:
+    """透明度查找表：新 alpha = 原 alpha * opacity / 255"""
+    return [int(p * (opacity / 255.0)) for p in range(256)]
+
 
 class ImageWatermark:
+    SPRITE_CACHE_BYTES = 32 * 1024 * 1024
+
     def __init__(
         self,
         watermark_path: str,
         opacity: int = 128,
         scale: float = 0.15, # 默认缩放比例 (15%)
+        backend: Optional[str] = None, # 合成后端 "pillow"/"numpy"，None 时取环境变量 PHOTO_WATERMARK_BACKEND
     ):
         self.watermark_path = Path(watermark_path)
         self.opacity = opacity
         self.scale = scale
+        self.backend = resolve_backend(backend)
 
         if not self.watermark_path.exists():
             raise FileNotFoundError(f"水印文件不存在: {watermark_path}")
@@ -24,52 +39,90 @@ class ImageWatermark:
         self.original_width, self.original_height = self.original_watermark.size
         # --- 修改结束 ---
 
+        # 缩放+调透明度后的水印精灵缓存，key 为 (scale, opacity)
+        self._sprite_cache = LRUCache(
+            maxsize=16,
+            max_bytes=self.SPRITE_CACHE_BYTES,
+            sizeof=lambda sprite: sprite.width * sprite.height * 4,
+        )
+        # (精灵, 是否灰度)，精灵不变时不必重复判断
+        self._gray_of: Optional[Tuple[Image.Image, bool]] = None
+
     def apply(
         self,
         img: Image.Image,
         position: Tuple[int, int] = (0, 0),
+        in_place: bool = False,
     ) -> Image.Image:
         """
         在图片上添加图片水印，并实现中心点固定缩放。
+        :param in_place: 为 True 时允许直接修改 img（RGB/RGBA，灰度水印时也包括 L），
+                         避免整幅转换和复制；返回值仍是合成结果
         """
-        if img.mode != "RGBA":
-            base = img.convert("RGBA")
-        else:
-            base = img.copy()
-
         # --- 核心重构 2: 实现中心点缩放逻辑 ---
 
+        # 1~3. 取出（或生成）按当前缩放与透明度处理好的水印精灵，并按中心点定位
+        layer = self.layer(position)
+
+        allow_gray = img.mode == "L" and in_place and layer.gray
+        base = prepare_base(img, in_place, allow_gray=allow_gray)
+
+        # 5. 使用补偿后的坐标进行粘贴
+        # 使用 resized_wm 作为 mask，可以正确处理水印本身的透明区域，且只改动覆盖区域
+        with instrumentation.stage(layer.stage):
+            layer.apply(base)
+
+        # --- 重构结束 ---
+
+        return base
+
+    def layer(self, position: Tuple[float, float]) -> Layer:
+        """返回中心点对齐到 position 的水印图层"""
+        resized_wm = self.render_sprite()
+        new_width, new_height = resized_wm.size
+
+        # 4. 计算中心点偏移补偿
+        # 注意：这里我们不需要计算偏移，因为我们将直接把缩放后图片的中心对齐到指定位置
+        # paste 方法的 box 参数的左上角坐标，需要从中心点反推
+        paste_x = int(position[0] - new_width / 2)
+        paste_y = int(position[1] - new_height / 2)
+        return Layer(
+            resized_wm, (paste_x, paste_y), blend_function("mask", self.backend), self._is_gray(resized_wm), "logo_composite"
+        )
+
+    def _is_gray(self, sprite: Image.Image) -> bool:
+        # 同一个精灵只判断一次
+        if self._gray_of is None or self._gray_of[0] is not sprite:
+            self._gray_of = (sprite, is_grayscale(sprite))
+        return self._gray_of[1]
+
+    def render_sprite(self) -> Image.Image:
+        """
+        返回按当前 scale/opacity 缩放并调整透明度后的水印精灵。
+        结果按 (scale, opacity) 缓存，参数不变时重复调用只剩一次字典查找。
+        """
+        scale, opacity = self.scale, self.opacity
+        return self._sprite_cache.get_or_create((scale, opacity), lambda: self._render_sprite(scale, opacity))
+
+    def _render_sprite(self, scale: float, opacity: int) -> Image.Image:
+        with instrumentation.stage("logo_render"):
+            return self._resize_with_opacity(scale, opacity)
+
+    def _resize_with_opacity(self, scale: float, opacity: int) -> Image.Image:
         # 1. 计算缩放后的新尺寸
-        new_width = int(self.original_width * self.scale)
-        new_height = int(self.original_height * self.scale)
-        
+        new_width = int(self.original_width * scale)
+        new_height = int(self.original_height * scale)
+
         # 保证最小尺寸为1x1像素
         new_width = max(1, new_width)
         new_height = max(1, new_height)
-        
+
         # 2. 对原始水印进行高质量缩放
         # 注意：每次都从 self.original_watermark 开始缩放，避免连续缩放导致的质量下降
         resized_wm = self.original_watermark.resize((new_width, new_height), Image.Resampling.LANCZOS)
 
-        # 3. 调整透明度
-        if self.opacity < 255:
+        # 3. 调整透明度（查表，确保透明度不会超过原始值）
+        if opacity < 255:
             alpha = resized_wm.split()[3]
-            # 创建一个修改函数，确保透明度不会超过原始值
-            def modulate_alpha(p):
-                return int(p * (self.opacity / 255.0))
-            alpha = alpha.point(modulate_alpha)
-            resized_wm.putalpha(alpha)
-
-        # 4. 计算中心点偏移补偿
-        # 注意：这里我们不需要计算偏移，因为我们将直接把缩放后图片的中心对齐到指定位置
-        # paste 方法的 box 参数的左上角坐标，需要从中心点反推
-        paste_x = int(position[0] - new_width / 2)
-        paste_y = int(position[1] - new_height / 2)
-        
-        # 5. 使用补偿后的坐标进行粘贴
-        # 使用 resized_wm 作为 mask，可以正确处理水印本身的透明区域
-        base.paste(resized_wm, (paste_x, paste_y), resized_wm)
-        
-        # --- 重构结束 ---
-
-        return base
\ No newline at end of file
+            resized_wm.putalpha(alpha.point(_alpha_lut(opacity)))
+        return resized_wm
\ No newline at end of file
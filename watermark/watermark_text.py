@@ -1,8 +1,21 @@
 # watermark/watermark_text.py
 
+from pathlib import Path
 from typing import Tuple, Optional
 from PIL import Image, ImageDraw, ImageFont
-from pathlib import Path
+
+from . import instrumentation
+from .compositing import Layer, blend_function, prepare_base, resolve_backend
+from .font_registry import get_font_registry
+from .lru import LRUCache
+
+
+# 文字精灵全局缓存：key -> (精灵, 相对水印位置的偏移)
+_sprite_cache = LRUCache(
+    maxsize=64,
+    max_bytes=64 * 1024 * 1024,
+    sizeof=lambda entry: entry[0].width * entry[0].height * 4 if entry[0] else 0,
+)
 
 
 class TextWatermark:
@@ -15,69 +28,113 @@ class TextWatermark:
         opacity: int = 128,
         bold: bool = False,
         italic: bool = False,
+        backend: Optional[str] = None, # 合成后端 "pillow"/"numpy"，None 时取环境变量 PHOTO_WATERMARK_BACKEND
+        font_path: Optional[str] = None, # 已解析的字体文件路径（见 WatermarkPlan），给出时不再按名称查找
     ):
         self.text = text
         self.font_name = font_name or "SimHei"
+        self.font_path = font_path
         self.relative_font_size = relative_font_size
         self.color = color
         self.opacity = opacity
         self.bold = bold
         self.italic = italic
-
-    def apply(self, img: Image.Image, position: Tuple[int, int] = (0, 0)) -> Image.Image:
+        self.backend = resolve_backend(backend)
+
+    def apply(self, img: Image.Image, position: Tuple[int, int] = (0, 0), in_place: bool = False) -> Image.Image:
+        """
+        在图片上添加文本水印。
+        :param in_place: 为 True 时允许直接修改 img（RGB/RGBA，灰色文字时也包括 L），
+                         避免整幅转换和复制；返回值仍是合成结果
+        """
         if not self.text:
             return img
 
-        if img.mode != "RGBA":
-            base = img.convert("RGBA")
-        else:
-            base = img.copy()
+        base = prepare_base(img, in_place, allow_gray=self.is_gray)
+
+        layer = self.layer(img.size, position)
+        if layer is None:
+            return base
 
-        # 动态计算像素字号
-        reference_dimension = min(img.width, img.height)
-        pixel_font_size = max(1, int(reference_dimension * (self.relative_font_size / 100.0)))
+        # 只在精灵覆盖的区域内合成，不再创建与底图等大的文字图层
+        with instrumentation.stage(layer.stage):
+            layer.apply(base)
+        return base
 
+    @property
+    def is_gray(self) -> bool:
+        return self.color[0] == self.color[1] == self.color[2]
+
+    def layer(self, base_size: Tuple[int, int], position: Tuple[float, float]) -> Optional[Layer]:
+        """返回按底图尺寸渲染、定位到 position 的文字图层；没有可绘制的文字时返回 None"""
+        if not self.text:
+            return None
+        sprite, (dx, dy) = self.render_sprite(base_size)
+        if sprite is None:
+            return None
+        dest = (int(position[0]) + dx, int(position[1]) + dy)
+        return Layer(sprite, dest, blend_function("over", self.backend), self.is_gray, "text_composite")
+
+    def pixel_font_size(self, base_size: Tuple[int, int]) -> int:
+        """按底图尺寸计算像素字号"""
+        reference_dimension = min(base_size)
+        return max(1, int(reference_dimension * (self.relative_font_size / 100.0)))
+
+    def render_sprite(self, base_size: Tuple[int, int]) -> Tuple[Optional[Image.Image], Tuple[int, int]]:
+        """
+        返回紧贴文字的 RGBA 精灵，以及精灵左上角相对水印位置的偏移。
+        精灵按 (文字, 字体, 像素字号, 颜色, 透明度, 粗体, 斜体) 全局缓存，
+        同尺寸图片组成的批次中文字只渲染一次。
+        """
+        pixel_font_size = self.pixel_font_size(base_size)
+        key = (self.text, self.font_path or self.font_name, pixel_font_size, tuple(self.color), self.opacity, self.bold, self.italic)
+        return _sprite_cache.get_or_create(key, lambda: self._render_sprite(pixel_font_size))
+
+    def _render_sprite(self, pixel_font_size: int) -> Tuple[Optional[Image.Image], Tuple[int, int]]:
         font = self._load_font(pixel_font_size)
+        with instrumentation.stage("text_rasterize"):
+            return self._rasterize(font)
+
+    def _rasterize(self, font: ImageFont.FreeTypeFont) -> Tuple[Optional[Image.Image], Tuple[int, int]]:
         fill_color = (*self.color, self.opacity)
-        
-        # 创建最终用于合成的、与底图一样大的透明图层
-        txt_layer = Image.new("RGBA", base.size, (255, 255, 255, 0))
+
+        # 使用临时绘图对象精确测量文字边界
+        temp_draw = ImageDraw.Draw(Image.new("RGBA", (0, 0)))
+        bbox = temp_draw.textbbox((0, 0), self.text, font=font)
+        text_width = bbox[2] - bbox[0]
+        text_height = bbox[3] - bbox[1]
+        if text_width <= 0 or text_height <= 0:
+            return None, (0, 0)
 
         if self.italic:
             # --- 斜体处理逻辑 ---
-            # 1. 使用临时绘图对象精确测量文字边界
-            temp_draw = ImageDraw.Draw(Image.new("RGBA", (0, 0)))
-            bbox = temp_draw.textbbox((0, 0), self.text, font=font)
-            text_width = bbox[2] - bbox[0]
-            text_height = bbox[3] - bbox[1]
-
-            # 2. 为斜体变形计算所需的额外空间
+            # 1. 为斜体变形计算所需的额外空间
             shear_factor = 0.2
             x_shift = abs(shear_factor) * text_height
-            
-            # 3. 创建一个刚好包裹文字的小图层（带额外空间）
+
+            # 2. 创建一个刚好包裹文字的小图层（带额外空间）
             small_surface_size = (int(text_width + x_shift), text_height)
             text_surface = Image.new("RGBA", small_surface_size, (255, 255, 255, 0))
             text_draw = ImageDraw.Draw(text_surface)
 
-            # 4. 在小图层上绘制文字（支持粗体）
+            # 3. 在小图层上绘制文字（支持粗体）
             draw_pos = (-bbox[0], -bbox[1])
             self._draw_text_with_bold(text_draw, draw_pos, font, fill_color)
 
-            # 5. 只对这个小图层进行斜体变换
+            # 4. 只对这个小图层进行斜体变换
             italic_surface = self._apply_italic(text_surface)
 
-            # 6. 将变形好的小图层粘贴到最终的大图层上
-            txt_layer.paste(italic_surface, (int(position[0]), int(position[1])), italic_surface)
-
-        else:
-            # --- 非斜体处理逻辑 ---
-            # 直接在最终的大图层上绘制（支持粗体）
-            final_draw = ImageDraw.Draw(txt_layer)
-            self._draw_text_with_bold(final_draw, (int(position[0]), int(position[1])), font, fill_color)
+            # 5. 以自身为蒙版贴到透明图层上，与直接贴到整幅透明图层的效果一致
+            sprite = Image.new("RGBA", italic_surface.size, (255, 255, 255, 0))
+            sprite.paste(italic_surface, (0, 0), italic_surface)
+            return sprite, (0, 0)
 
-        # 最终合成
-        return Image.alpha_composite(base, txt_layer)
+        # --- 非斜体处理逻辑 ---
+        # 粗体会向右下各多绘制 1 像素
+        extra = 1 if self.bold else 0
+        sprite = Image.new("RGBA", (text_width + extra, text_height + extra), (255, 255, 255, 0))
+        self._draw_text_with_bold(ImageDraw.Draw(sprite), (-bbox[0], -bbox[1]), font, fill_color)
+        return sprite, (bbox[0], bbox[1])
 
     def _draw_text_with_bold(self, draw: ImageDraw.Draw, pos: Tuple[int, int], font, fill):
         """一个辅助方法，用于绘制带粗体效果的文本"""
@@ -90,45 +147,10 @@ class TextWatermark:
         draw.text(pos, self.text, font=font, fill=fill)
 
     def _load_font(self, font_size: int) -> ImageFont.FreeTypeFont:
-        """根据名称和字号加载字体"""
-        font_path = None
-        # (这部分可以缓存以提高性能，但为保持简单暂不实现)
-        search_dirs = [Path("C:/Windows/Fonts"), Path("/usr/share/fonts"), Path("/System/Library/Fonts")]
-        for folder in search_dirs:
-            if folder.exists():
-                for f in folder.glob(f"*{self.font_name}*.*"):
-                    if f.suffix.lower() in ['.ttf', '.otf', '.ttc']:
-                        font_path = f
-                        break
-            if font_path:
-                break
-        
-        if not font_path:
-            fallback_fonts = ["msyh.ttc", "simhei.ttf", "simsun.ttc", "Arial.ttf"]
-            for fb in fallback_fonts:
-                for folder in search_dirs:
-                    if (fb_path := folder / fb).exists():
-                        font_path = fb_path
-                        break
-                if font_path:
-                    break
-
-        if not font_path:
-            print("[警告] 未找到可用字体，使用Pillow默认字体")
-            try:
-                # Pillow 9.2.0 之后 load_default 需要字号参数
-                return ImageFont.load_default(font_size)
-            except TypeError:
-                return ImageFont.load_default()
-
-        try:
-            return ImageFont.truetype(str(font_path), font_size)
-        except Exception as e:
-            print(f"[警告] 字体加载失败 '{font_path}': {e}")
-            try:
-                return ImageFont.load_default(font_size)
-            except TypeError:
-                return ImageFont.load_default()
+        """根据名称和字号加载字体（字体索引与已加载字体均由注册表缓存）"""
+        if self.font_path:
+            return get_font_registry().get_font_file(Path(self.font_path), font_size)
+        return get_font_registry().get_font(self.font_name, font_size)
 
     def _apply_italic(self, surface: Image.Image) -> Image.Image:
         """对传入的图层进行错切变换以模拟斜体"""